@@ -55,5 +55,12 @@ class Contact(models.Model):
         related_name='payment_extension_days', null=True, blank=True)  # option field
     payment_account = models.CharField(max_length=256, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', '-id']),
+            models.Index(fields=['company', 'nif']),
+            models.Index(fields=['company', 'contact_type']),
+        ]
+
     def __str__(self) -> str:
         return self.name + "--" + str(self.contact_id)
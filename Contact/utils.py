@@ -1,42 +1,39 @@
+from django.db.models import Max
+from Core.helper import allocate_sequence
 from .models import Contact
 
+# first contact id of every contact type, ids of a type are numbered for each company
+CONTACT_ID_STARTS = {
+    "client": 430000000001,
+    "debitor": 440000000001,
+    "provider": 400000000001,
+    "creditor": 410000000001,
+}
 
-def get_contact_id(contact_type):
+
+'''
+Returning count new contact ids of the contact type for the company, reserved from the
+sequence counter of that type in a single statement so a bulk import of many contacts
+costs one query. When the counter is created it continues after the biggest id the company
+already has in the range of the type.
+'''
+
+
+def get_contact_ids(company, contact_type, count):
     contact_type_name = contact_type.lookup_name.lower()
-    if contact_type_name == "client":
-        start = 430000000001
-        # end = 439999999999
-        if not Contact.objects.filter(contact_type=contact_type).exists():
-            return start
-        contact_id = Contact.objects.filter(
-            contact_type=contact_type).latest('id').contact_id
-        return str(int(contact_id) + 1)
-
-    elif contact_type_name == "debitor":
-        start = 440000000001
-        # end = 449999999999
-        if not Contact.objects.filter(contact_type=contact_type).exists():
-            return start
-        contact_id = Contact.objects.filter(
-            contact_type=contact_type).latest('id').contact_id
-        return str(int(contact_id) + 1)
-
-    elif contact_type_name == "provider":
-        start = 400000000001
-        # end = 409999999999
-        if not Contact.objects.filter(contact_type=contact_type).exists():
-            return start
-        contact_id = Contact.objects.filter(
-            contact_type=contact_type).latest('id').contact_id
-        return str(int(contact_id) + 1)
-
-    elif contact_type_name == "creditor":
-        start = 410000000001
-        # end = 419999999999
-        if not Contact.objects.filter(contact_type=contact_type).exists():
-            return start
-        contact_id = Contact.objects.filter(
-            contact_type=contact_type).latest('id').contact_id
-        return str(int(contact_id) + 1)
-    else:
-        return 000000000000
+    start = CONTACT_ID_STARTS.get(contact_type_name)
+    if start is None:
+        return [000000000000] * count
+
+    def last_contact_id():
+        last = Contact.objects.filter(
+            company=company,
+            contact_id__startswith=str(start)[:2],
+        ).aggregate(last=Max('contact_id'))['last']
+        return int(last) if last else start - 1
+    first = allocate_sequence(company, 'contact_' + contact_type_name, count=count, initial=last_contact_id)
+    return [str(first + index) for index in range(count)]
+
+
+def get_contact_id(company, contact_type):
+    return get_contact_ids(company, contact_type, 1)[0]
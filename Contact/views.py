@@ -5,7 +5,7 @@ from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from Middleware.CustomMixin import CompanyPermissionsMixin
 from Middleware.permissions import IsCompanyAccess
-from utils.pagination import LimitOffsetPagination
+from utils.pagination import CursorPagination
 from .utils import get_contact_id
 from .models import Contact
 from .filters import ContactFilter
@@ -33,7 +33,7 @@ class ContactCreateAPIView(CompanyPermissionsMixin, generics.CreateAPIView):
         data = serializer.validated_data
         if Contact.objects.filter(nif=data['nif'], company=company).exists():
             return Response({"nif": "NIF already exists."}, status=status.HTTP_400_BAD_REQUEST)
-        data['contact_id'] = get_contact_id(data['contact_type'])
+        data['contact_id'] = get_contact_id(company, data['contact_type'])
         contact = Contact(company=company, **data)
         contact.save()
         return Response({
@@ -70,7 +70,7 @@ class ContactUpdateAPIView(generics.UpdateAPIView):
                 return Response({"nif": "NIF already exists."}, status=status.HTTP_400_BAD_REQUEST)
 
         if not oldContact.contact_type.id == data['contact_type'].id:
-            data['contact_id'] = get_contact_id(data['contact_type'])
+            data['contact_id'] = get_contact_id(company, data['contact_type'])
         else:
             data['contact_id'] = oldContact.contact_id
         contact = Contact(pk=contact_id, company=company, **data)
@@ -84,7 +84,8 @@ class ContactUpdateAPIView(generics.UpdateAPIView):
 class ContactListAPIView(CompanyPermissionsMixin, generics.ListAPIView):
     permission_classes = (permissions.IsAuthenticated, IsCompanyAccess)
     serializer_class = ContactListSerializer
-    pagination_class = LimitOffsetPagination
+    pagination_class = CursorPagination
+    max_page_size = 100
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = ContactFilter
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserProfile, Company, CompanyAccessRecord
+from .models import UserProfile, Company, CompanyAccessRecord, SequenceCounter
 # Register your models here.
 
 
@@ -7,6 +7,11 @@ class CompanyAccessRecordAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'company')
 
 
+class SequenceCounterAdmin(admin.ModelAdmin):
+    list_display = ('id', 'company', 'key', 'last_value')
+
+
 admin.site.register(UserProfile)
 admin.site.register(Company)
 admin.site.register(CompanyAccessRecord, CompanyAccessRecordAdmin)
+admin.site.register(SequenceCounter, SequenceCounterAdmin)
@@ -1,7 +1,11 @@
 import string
 import random
+import threading
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import UserProfile
+from django.db import connection, transaction, IntegrityError
+from rest_framework_jwt.utils import jwt_payload_handler as default_jwt_payload_handler
+from .models import UserProfile, Company, CompanyAccessRecord, SequenceCounter
 
 
 def generate_token():
@@ -36,3 +40,81 @@ def generate_username():
                 string.ascii_lowercase
                 )for _ in range(20))
     return username
+
+
+'''
+Payload handler for login and refresh tokens. When COMPANY_SCOPED_TOKENS is on, the
+token also carries the ids of companies user may access and their company access version,
+so CompanyAccessMiddleWare can authorize the company header without any query.
+'''
+
+
+def jwt_payload_handler(user):
+    payload = default_jwt_payload_handler(user)
+    if settings.COMPANY_SCOPED_TOKENS:
+        companies = list(CompanyAccessRecord.objects.filter(user=user).values_list('company_id', flat=True))
+        if user.is_staff:
+            companies += list(Company.objects.filter(user=user).values_list('id', flat=True))
+        payload['companies'] = sorted(set(companies))
+        payload['company_access_version'] = user.user_profile.company_access_version
+    return payload
+
+
+# (company id, key) -> [next, last] numbers reserved by this worker when blocks are on
+reserved_sequences = {}
+reserved_sequences_lock = threading.Lock()
+
+
+'''
+Handing out count contiguous numbers of the sequence key of the company and returning the
+first one. The counter row is increased and read back in one UPDATE ... RETURNING, which
+also locks it until the surrounding transaction ends, so concurrent callers wait instead
+of colliding and numbers of a rolled back transaction are given again. The row is created
+on first use, starting after initial, which may be a callable returning the last number
+already used by existing rows.
+'''
+
+
+def reserve_sequence(company, key, count=1, initial=0):
+    company_id = company.id if isinstance(company, Company) else company
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'UPDATE {} SET last_value = last_value + %s WHERE company_id = %s AND key = %s '
+            'RETURNING last_value'.format(connection.ops.quote_name(SequenceCounter._meta.db_table)),
+            [count, company_id, key])
+        row = cursor.fetchone()
+    if row is not None:
+        return row[0] - count + 1
+
+    last_value = initial() if callable(initial) else initial
+    try:
+        with transaction.atomic():
+            SequenceCounter.objects.create(company_id=company_id, key=key, last_value=last_value + count)
+    except IntegrityError:
+        # created meanwhile by another request
+        return reserve_sequence(company_id, key, count, initial)
+    return last_value + 1
+
+
+'''
+Same as reserve_sequence but a worker may reserve block_size numbers at once (default
+SEQUENCE_BLOCK_SIZE setting) and hand them out from memory. Blocks are only used out of
+a transaction, since a rolled back reservation would give its numbers a second time, so
+inside a transaction numbers are always contiguous.
+'''
+
+
+def allocate_sequence(company, key, count=1, initial=0, block_size=None):
+    block_size = block_size or settings.SEQUENCE_BLOCK_SIZE
+    if block_size <= count or connection.in_atomic_block:
+        return reserve_sequence(company, key, count, initial)
+
+    company_id = company.id if isinstance(company, Company) else company
+    with reserved_sequences_lock:
+        block = reserved_sequences.get((company_id, key))
+        if block is None or block[0] + count - 1 > block[1]:
+            first = reserve_sequence(company_id, key, block_size, initial)
+            block = reserved_sequences[(company_id, key)] = [first, first + block_size - 1]
+        value = block[0]
+        block[0] += count
+    return value
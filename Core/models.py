@@ -1,6 +1,7 @@
 from django.db import models
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.models.signals import post_init, post_save, post_delete, pre_save, pre_delete
 from django.contrib.auth.models import User
 
 
@@ -13,6 +14,8 @@ class UserProfile(models.Model):
     is_activation_key_used = models.BooleanField(default=True)
     activation_key = models.CharField(max_length=255, blank=True, null=True)
     admin = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    # increased whenever company access of user is reduced so company scoped tokens get stale
+    company_access_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return str(self.id) + "-" + str(self.user.email)
@@ -34,6 +37,21 @@ class CompanyAccessRecord(models.Model):
         return str(self.id) + "-" + self.company.name + "-" + str(self.company.id)
 
 
+# Last number handed out for one kind of document of a company, see Core.helper.allocate_sequence
+class SequenceCounter(models.Model):
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='company_sequence')
+    key = models.CharField(max_length=64)
+    last_value = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'key'], name='unique_company_sequence_key'),
+        ]
+
+    def __str__(self):
+        return str(self.company_id) + "-" + self.key + "-" + str(self.last_value)
+
+
 '''
 This function recieving a signal from database whenever a User instance is created and on
 every instance it also make profile object against that instance
@@ -44,3 +62,61 @@ every instance it also make profile object against that instance
 def createUserProfile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
+
+
+'''
+Company scoped tokens are trusted while the company access version of the user does
+not change, so it is bumped by the receivers below whenever the companies a user may
+access can have changed, whatever path changed them (views, admin or shell).
+'''
+
+
+def bump_company_access_version(user_ids):
+    UserProfile.objects.filter(user_id__in=user_ids).update(
+        company_access_version=F('company_access_version') + 1)
+
+
+# every user who could access the company being deleted
+@receiver(pre_delete, sender=Company)
+def bumpCompanyAccessVersion(sender, instance, **kwargs):
+    user_ids = list(CompanyAccessRecord.objects.filter(
+        company=instance).values_list('user_id', flat=True)) + [instance.user_id]
+    bump_company_access_version(user_ids)
+
+
+# previous owner when the company is given to another user
+@receiver(pre_save, sender=Company)
+def bumpCompanyOwnerAccessVersion(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    previous_owner = Company.objects.filter(pk=instance.pk).values_list('user_id', flat=True).first()
+    if previous_owner is not None and previous_owner != instance.user_id:
+        bump_company_access_version([previous_owner])
+
+
+@receiver(post_save, sender=CompanyAccessRecord)
+@receiver(post_delete, sender=CompanyAccessRecord)
+def bumpAccessRecordAccessVersion(sender, instance, **kwargs):
+    bump_company_access_version([instance.user_id])
+
+
+# is_staff as loaded or last saved, unknown when it was deferred
+@receiver(post_init, sender=User)
+@receiver(post_save, sender=User)
+def rememberStaff(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'is_staff' not in update_fields:
+        return
+    if 'is_staff' not in instance.get_deferred_fields():
+        instance._saved_is_staff = instance.is_staff
+
+
+# only staff users own companies, so losing is_staff loses them
+@receiver(pre_save, sender=User)
+def bumpStaffAccessVersion(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or instance.is_staff or (update_fields is not None and 'is_staff' not in update_fields):
+        return
+    was_staff = getattr(instance, '_saved_is_staff', None)
+    if was_staff is None:
+        was_staff = User.objects.filter(pk=instance.pk, is_staff=True).exists()
+    if was_staff:
+        bump_company_access_version([instance.pk])
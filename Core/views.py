@@ -477,6 +477,7 @@ class CompanyAccessView(generics.CreateAPIView):
         user = User.objects.filter(pk=data['user_id']).first()
         if not (user.user_profile.admin == adminUser):
             return Response({"message": "you dont have permission for this user"}, status=status.HTTP_401_UNAUTHORIZED)
+        # deleting records also makes company scoped tokens of user stale, see Core.models
         CompanyAccessRecord.objects.filter(user=user).delete()
 
         for company_id in data['company_list']:  # looping on list of companies
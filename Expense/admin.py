@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Expense, ExpenseItem, Purchase, PurchaseItem, Asset, AssetItem
+from .models import Expense, ExpenseItem, Purchase, PurchaseItem, Asset, AssetItem, LedgerEntry, DepreciationEntry
 
 
 # Register your models here.
@@ -45,3 +45,17 @@ class AssetAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Asset, AssetAdmin)
+
+
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'company', 'document_type', 'document_id', 'invoice_date', 'base_amount']
+
+
+admin.site.register(LedgerEntry, LedgerEntryAdmin)
+
+
+class DepreciationEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'company', 'asset', 'chart_of_account', 'period', 'amount', 'book_value']
+
+
+admin.site.register(DepreciationEntry, DepreciationEntryAdmin)
@@ -0,0 +1,109 @@
+import datetime
+from decimal import Decimal
+from django.db.models import Sum
+from .models import Asset, AssetItem, DepreciationEntry
+
+
+'''
+Depreciation engine generating monthly schedules of assets. Amounts are computed in
+integer cents so a schedule always adds up exactly to cost minus residual value. Cost of
+an asset is the sum of base amounts of its items.
+'''
+
+
+def to_cents(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def add_months(period, months):
+    month = period.month - 1 + months
+    return datetime.date(period.year + month // 12, month % 12 + 1, 1)
+
+
+'''
+Straight line, the depreciable amount is spread evenly over the months. Cumulated amount
+of every month is rounded half up and monthly amounts are the differences, so rounding
+cents never add up.
+'''
+
+
+def straight_line(depreciable, months):
+    cumulated = [(depreciable * month * 2 + months) // (months * 2) for month in range(months + 1)]
+    return [current - previous for previous, current in zip(cumulated, cumulated[1:])]
+
+
+'''
+Double declining balance, every month depreciates 2 / months of the book value and it
+switches to straight line over the remaining months as soon as that gives more. Book
+value never goes below residual and the last month reaches it exactly.
+'''
+
+
+def declining_balance(cost, residual, months):
+    amounts = []
+    book = cost
+    for month in range(months):
+        remaining = months - month
+        declining = (book * 2 + months // 2) // months
+        linear = (book - residual + remaining // 2) // remaining
+        amount = min(max(declining, linear), book - residual)
+        if remaining == 1:
+            amount = book - residual
+        amounts.append(amount)
+        book -= amount
+    return amounts
+
+
+def compute_schedule(method, cost, residual, months):
+    if months <= 0 or cost <= residual:
+        return []
+    if method == 'declining_balance':
+        return declining_balance(cost, residual, months)
+    return straight_line(cost - residual, months)
+
+
+'''
+Generating again the schedules of the given assets. Costs of all assets come from one
+grouped query, old entries are deleted in one query and new ones inserted with one
+bulk_create. Assets without useful life get no schedule.
+'''
+
+
+def generate_depreciation_schedules(asset_ids):
+    costs = dict(AssetItem.objects.filter(asset_id__in=asset_ids).values('asset_id').annotate(
+        cost=Sum('base_amount')).values_list('asset_id', 'cost'))
+    DepreciationEntry.objects.filter(asset_id__in=asset_ids).delete()
+    entries = []
+    for asset in Asset.objects.filter(pk__in=asset_ids, useful_life_months__isnull=False):
+        cost = to_cents(costs.get(asset.id) or 0)
+        residual = to_cents(asset.residual_value)
+        start = (asset.depreciation_start or asset.invoice_date).replace(day=1)
+        book = cost
+        for month, amount in enumerate(compute_schedule(
+                asset.depreciation_method, cost, residual, asset.useful_life_months)):
+            book -= amount
+            entries.append(DepreciationEntry(
+                company_id=asset.company_id, asset_id=asset.id, chart_of_account_id=asset.chart_of_account_id,
+                period=add_months(start, month), amount=from_cents(amount), book_value=from_cents(book)))
+    DepreciationEntry.objects.bulk_create(entries, batch_size=5000)
+    return len(entries)
+
+
+'''
+Depreciation of the company between two months (first days of month) summed by account
+of the assets, in one grouped query on the (company, period, chart_of_account) index.
+'''
+
+
+def depreciation_totals(company, start, end):
+    return list(DepreciationEntry.objects.filter(
+        company=company, period__range=(start, end),
+    ).values(
+        'chart_of_account', 'chart_of_account__account_number', 'chart_of_account__english_name',
+    ).annotate(
+        amount=Sum('amount'),
+    ).order_by('chart_of_account__account_number'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from Core.models import Company
+from Expense.models import Asset
+from Expense.depreciation import generate_depreciation_schedules
+
+
+'''
+Generating depreciation schedules of existing assets, needed once for assets created
+before schedules existed or after fixing data by hand.
+'''
+
+
+class Command(BaseCommand):
+    help = 'Rebuild depreciation schedules of assets of every company or of the given companies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', help='id of company to rebuild, repeatable')
+
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options['company']:
+            companies = companies.filter(pk__in=options['company'])
+        for company in companies.iterator():
+            with transaction.atomic():
+                asset_ids = list(Asset.objects.filter(company=company).values_list('id', flat=True))
+                entries = generate_depreciation_schedules(asset_ids)
+            self.stdout.write('Rebuilt {} depreciation entries of company {}'.format(entries, company.id))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from Core.models import Company
+from Expense.models import Expense, Purchase, Asset, LedgerEntry
+from Expense.utils import refresh_ledger
+
+
+'''
+Building the ledger table from existing expenses, purchases and assets, needed once for
+documents created before the table existed or after fixing data by hand.
+'''
+
+
+class Command(BaseCommand):
+    help = 'Rebuild expense ledger of every company or of the given companies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', help='id of company to rebuild, repeatable')
+
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options['company']:
+            companies = companies.filter(pk__in=options['company'])
+        for company in companies.iterator():
+            with transaction.atomic():
+                LedgerEntry.objects.filter(company=company).delete()
+                for document_model in (Expense, Purchase, Asset):
+                    document_ids = document_model.objects.filter(company=company).values_list('id', flat=True)
+                    refresh_ledger(document_model, list(document_ids))
+            self.stdout.write('Rebuilt expense ledger of company {}'.format(company.id))
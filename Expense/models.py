@@ -1,4 +1,6 @@
 from django.db import models
+from django.dispatch import receiver
+from django.db.models.signals import post_delete
 from Contact.models import Contact
 from Core.models import Company
 from Lookup.models import Tax, AccountType
@@ -15,6 +17,15 @@ class Expense(models.Model):
     description = models.TextField()
     chart_of_account = models.ForeignKey(AccountType, on_delete=models.CASCADE, related_name='ExpenseAccounts')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', '-id']),
+            models.Index(fields=['company', 'due_date']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'accounting_seat'], name='unique_company_expense_seat'),
+        ]
+
 
 class ExpenseItem(models.Model):
     expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name="expense_items")
@@ -35,6 +46,15 @@ class Purchase(models.Model):
     description = models.TextField()
     chart_of_account = models.ForeignKey(AccountType, on_delete=models.CASCADE, related_name='PurchaseAccounts')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', '-id']),
+            models.Index(fields=['company', 'due_date']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'accounting_seat'], name='unique_company_purchase_seat'),
+        ]
+
 
 class PurchaseItem(models.Model):
     purchase = models.ForeignKey(Purchase, on_delete=models.CASCADE, related_name="purchase_items")
@@ -45,6 +65,12 @@ class PurchaseItem(models.Model):
     calculated_ret = models.DecimalField(max_digits=8, decimal_places=2,)
 
 
+DEPRECIATION_METHODS = (
+    ('straight_line', 'Straight Line'),
+    ('declining_balance', 'Declining Balance'),
+)
+
+
 class Asset(models.Model):
     creation_date = models.DateField(auto_now_add=True)
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="companyAssets")
@@ -54,6 +80,21 @@ class Asset(models.Model):
     due_date = models.DateField()
     description = models.TextField()
     chart_of_account = models.ForeignKey(AccountType, on_delete=models.CASCADE, related_name='assetAccounts')
+    # depreciation, schedule is generated only when useful_life_months is given
+    depreciation_method = models.CharField(max_length=20, choices=DEPRECIATION_METHODS, default='straight_line')
+    useful_life_months = models.PositiveIntegerField(null=True, blank=True)
+    residual_value = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # first month depreciated, invoice date when not given
+    depreciation_start = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', '-id']),
+            models.Index(fields=['company', 'due_date']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'accounting_seat'], name='unique_company_asset_seat'),
+        ]
 
 
 class AssetItem(models.Model):
@@ -63,3 +104,64 @@ class AssetItem(models.Model):
     calculated_vat = models.DecimalField(max_digits=8, decimal_places=2, )
     ret = models.ForeignKey(Tax, on_delete=models.SET_NULL, null=True, related_name="AssetRet")
     calculated_ret = models.DecimalField(max_digits=8, decimal_places=2,)
+
+
+# Depreciation of one month of an asset, generated by Expense.depreciation
+class DepreciationEntry(models.Model):
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="companyDepreciations")
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name="depreciation_entries")
+    chart_of_account = models.ForeignKey(AccountType, on_delete=models.CASCADE, related_name='depreciationAccounts')
+    # first day of the month
+    period = models.DateField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2,)
+    # book value of the asset at the end of the month
+    book_value = models.DecimalField(max_digits=12, decimal_places=2,)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'period', 'chart_of_account']),
+        ]
+
+
+# One row per item of expenses, purchases and assets with the values of its document and
+# the rates of its taxes, so reports read a single table. Kept by Expense.utils.refresh_ledger.
+class LedgerEntry(models.Model):
+    DOCUMENT_TYPES = (
+        ('expense', 'Expense'),
+        ('purchase', 'Purchase'),
+        ('asset', 'Asset'),
+    )
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="companyLedgerEntries")
+    document_type = models.CharField(max_length=16, choices=DOCUMENT_TYPES)
+    document_id = models.BigIntegerField()
+    item_id = models.BigIntegerField()
+    accounting_seat = models.CharField(max_length=12)
+    invoice_date = models.DateField()
+    due_date = models.DateField()
+    contact = models.ForeignKey(Contact, on_delete=models.CASCADE, related_name='ledgerEntries')
+    chart_of_account = models.ForeignKey(AccountType, on_delete=models.CASCADE, related_name='ledgerAccounts')
+    base_amount = models.DecimalField(max_digits=10, decimal_places=2,)
+    vat_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    vat_amount = models.DecimalField(max_digits=8, decimal_places=2,)
+    ret_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    ret_amount = models.DecimalField(max_digits=8, decimal_places=2,)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'invoice_date']),
+            models.Index(fields=['company', 'due_date']),
+            models.Index(fields=['document_type', 'document_id']),
+        ]
+
+
+'''
+Removing ledger rows of deleted documents. Rows of deleted items are removed when items
+of the document are written again.
+'''
+
+
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Purchase)
+@receiver(post_delete, sender=Asset)
+def deleteLedgerEntries(sender, instance, **kwargs):
+    LedgerEntry.objects.filter(document_type=sender._meta.model_name, document_id=instance.id).delete()
@@ -1,11 +1,52 @@
 from rest_framework import serializers
+from django.db import transaction
+from Lookup.models import Tax
+from Report.models import invalidate_tax_reports
 from .models import Expense, ExpenseItem, Purchase, PurchaseItem, Asset, AssetItem
-from .utils import get_expense_id, get_purchase_id, get_asset_id
+from .utils import get_expense_id, get_purchase_id, get_asset_id, sync_document_items
+from .depreciation import generate_depreciation_schedules
+
+
+# --------------------Document Items Serializers------------------ #
+# PrimaryKeyRelatedField reading objects loaded once for all items of the list
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.prefetched = {}
+
+    def to_internal_value(self, data):
+        try:
+            return self.prefetched[int(data)]
+        except (KeyError, TypeError, ValueError):
+            return super().to_internal_value(data)
+
+
+'''
+List serializer of document items. Same child serializer validates every item, so before
+validating, the taxes of all items are loaded in one query per related field instead of
+one query per item and field.
+'''
+
+
+class DocumentItemListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            for name, field in self.child.fields.items():
+                if isinstance(field, PrefetchedPrimaryKeyRelatedField):
+                    pks = {str(item.get(name)) for item in data if isinstance(item, dict)}
+                    field.prefetched = field.get_queryset().in_bulk([int(pk) for pk in pks if pk.isdigit()])
+        return super().to_internal_value(data)
 
 
 # --------------------Expense Serializers------------------ #
 class ExpenseItemerializer(serializers.ModelSerializer):
+    # id of an existing item to update it, items without id are created, ignored on create
+    id = serializers.IntegerField(required=False)
+    vat = PrefetchedPrimaryKeyRelatedField(queryset=Tax.objects.all(), required=False, allow_null=True)
+    ret = PrefetchedPrimaryKeyRelatedField(queryset=Tax.objects.all(), required=False, allow_null=True)
+
     class Meta:
+        list_serializer_class = DocumentItemListSerializer
         model = ExpenseItem
         exclude = [
             'expense',
@@ -23,32 +64,31 @@ class ExpenseSerializer(serializers.ModelSerializer):
             'creation_date',
         ]
 
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request')
         # year = request.META.get('HTTP_YEAR')
         expense_items = validated_data.pop('expense_items')
-        validated_data["accounting_seat"] = get_expense_id()
+        validated_data["accounting_seat"] = get_expense_id(request.company)
         expense = Expense(company=request.company, **validated_data)
         expense.save()
-        for item in expense_items:
-            expense_item = ExpenseItem(expense=expense, **item)
-            expense_item.save()
+        sync_document_items(ExpenseItem, 'expense', expense, expense_items, created=True)
+        invalidate_tax_reports(expense.company_id, [expense.invoice_date])
         return expense
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         request = self.context.get('request')
         company = request.company
         if not instance.company.id == company.id:
             raise serializers.ValidationError({"message": "Invalid input."})
-        ExpenseItem.objects.filter(expense=instance).delete()
         expense_items = validated_data.pop('expense_items')
         validated_data['creation_date'] = instance.creation_date
         validated_data['accounting_seat'] = instance.accounting_seat
         expense = Expense(pk=instance.id, company=company, **validated_data)
         expense.save()
-        for item in expense_items:
-            expense_items = ExpenseItem(expense=expense, **item)
-            expense_items.save()
+        sync_document_items(ExpenseItem, 'expense', expense, expense_items)
+        invalidate_tax_reports(company.id, [instance.invoice_date, expense.invoice_date])
         return expense
 
 
@@ -58,7 +98,13 @@ class ExpenseDeleteSerializer(serializers.Serializer):
 
 # --------------------Purchase Serializers------------------ #
 class PurchaseItemerializer(serializers.ModelSerializer):
+    # id of an existing item to update it, items without id are created, ignored on create
+    id = serializers.IntegerField(required=False)
+    vat = PrefetchedPrimaryKeyRelatedField(queryset=Tax.objects.all(), required=False, allow_null=True)
+    ret = PrefetchedPrimaryKeyRelatedField(queryset=Tax.objects.all(), required=False, allow_null=True)
+
     class Meta:
+        list_serializer_class = DocumentItemListSerializer
         model = PurchaseItem
         exclude = [
             'purchase',
@@ -76,31 +122,30 @@ class PurchaseSerializer(serializers.ModelSerializer):
             'creation_date',
         ]
 
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request')
         purchase_items = validated_data.pop('purchase_items')
-        validated_data["accounting_seat"] = get_purchase_id()
+        validated_data["accounting_seat"] = get_purchase_id(request.company)
         purchase = Purchase(company=request.company, **validated_data)
         purchase.save()
-        for item in purchase_items:
-            purchase_item = PurchaseItem(purchase=purchase, **item)
-            purchase_item.save()
+        sync_document_items(PurchaseItem, 'purchase', purchase, purchase_items, created=True)
+        invalidate_tax_reports(purchase.company_id, [purchase.invoice_date])
         return purchase
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         request = self.context.get('request')
         company = request.company
         if not instance.company.id == company.id:
             raise serializers.ValidationError({"message": "Invalid input."})
-        PurchaseItem.objects.filter(purchase=instance).delete()
         purchase_items = validated_data.pop('purchase_items')
         validated_data['creation_date'] = instance.creation_date
         validated_data['accounting_seat'] = instance.accounting_seat
         purchase = Purchase(pk=instance.id, company=company, **validated_data)
         purchase.save()
-        for item in purchase_items:
-            purchase_item = PurchaseItem(purchase=purchase, **item)
-            purchase_item.save()
+        sync_document_items(PurchaseItem, 'purchase', purchase, purchase_items)
+        invalidate_tax_reports(company.id, [instance.invoice_date, purchase.invoice_date])
         return purchase
 
 
@@ -110,7 +155,13 @@ class PurchaseDeleteSerializer(serializers.Serializer):
 
 # --------------------Asset Serializers------------------ #
 class AssetItemerializer(serializers.ModelSerializer):
+    # id of an existing item to update it, items without id are created, ignored on create
+    id = serializers.IntegerField(required=False)
+    vat = PrefetchedPrimaryKeyRelatedField(queryset=Tax.objects.all(), required=False, allow_null=True)
+    ret = PrefetchedPrimaryKeyRelatedField(queryset=Tax.objects.all(), required=False, allow_null=True)
+
     class Meta:
+        list_serializer_class = DocumentItemListSerializer
         model = AssetItem
         exclude = [
             'asset',
@@ -128,31 +179,35 @@ class AssetSerializer(serializers.ModelSerializer):
             'creation_date',
         ]
 
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request')
         asset_items = validated_data.pop('asset_items')
-        validated_data["accounting_seat"] = get_asset_id()
+        validated_data["accounting_seat"] = get_asset_id(request.company)
         asset = Asset(company=request.company, **validated_data)
         asset.save()
-        for item in asset_items:
-            asset_item = AssetItem(asset=asset, **item)
-            asset_item.save()
+        sync_document_items(AssetItem, 'asset', asset, asset_items, created=True)
+        invalidate_tax_reports(asset.company_id, [asset.invoice_date])
+        if asset.useful_life_months:
+            generate_depreciation_schedules([asset.id])
         return asset
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         request = self.context.get('request')
         company = request.company
         if not instance.company.id == company.id:
             raise serializers.ValidationError({"message": "Invalid input."})
-        AssetItem.objects.filter(asset=instance).delete()
         asset_items = validated_data.pop('asset_items')
         validated_data['creation_date'] = instance.creation_date
         validated_data['accounting_seat'] = instance.accounting_seat
         asset = Asset(pk=instance.id, company=company, **validated_data)
         asset.save()
-        for item in asset_items:
-            asset_item = AssetItem(asset=asset, **item)
-            asset_item.save()
+        sync_document_items(AssetItem, 'asset', asset, asset_items)
+        invalidate_tax_reports(company.id, [instance.invoice_date, asset.invoice_date])
+        # assets without useful life have no schedule to generate or to remove
+        if asset.useful_life_months or instance.useful_life_months:
+            generate_depreciation_schedules([asset.id])
         return asset
 
 
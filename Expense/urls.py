@@ -1,5 +1,6 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import ExpenseViewSet, PurchaseViewSet, AssetViewSet
+from .views import ExpenseViewSet, PurchaseViewSet, AssetViewSet, DepreciationTotalsAPIView
 # from pprint import pprint
 router = DefaultRouter()
 
@@ -9,4 +10,6 @@ router.register('asset', AssetViewSet, basename='asset')
 
 # pprint(router.urls)
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path('depreciation/', DepreciationTotalsAPIView.as_view()),
+]
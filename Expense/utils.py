@@ -1,23 +1,134 @@
-from .models import Expense, Purchase, Asset
-import random
+from django.db import connection
+from django.db.models import Max
+from rest_framework import serializers
+from Core.helper import allocate_sequence
+from Lookup.models import Tax
+from .models import Expense, Purchase, Asset, LedgerEntry
 
+# accounting seats of a document type are numbered from their range start for each company
+EXPENSE_SEAT_START = 470000000001
+PURCHASE_SEAT_START = 480000000001
+ASSET_SEAT_START = 490000000001
 
-def get_expense_id():
-    random_num = random.randint(470000000001, 479999999999)
-    while Expense.objects.filter(accounting_seat=random_num).exists():
-        random_num = random.randint(470000000001, 479999999999)
-    return random_num
+# fields of ExpenseItem, PurchaseItem and AssetItem written from the payload
+DOCUMENT_ITEM_FIELDS = [
+    'base_amount',
+    'vat',
+    'calculated_vat',
+    'ret',
+    'calculated_ret',
+]
 
 
-def get_purchase_id():
-    random_num = random.randint(480000000001, 489999999999)
-    while Purchase.objects.filter(accounting_seat=random_num).exists():
-        random_num = random.randint(480000000001, 489999999999)
-    return random_num
+'''
+Returning the next accounting seat of the document model for the company from its
+sequence counter. When the counter is created it continues after the biggest seat the
+company already has in that range, so seats given before counters existed are not reused.
+'''
 
 
-def get_asset_id():
-    random_num = random.randint(490000000001, 499999999999)
-    while Asset.objects.filter(accounting_seat=random_num).exists():
-        random_num = random.randint(490000000001, 499999999999)
-    return random_num
+def get_accounting_seat(model, key, start, company):
+    def last_seat():
+        last = model.objects.filter(
+            company=company,
+            accounting_seat__startswith=str(start)[:2],
+        ).aggregate(last=Max('accounting_seat'))['last']
+        return int(last) if last else start - 1
+    return str(allocate_sequence(company, key, initial=last_seat))
+
+
+def get_expense_id(company):
+    return get_accounting_seat(Expense, 'expense_seat', EXPENSE_SEAT_START, company)
+
+
+def get_purchase_id(company):
+    return get_accounting_seat(Purchase, 'purchase_seat', PURCHASE_SEAT_START, company)
+
+
+def get_asset_id(company):
+    return get_accounting_seat(Asset, 'asset_seat', ASSET_SEAT_START, company)
+
+
+'''
+Writing the items of an expense, purchase or asset document in a constant number of
+queries. Items sent with the id of an existing item of the document are updated with one
+bulk_update if their values changed, items without id are inserted with one bulk_create
+and existing items missing from the payload are deleted in one query. For a document which
+was just created there is nothing to compare so items are only inserted, ids sent with
+them, as in a fetched document posted again to copy it, are ignored. Must be called in
+the transaction which saves the document, ledger rows of the document are then rebuilt.
+Returning the number of rows created, updated and deleted.
+'''
+
+
+def sync_document_items(item_model, document_field, document, items, created=False):
+    existing = {}
+    if not created:
+        existing = {item.id: item for item in item_model.objects.filter(**{document_field: document})}
+    attnames = [item_model._meta.get_field(field).attname for field in DOCUMENT_ITEM_FIELDS]
+
+    new_items = []
+    changed_items = []
+    kept = set()
+    for values in items:
+        item_id = None if created else values.get('id')
+        if item_id is None:
+            new_items.append(item_model(**{document_field: document}, **{
+                field: values[field] for field in DOCUMENT_ITEM_FIELDS if field in values}))
+            continue
+        item = existing.get(item_id)
+        if item is None or item_id in kept:
+            raise serializers.ValidationError({"message": "Item {} not found.".format(item_id)})
+        kept.add(item_id)
+        changed = False
+        for field, attname in zip(DOCUMENT_ITEM_FIELDS, attnames):
+            if field in values and getattr(item, attname) != getattr(values[field], 'pk', values[field]):
+                setattr(item, field, values[field])
+                changed = True
+        if changed:
+            changed_items.append(item)
+
+    removed = [item_id for item_id in existing if item_id not in kept]
+    if removed:
+        item_model.objects.filter(pk__in=removed).delete()
+    item_model.objects.bulk_update(changed_items, DOCUMENT_ITEM_FIELDS)
+    item_model.objects.bulk_create(new_items)
+    refresh_ledger(type(document), [document.id])
+    return {"created": len(new_items), "updated": len(changed_items), "deleted": len(removed)}
+
+
+'''
+Rebuilding ledger rows of the given documents of document_model (Expense, Purchase or
+Asset) from their items. Old rows are deleted and new ones are inserted by one INSERT
+... SELECT joining items with their document and taxes, so the cost does not depend on
+the number of items.
+'''
+
+
+def refresh_ledger(document_model, document_ids):
+    document_type = document_model._meta.model_name
+    LedgerEntry.objects.filter(document_type=document_type, document_id__in=document_ids).delete()
+    item_model = document_model._meta.get_field(document_type + '_items').related_model
+    quote_name = connection.ops.quote_name
+    ledger_columns = [
+        'company_id', 'document_type', 'document_id', 'item_id', 'accounting_seat', 'invoice_date',
+        'due_date', 'contact_id', 'chart_of_account_id', 'base_amount', 'vat_rate', 'vat_amount',
+        'ret_rate', 'ret_amount',
+    ]
+    sql = (
+        'INSERT INTO {ledger} ({columns}) '
+        'SELECT d.company_id, %s, d.id, i.id, d.accounting_seat, d.invoice_date, d.due_date, d.contact_id, '
+        'd.chart_of_account_id, i.base_amount, v.vat, i.calculated_vat, r.ret, i.calculated_ret '
+        'FROM {items} i JOIN {documents} d ON d.id = i.{document_column} '
+        'LEFT JOIN {taxes} v ON v.id = i.vat_id LEFT JOIN {taxes} r ON r.id = i.ret_id '
+        'WHERE d.id = ANY(%s)'
+    ).format(
+        ledger=quote_name(LedgerEntry._meta.db_table),
+        columns=', '.join(quote_name(column) for column in ledger_columns),
+        items=quote_name(item_model._meta.db_table),
+        documents=quote_name(document_model._meta.db_table),
+        document_column=quote_name(item_model._meta.get_field(document_type).column),
+        taxes=quote_name(Tax._meta.db_table),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [document_type, list(document_ids)])
@@ -1,6 +1,7 @@
+import datetime
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.response import Response
-from rest_framework import permissions, status
+from rest_framework import generics, permissions, status
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
 from Middleware.CustomMixin import CompanyPermissionsMixin
@@ -15,15 +16,21 @@ from .serializers import (
 )
 from .models import Expense, Purchase, Asset
 from .filters import ExpenseFilter, PurchaseFilter, AssetFilter
-from utils.pagination import LimitOffsetPagination
+from utils.pagination import CursorPagination
+from .depreciation import depreciation_totals
+
+# actions rendering documents with their items, which are then prefetched
+READ_ACTIONS = ('list', 'retrieve')
 
 
 class ExpenseViewSet(ModelViewSet, CompanyPermissionsMixin):
     permission_classes = [permissions.IsAuthenticated, IsCompanyAccess]
     serializer_class = ExpenseSerializer
-    pagination_class = LimitOffsetPagination
+    pagination_class = CursorPagination
+    max_page_size = 50
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = ExpenseFilter
+    ordering = ['-id']
     ordering_fields = ['id', ]
 
     def get_serializer_context(self):
@@ -31,8 +38,10 @@ class ExpenseViewSet(ModelViewSet, CompanyPermissionsMixin):
 
     def get_queryset(self):
         # year = self.request.META.get("HTTP_YEAR")
-        return Expense.objects.filter(
-            company=self.request.company).order_by('-id')
+        queryset = Expense.objects.filter(company=self.request.company).order_by('-id')
+        if self.action in READ_ACTIONS:
+            queryset = queryset.prefetch_related('expense_items')
+        return queryset
 
     def delete(self, request):
         company = self.request.company
@@ -46,9 +55,11 @@ class ExpenseViewSet(ModelViewSet, CompanyPermissionsMixin):
 class PurchaseViewSet(ModelViewSet, CompanyPermissionsMixin):
     permission_classes = [permissions.IsAuthenticated, IsCompanyAccess]
     serializer_class = PurchaseSerializer
-    pagination_class = LimitOffsetPagination
+    pagination_class = CursorPagination
+    max_page_size = 50
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = PurchaseFilter
+    ordering = ['-id']
     ordering_fields = ['id', ]
 
     def get_serializer_context(self):
@@ -56,8 +67,10 @@ class PurchaseViewSet(ModelViewSet, CompanyPermissionsMixin):
 
     def get_queryset(self):
         # year = self.request.META.get("HTTP_YEAR")
-        return Purchase.objects.filter(
-            company=self.request.company).order_by('-id')
+        queryset = Purchase.objects.filter(company=self.request.company).order_by('-id')
+        if self.action in READ_ACTIONS:
+            queryset = queryset.prefetch_related('purchase_items')
+        return queryset
 
     def delete(self, request):
         company = self.request.company
@@ -71,17 +84,21 @@ class PurchaseViewSet(ModelViewSet, CompanyPermissionsMixin):
 class AssetViewSet(ModelViewSet, CompanyPermissionsMixin):
     permission_classes = [permissions.IsAuthenticated, IsCompanyAccess]
     serializer_class = AssetSerializer
-    pagination_class = LimitOffsetPagination
+    pagination_class = CursorPagination
+    max_page_size = 50
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = AssetFilter
+    ordering = ['-id']
     ordering_fields = ['id', ]
 
     def get_serializer_context(self):
         return {'request': self.request}
 
     def get_queryset(self):
-        return Asset.objects.filter(
-            company=self.request.company).order_by('-id')
+        queryset = Asset.objects.filter(company=self.request.company).order_by('-id')
+        if self.action in READ_ACTIONS:
+            queryset = queryset.prefetch_related('asset_items')
+        return queryset
 
     def delete(self, request):
         company = self.request.company
@@ -90,3 +107,27 @@ class AssetViewSet(ModelViewSet, CompanyPermissionsMixin):
         data = serializer.validated_data
         Asset.objects.filter(pk__in=data['assets_list'], company=company).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+'''
+Depreciation of the company summed by account of assets for months from start to end.
+Query params: start and end as YYYY-MM, both default to the current month.
+'''
+
+
+class DepreciationTotalsAPIView(CompanyPermissionsMixin, generics.GenericAPIView):
+    permission_classes = (permissions.IsAuthenticated, IsCompanyAccess)
+
+    def get(self, request, *args, **kwargs):
+        current = datetime.date.today().replace(day=1)
+        try:
+            start, end = [
+                datetime.datetime.strptime(request.GET[param], '%Y-%m').date() if request.GET.get(param) else current
+                for param in ('start', 'end')]
+        except ValueError:
+            return Response({"message": "start and end must be YYYY-MM"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "start": start,
+            "end": end,
+            "results": depreciation_totals(self.request.company, start, end),
+        }, status=status.HTTP_200_OK)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MiddlewareConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Middleware'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,110 @@
+import hashlib
+import time
+import jwt
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext as _
+from rest_framework import exceptions
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.settings import api_settings
+from .cache import LRUCache
+
+jwt_decode_handler = api_settings.JWT_DECODE_HANDLER
+jwt_get_username_from_payload = api_settings.JWT_PAYLOAD_GET_USERNAME_HANDLER
+
+# sha256 of token -> decoded payload, an entry never outlives the exp claim of its token
+decoded_token_cache = LRUCache(
+    max_size=settings.JWT_TOKEN_CACHE['MAX_SIZE'],
+    ttl=settings.JWT_TOKEN_CACHE['TTL'])
+
+
+'''
+Decoding a token means verifying its signature which is the costly part of the
+authentication. Same token comes again and again until it expires so the payload
+is kept in decoded_token_cache. Invalid or expired tokens are never cached.
+'''
+
+
+def decode_token(token):
+    if isinstance(token, str):
+        token = token.encode()
+    key = hashlib.sha256(token).hexdigest()
+    payload = decoded_token_cache.get(key)
+    if payload is None:
+        payload = jwt_decode_handler(token)
+        expires_at = None
+        if payload.get('exp'):
+            expires_at = time.monotonic() + (payload['exp'] - time.time())
+        decoded_token_cache.set(key, payload, expires_at)
+    return payload
+
+
+'''
+JSONWebTokenAuthentication doing the work only once per request. CompanyAccessMiddleWare
+authenticates the request before the view is called and keeps (user, token) on the
+request as jwt_auth, so here we simply return it. If the middleware did not run or
+could not authenticate, the token is verified here and DRF errors are raised as before.
+The decoded payload is also kept on the request as jwt_payload.
+'''
+
+
+class CachedJSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    # same as the base class but profile is loaded with the user in the same query
+    def authenticate_credentials(self, payload):
+        User = get_user_model()
+        username = jwt_get_username_from_payload(payload)
+
+        if not username:
+            msg = _('Invalid payload.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        try:
+            user = User.objects.select_related('user_profile').get(**{User.USERNAME_FIELD: username})
+        except User.DoesNotExist:
+            msg = _('Invalid signature.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        if not user.is_active:
+            msg = _('User account is disabled.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        return user
+
+    def authenticate(self, request):
+        http_request = getattr(request, '_request', request)
+        jwt_auth = getattr(http_request, 'jwt_auth', None)
+        if jwt_auth is not None:
+            return jwt_auth
+
+        jwt_value = self.get_jwt_value(request)
+        if jwt_value is None:
+            return None
+
+        try:
+            payload = decode_token(jwt_value)
+        except jwt.ExpiredSignature:
+            msg = _('Signature has expired.')
+            raise exceptions.AuthenticationFailed(msg)
+        except jwt.DecodeError:
+            msg = _('Error decoding signature.')
+            raise exceptions.AuthenticationFailed(msg)
+        except jwt.InvalidTokenError:
+            raise exceptions.AuthenticationFailed()
+
+        user = self.authenticate_credentials(payload)
+        http_request.jwt_payload = payload
+        http_request.jwt_auth = (user, jwt_value)
+        return http_request.jwt_auth
+
+
+'''
+Used by the middleware, returning (user, token) for the request or None when there
+is no valid token. Result is stored on the request so DRF will not verify again.
+'''
+
+
+def authenticate_request(request):
+    try:
+        return CachedJSONWebTokenAuthentication().authenticate(request)
+    except exceptions.AuthenticationFailed:
+        return None
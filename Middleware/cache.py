@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+'''
+Small per-process LRU cache with a time to live on every entry. It is used by
+the middleware to remember answers which are asked on every request, so a hit
+costs no database query. Each worker process keeps its own copy, that is why
+entries always expire after the ttl even if no signal reached this process.
+hits and misses are counted so we can see how well the cache is doing.
+'''
+
+
+class LRUCache:
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    # expires_at is a time.monotonic() value, when given it is capped by the ttl
+    def set(self, key, value, expires_at=None):
+        ttl_expiry = time.monotonic() + self.ttl
+        if expires_at is None or expires_at > ttl_expiry:
+            expires_at = ttl_expiry
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    # removing every key for which the given function returns True
+    def delete_matching(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+        }
@@ -1,17 +1,66 @@
-from django.shortcuts import get_object_or_404
-from rest_framework_jwt.serializers import VerifyJSONWebTokenSerializer
-from Core.models import Company, CompanyAccessRecord
-from re import sub
+import copy
+from django.conf import settings
+from django.db.models import Q
+from Core.models import Company
+from .cache import LRUCache
+from .authentication import authenticate_request
+
+
+# (user_id, company_id) -> Company the user may access, or None when access is denied
+company_access_cache = LRUCache(
+    max_size=settings.COMPANY_ACCESS_CACHE['MAX_SIZE'],
+    ttl=settings.COMPANY_ACCESS_CACHE['TTL'])
+
+_MISSING = object()
+
+
+'''
+Returning the company if user owns it (only admins own companies) or have an access
+record for it, else None. Both checks are done in one query.
+'''
 
 
 def get_company_if_authenticated(user, company_id):
-    if (user.is_staff and Company.objects.filter(
-            pk=company_id, user=user).exists()) or \
-        CompanyAccessRecord.objects.filter(
-            user=user, company_id=company_id):
-        return get_object_or_404(Company, pk=company_id)
-    else:
-        return Company.DoesNotExist
+    access = Q(companyaccessrecord__user=user)
+    if user.is_staff:
+        access |= Q(user=user)
+    return Company.objects.filter(access, pk=company_id).first()
+
+
+'''
+Same as above but answers are remembered in company_access_cache, so a user working
+on the same company does not hit the database on every request. Cache entries are
+dropped by the signals in Middleware/signals.py when Company or CompanyAccessRecord
+rows change. A copy is returned so a view changing the company never changes the
+cached instance.
+'''
+
+
+def get_cached_company_if_authenticated(user, company_id):
+    key = (user.id, int(company_id))
+    company = company_access_cache.get(key, _MISSING)
+    if company is _MISSING:
+        company = get_company_if_authenticated(user, company_id)
+        company_access_cache.set(key, company)
+    return copy.copy(company)
+
+
+'''
+Company authorized by a company scoped token (see Core.helper.jwt_payload_handler).
+If the token lists the company and its access version is still the current one of
+the user, a company instance with only the id loaded is returned, its other fields
+are read from database only when a view uses them. Returning None means the token
+can not decide and the company has to be checked in database.
+'''
+
+
+def get_company_from_token(user, payload, company_id):
+    companies = payload.get('companies')
+    if companies is None or int(company_id) not in companies:
+        return None
+    if payload.get('company_access_version') != user.user_profile.company_access_version:
+        return None
+    return Company.from_db(None, ['id'], [int(company_id)])
 
 
 class CompanyAccessMiddleWare:
@@ -29,17 +78,13 @@ class CompanyAccessMiddleWare:
         request.company = None
         if header_token is not None:
             try:
-                token = sub('JWT ', '', request.META.get('HTTP_AUTHORIZATION', None))
-                verified_data = VerifyJSONWebTokenSerializer().validate({'token': token})
-                if Company.objects.filter(pk=company_id).exists():
-                    company = get_company_if_authenticated(verified_data['user'], company_id)
-                    if not isinstance(company, Company):
-                        return None
-                    else:
-                        request.company = company
-                        return None
-                else:
+                # token is verified once here and reused by DRF authentication
+                jwt_auth = authenticate_request(request)
+                if jwt_auth is None:
                     return None
+                request.company = get_company_from_token(jwt_auth[0], request.jwt_payload, company_id) or \
+                    get_cached_company_if_authenticated(jwt_auth[0], company_id)
+                return None
             except Exception as e:
                 return None
                 print(e)
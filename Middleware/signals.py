@@ -0,0 +1,30 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import User
+from Core.models import Company, CompanyAccessRecord
+from .custommiddleware import company_access_cache
+
+
+'''
+Receivers keeping company_access_cache correct. Whenever a company, an access
+record or a user (is_staff decides company ownership) is saved or deleted the
+cached decisions depending on that row are dropped.
+'''
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def invalidateCompanyAccess(sender, instance, **kwargs):
+    company_access_cache.delete_matching(lambda key: key[1] == instance.id)
+
+
+@receiver(post_save, sender=CompanyAccessRecord)
+@receiver(post_delete, sender=CompanyAccessRecord)
+def invalidateCompanyAccessRecord(sender, instance, **kwargs):
+    company_access_cache.delete((instance.user_id, instance.company_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidateUserCompanyAccess(sender, instance, **kwargs):
+    company_access_cache.delete_matching(lambda key: key[0] == instance.id)
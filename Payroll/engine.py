@@ -0,0 +1,114 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+from .models import Employee, PayRoll, PayRollItem, PayrollTeam
+
+
+'''
+Payroll engine computing payroll items on server side. Salaries of all employees are
+loaded in one query as a column and every amount is computed column wise in integer
+cents, so there is no float rounding and no query per employee. Rates are given in
+percent with two decimals and kept as integers in hundredths of percent. Rounding is
+half up to the cent.
+'''
+
+
+def to_cents(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def to_rate(percent):
+    return int((Decimal(percent) * 100).to_integral_value())
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def apply_rate(column, rate):
+    return [(cents * rate + 5000) // 10000 for cents in column]
+
+
+'''
+Computing every payroll item column and the totals of the payroll header from the
+list of gross salaries in cents. All arguments which are rates are in hundredths of
+percent. Returning a dict of columns (lists of cents) and a dict of totals in cents.
+'''
+
+
+def compute_payroll(gross, irfp_rate, ss_employee_rate, ss_company_rate):
+    bonus = [0] * len(gross)
+    discount = [0] * len(gross)
+    total_gross = [g + b for g, b in zip(gross, bonus)]
+    irfp_total = apply_rate(total_gross, irfp_rate)
+    ss_employee = apply_rate(total_gross, ss_employee_rate)
+    ss_company = apply_rate(total_gross, ss_company_rate)
+    net = [t - i - s - d for t, i, s, d in zip(total_gross, irfp_total, ss_employee, discount)]
+    company_cost = [t + s for t, s in zip(total_gross, ss_company)]
+    columns = {
+        'gross': gross,
+        'bonus': bonus,
+        'total_gross': total_gross,
+        'irfp_total': irfp_total,
+        'ss_employee': ss_employee,
+        'net': net,
+        'ss_company': ss_company,
+        'discount': discount,
+        'company_cost': company_cost,
+    }
+    totals = {field: sum(column) for field, column in columns.items()}
+    return columns, totals
+
+
+'''
+Generating the payroll of a period for every employee of the company or only for
+employees of teams_list. irfp_tax is the Lookup Tax whose irfp rate is applied,
+social security rates come from PAYROLL_SOCIAL_SECURITY setting. Payroll, its teams
+and its items are inserted in bulk and the created payroll is returned.
+'''
+
+
+def generate_payroll(company, year, month, irfp_tax, teams_list=None):
+    employees = Employee.objects.filter(company=company)
+    if teams_list:
+        employees = employees.filter(team_id__in=teams_list)
+    rows = list(employees.order_by('id').values_list('id', 'current_salary', 'team_id'))
+    employee_ids = [row[0] for row in rows]
+    team_ids = [row[2] for row in rows]
+    columns, totals = compute_payroll(
+        [to_cents(row[1]) for row in rows],
+        to_rate(irfp_tax.irfp),
+        to_rate(settings.PAYROLL_SOCIAL_SECURITY['EMPLOYEE_RATE']),
+        to_rate(settings.PAYROLL_SOCIAL_SECURITY['COMPANY_RATE']))
+
+    payroll = PayRoll.objects.create(
+        company=company,
+        irfp=irfp_tax.irfp,
+        created_at_year=year,
+        created_at_month=month,
+        **{field: from_cents(total) for field, total in totals.items()})
+    PayrollTeam.objects.bulk_create([
+        PayrollTeam(payroll=payroll, team_id=team) for team in dict.fromkeys(teams_list or [])])
+    insert_payroll_items(payroll, employee_ids, team_ids, irfp_tax.irfp, columns)
+    return payroll
+
+
+'''
+Inserting all items of a generated payroll in a single statement. Every computed column
+is sent as one array of cents and unnested on database side, so no model instance is
+built per item and cents are turned back to decimals exactly by postgres numeric.
+'''
+
+
+def insert_payroll_items(payroll, employee_ids, team_ids, irfp, columns):
+    if not employee_ids:
+        return
+    quote_name = connection.ops.quote_name
+    names = [
+        PayRollItem._meta.get_field(field).column for field in ['payroll', 'employee', 'team', 'irfp'] + list(columns)]
+    sql = 'INSERT INTO {} ({}) SELECT %s, unnest(%s::bigint[]), unnest(%s::bigint[]), %s, {}'.format(
+        quote_name(PayRollItem._meta.db_table),
+        ', '.join(quote_name(name) for name in names),
+        ', '.join(['unnest(%s::bigint[])::numeric / 100'] * len(columns)))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [payroll.id, employee_ids, team_ids, irfp] + list(columns.values()))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from Core.models import Company
+from Payroll.models import PayRoll, PayRollItem, PayrollMonthlySummary, Employee
+from Payroll.utils import refresh_payroll_summaries
+
+
+'''
+Building the monthly payroll summary table from existing payrolls, needed once for
+payrolls created before the table existed or after fixing data by hand. Items saved
+without team, before items kept the team of their employee, get its current team.
+'''
+
+
+class Command(BaseCommand):
+    help = 'Rebuild monthly payroll summaries of every company or of the given companies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', help='id of company to rebuild, repeatable')
+
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options['company']:
+            companies = companies.filter(pk__in=options['company'])
+        for company in companies.iterator():
+            periods = PayRoll.objects.filter(company=company).values_list(
+                'created_at_year', 'created_at_month').distinct()
+            with transaction.atomic():
+                PayRollItem.objects.filter(payroll__company=company, team__isnull=True).update(
+                    team_id=Subquery(Employee.objects.filter(pk=OuterRef('employee_id')).values('team_id')[:1]))
+                PayrollMonthlySummary.objects.filter(company=company).delete()
+                refresh_payroll_summaries(company, list(periods))
+            self.stdout.write('Rebuilt payroll summary of company {}'.format(company.id))
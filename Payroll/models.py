@@ -24,6 +24,11 @@ class Team(models.Model):
         related_name='team_country_lookup_name', null=True, blank=True)
     note = models.TextField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', '-id']),
+        ]
+
     def __str__(self):
         return self.team_name + "-   -" + self.company.name
 
@@ -61,6 +66,12 @@ class Employee(models.Model):
         related_name='country_lookup_name', null=True, blank=True)
     note = models.TextField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', '-id']),
+            models.Index(fields=['company', 'nif']),
+        ]
+
     def __str__(self):
         return str(self.id) + "-   -" + self.name
 
@@ -88,6 +99,12 @@ class PayRoll(models.Model):
     created_at_year = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(2020), max_value_current_year])
     created_at_month = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(1), MaxValueValidator(12)])
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', '-id']),
+            models.Index(fields=['company', 'created_at_year', 'created_at_month']),
+        ]
+
 
 class PayrollTeam(models.Model):
     payroll = models.ForeignKey(
@@ -106,6 +123,10 @@ class PayRollItem(models.Model):
     employee = models.ForeignKey(
         Employee, on_delete=models.SET_NULL,
         related_name='employee_payroll', null=True)
+    # team of the employee when the item was created, summaries are grouped by it
+    team = models.ForeignKey(
+        Team, on_delete=models.SET_NULL,
+        related_name='team_payroll_items', null=True, blank=True)
     gross = models.DecimalField(max_digits=10, decimal_places=2, )
     bonus = models.DecimalField(max_digits=10, decimal_places=2, )
     total_gross = models.DecimalField(max_digits=10, decimal_places=2, )
@@ -119,3 +140,38 @@ class PayRollItem(models.Model):
     ss_company = models.DecimalField(max_digits=10, decimal_places=2, )
     discount = models.DecimalField(max_digits=10, decimal_places=2, )
     company_cost = models.DecimalField(max_digits=10, decimal_places=2, )
+
+
+# Sums of payroll items per company, month and team of employee at payroll time, kept up to
+# date by Payroll.utils.refresh_payroll_summary whenever payrolls of that month change.
+class PayrollMonthlySummary(models.Model):
+    company = models.ForeignKey(
+        Company, on_delete=models.CASCADE,
+        related_name='company_payroll_summary')
+    year = models.PositiveIntegerField()
+    month = models.PositiveIntegerField()
+    team = models.ForeignKey(
+        Team,
+        on_delete=models.SET_NULL,
+        null=True, blank=True)
+    employees = models.PositiveIntegerField(default=0)
+    gross = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    bonus = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    irfp_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ss_employee = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    net = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ss_company = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    company_cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'year', 'month']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company', 'year', 'month', 'team'], name='unique_company_payroll_summary_team'),
+            # nulls are never equal in a unique constraint, so rows without team need their own
+            models.UniqueConstraint(
+                fields=['company', 'year', 'month'], condition=models.Q(team__isnull=True),
+                name='unique_company_payroll_summary_no_team'),
+        ]
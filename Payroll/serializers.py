@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from django.core.validators import MaxValueValidator, MinValueValidator
+from Lookup.models import Tax
 from .models import PayRoll, PayRollItem, PayrollTeam, Team, Employee
 
 
@@ -43,6 +45,23 @@ class AddEmployeeSerializer(serializers.ModelSerializer):
         ]
 
 
+# One csv row of the employee import, related objects are given by their ids
+class EmployeeImportRowSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255)
+    surname = serializers.CharField(max_length=255)
+    nif = serializers.CharField(max_length=13)
+    team = serializers.IntegerField(required=False)
+    contract_type = serializers.IntegerField(required=False)
+    country = serializers.IntegerField(required=False)
+    current_salary = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    enddate = serializers.DateField(required=False)
+    social_security = serializers.CharField(required=False)
+    address = serializers.CharField(required=False)
+    postcode = serializers.CharField(max_length=10, required=False)
+    province = serializers.CharField(max_length=130, required=False)
+    note = serializers.CharField(required=False)
+
+
 class ListEmployeeSerializer(serializers.ModelSerializer):
     country_label = serializers.CharField(read_only=True, source='country.lookup_name')
     team_label = serializers.CharField(read_only=True, source='team.team_name')
@@ -109,6 +128,21 @@ class PayRollSerializer(serializers.ModelSerializer):
         model = PayRoll
         exclude = ['company', 'creation_date']
 
+    # items are matched by employee on update, so an employee has one item on create too
+    def validate_payroll_items(self, payroll_items):
+        employees = [item['employee'] for item in payroll_items]
+        if len(set(employees)) != len(employees):
+            raise serializers.ValidationError("An employee can have only one item.")
+        return payroll_items
+
+
+# Serializer for payroll generated on server side by Payroll.engine
+class PayRollGenerateSerializer(serializers.Serializer):
+    irfp = serializers.PrimaryKeyRelatedField(queryset=Tax.objects.all())
+    teams_list = serializers.ListField(child=serializers.IntegerField(), required=False)
+    created_at_year = serializers.IntegerField(validators=[MinValueValidator(2020)])
+    created_at_month = serializers.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(12)])
+
 
 class PayrollsDeleteSerializer(serializers.ModelSerializer):
     payrolls_list = serializers.ListField(child=serializers.IntegerField(required=True))
@@ -13,13 +13,17 @@ from .views import (
     EmployeeListAPIView,
     EmployeeFormListAPIView,
     EmployeesDeleteAPIView,
+    EmployeeImportAPIView,
 
     PayRollCreateAPIView,
+    PayRollGenerateAPIView,
     PayRollListAPIView,
     PayRollRetrieveAPIView,
     PayRollsDeleteAPIView,
     PayRollItemDestroyView,
     PayRollItemUpdateAPIView,
+    PayRollTrendsAPIView,
+    PayRollExportAPIView,
 )
 
 
@@ -37,12 +41,16 @@ urlpatterns = [
     path('employees/', EmployeeListAPIView.as_view()),
     path('list/employees/', EmployeeFormListAPIView.as_view()),
     path('employees/destroy/', EmployeesDeleteAPIView.as_view()),
+    path('employees/import/', EmployeeImportAPIView.as_view()),
 
     path('create/', PayRollCreateAPIView.as_view()),
+    path('generate/', PayRollGenerateAPIView.as_view()),
     path('items/update/<int:payroll_id>/', PayRollItemUpdateAPIView.as_view()),
     path('all/', PayRollListAPIView.as_view()),
     path('items/<pk>/', PayRollRetrieveAPIView.as_view()),
     path('destroy/', PayRollsDeleteAPIView.as_view()),
     path('item/destroy/<pk>/', PayRollItemDestroyView.as_view()),
+    path('summary/trends/', PayRollTrendsAPIView.as_view()),
+    path('export/', PayRollExportAPIView.as_view()),
 
 ]
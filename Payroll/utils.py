@@ -1,8 +1,44 @@
 
+import csv
+import io
 from rest_framework import status
+from rest_framework import serializers
 from rest_framework.response import Response
 from Core.models import Company, CompanyAccessRecord
 from django.shortcuts import get_object_or_404
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from Lookup.models import LookupName
+from .models import PayrollTeam, PayRollItem, PayrollMonthlySummary, Employee, Team
+from .serializers import EmployeeImportRowSerializer
+
+PAYROLL_ITEM_FIELDS = [
+    'gross',
+    'bonus',
+    'total_gross',
+    'irfp',
+    'irfp_total',
+    'ss_employee',
+    'net',
+    'ss_company',
+    'discount',
+    'company_cost',
+]
+
+EMPLOYEE_IMPORT_BATCH_SIZE = 1000
+
+# only this many row errors are returned, error_count still counts all of them
+EMPLOYEE_IMPORT_MAX_ERRORS = 1000
+
+PAYROLL_SUMMARY_FIELDS = [
+    'gross',
+    'bonus',
+    'irfp_total',
+    'ss_employee',
+    'net',
+    'ss_company',
+    'company_cost',
+]
 
 
 '''
@@ -24,3 +60,211 @@ def get_company_if_authenticated(user, company_id):
         return get_object_or_404(Company, pk=company_id)
     else:
         return response
+
+
+'''
+Checking in a single query that every id of the list is a row of model belonging to
+the company. Raising a ValidationError, answered with 400, if any of them is not, so
+nothing of the payroll is written.
+'''
+
+
+def validate_company_ids(model, ids, company):
+    ids = set(ids)
+    if not ids:
+        return
+    found = set(model.objects.filter(pk__in=ids, company=company).values_list('pk', flat=True))
+    if found != ids:
+        raise serializers.ValidationError({"message": "{} not found.".format(model.__name__)})
+
+
+'''
+Making teams of the payroll equal to teams_list by only creating missing and deleting
+removed PayrollTeam rows. Returning the number of created and deleted rows.
+'''
+
+
+def sync_payroll_teams(payroll, teams_list):
+    existing = {}
+    removed = []
+    for payroll_team in PayrollTeam.objects.filter(payroll=payroll):
+        if payroll_team.team_id in existing or payroll_team.team_id not in teams_list:
+            removed.append(payroll_team.id)
+        else:
+            existing[payroll_team.team_id] = payroll_team.id
+    new_teams = [
+        PayrollTeam(payroll=payroll, team_id=team) for team in dict.fromkeys(teams_list) if team not in existing]
+    if removed:
+        PayrollTeam.objects.filter(pk__in=removed).delete()
+    PayrollTeam.objects.bulk_create(new_teams)
+    return {"created": len(new_teams), "deleted": len(removed)}
+
+
+'''
+Comparing incoming items with existing items of the payroll by employee. Items whose
+values changed are saved with one bulk_update, items of new employees with one
+bulk_create and items of employees not in payload anymore with one delete. Returning
+the number of rows created, updated and deleted.
+'''
+
+
+def get_employee_teams(employee_ids):
+    return dict(Employee.objects.filter(pk__in=employee_ids).values_list('id', 'team_id'))
+
+
+def sync_payroll_items(payroll, payroll_items):
+    incoming = {item['employee']: item for item in payroll_items}
+    existing = {}
+    removed = []
+    for item in PayRollItem.objects.filter(payroll=payroll):
+        if item.employee_id in existing or item.employee_id not in incoming:
+            removed.append(item.id)
+        else:
+            existing[item.employee_id] = item
+
+    teams = get_employee_teams([employee_id for employee_id in incoming if employee_id not in existing])
+    new_items = []
+    changed_items = []
+    for employee_id, values in incoming.items():
+        item = existing.get(employee_id)
+        if item is None:
+            new_items.append(PayRollItem(
+                payroll=payroll, employee_id=employee_id, team_id=teams.get(employee_id),
+                **{field: values[field] for field in PAYROLL_ITEM_FIELDS}))
+            continue
+        if any(getattr(item, field) != values[field] for field in PAYROLL_ITEM_FIELDS):
+            for field in PAYROLL_ITEM_FIELDS:
+                setattr(item, field, values[field])
+            changed_items.append(item)
+
+    if removed:
+        PayRollItem.objects.filter(pk__in=removed).delete()
+    PayRollItem.objects.bulk_update(changed_items, PAYROLL_ITEM_FIELDS)
+    PayRollItem.objects.bulk_create(new_items)
+    return {"created": len(new_items), "updated": len(changed_items), "deleted": len(removed)}
+
+
+'''
+Rebuilding the monthly summary rows of one month of a company from the items of that
+month only, one grouped query per month. It must be called after any payroll of the
+month is created, updated or deleted. Payrolls without year or month are not summarized.
+Items are grouped by the team they were saved with, so moving an employee to another
+team does not move their past payrolls. Concurrent refreshes of the same month would
+both insert rows, so they are serialized by a transaction level advisory lock on the
+company and month, other months and companies are not blocked.
+'''
+
+
+@transaction.atomic(savepoint=False)
+def refresh_payroll_summary(company, year, month):
+    if year is None or month is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [company.id, year * 100 + month])
+    PayrollMonthlySummary.objects.filter(company=company, year=year, month=month).delete()
+    rows = PayRollItem.objects.filter(
+        payroll__company=company,
+        payroll__created_at_year=year,
+        payroll__created_at_month=month,
+    ).values('team').annotate(
+        employees=Count('employee', distinct=True),
+        **{field: Sum(field) for field in PAYROLL_SUMMARY_FIELDS}
+    ).order_by()
+    PayrollMonthlySummary.objects.bulk_create([
+        PayrollMonthlySummary(
+            company=company, year=year, month=month, team_id=row.pop('team'), **row)
+        for row in rows])
+
+
+def refresh_payroll_summaries(company, periods):
+    for year, month in set(periods):
+        refresh_payroll_summary(company, year, month)
+
+
+'''
+Returning totals of every month of the given years from the summary table in one
+query, plus the percent change of company cost against same month of previous year
+(None when previous year has no payroll for that month).
+'''
+
+
+def get_payroll_trends(company, years, team=None):
+    summaries = PayrollMonthlySummary.objects.filter(
+        company=company, year__in=set(years) | {year - 1 for year in years})
+    if team is not None:
+        summaries = summaries.filter(team_id=team)
+    rows = summaries.values('year', 'month').annotate(
+        employees=Sum('employees'),
+        **{field: Sum(field) for field in PAYROLL_SUMMARY_FIELDS}
+    ).order_by('year', 'month')
+    months = {(row['year'], row['month']): row for row in rows}
+    trends = []
+    for (year, month), row in months.items():
+        if year not in years:
+            continue
+        previous = months.get((year - 1, month))
+        row['company_cost_change'] = None
+        if previous and previous['company_cost']:
+            row['company_cost_change'] = round(
+                (row['company_cost'] - previous['company_cost']) * 100 / previous['company_cost'], 2)
+        trends.append(row)
+    return trends
+
+
+'''
+Importing employees of the company from an uploaded csv file. The file is read row by
+row, every row is validated without any query against sets loaded once (nif of company
+employees, company teams and lookup names) and valid rows are inserted with bulk_create
+by batches of EMPLOYEE_IMPORT_BATCH_SIZE. Rows with errors are skipped and reported with
+their line number. Returning a dict with created, error_count and errors.
+'''
+
+
+def import_employees(company, upload):
+    rows = csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''))
+    missing = {'name', 'surname', 'nif'} - set(rows.fieldnames or [])
+    if missing:
+        raise serializers.ValidationError(
+            {"file": "Missing columns: {}".format(', '.join(sorted(missing)))})
+
+    row_serializer = EmployeeImportRowSerializer()
+    nifs = set(Employee.objects.filter(company=company).values_list('nif', flat=True))
+    teams = set(Team.objects.filter(company=company).values_list('id', flat=True))
+    lookup_names = set(LookupName.objects.values_list('id', flat=True))
+    related = (('team', teams), ('contract_type', lookup_names), ('country', lookup_names))
+
+    created = 0
+    error_count = 0
+    errors = []
+    batch = []
+    for row in rows:
+        data = {key: value.strip() for key, value in row.items() if key and value and value.strip()}
+        try:
+            data = row_serializer.run_validation(data)
+        except serializers.ValidationError as error:
+            row_errors = error.detail
+        else:
+            row_errors = {}
+            if data['nif'] in nifs:
+                row_errors['nif'] = "NIF already exist"
+            for field, ids in related:
+                if field in data and data[field] not in ids:
+                    row_errors[field] = "{} not Found".format(field.replace('_', ' ').capitalize())
+        if row_errors:
+            error_count += 1
+            if len(errors) < EMPLOYEE_IMPORT_MAX_ERRORS:
+                errors.append({"row": rows.line_num, "errors": row_errors})
+            continue
+
+        nifs.add(data['nif'])
+        for field, _ in related:
+            if field in data:
+                data[field + '_id'] = data.pop(field)
+        batch.append(Employee(company=company, **data))
+        if len(batch) == EMPLOYEE_IMPORT_BATCH_SIZE:
+            Employee.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    Employee.objects.bulk_create(batch)
+    created += len(batch)
+    return {"created": created, "error_count": error_count, "errors": errors}
@@ -1,3 +1,5 @@
+import csv
+import datetime
 from rest_framework import status
 from rest_framework import generics
 from rest_framework import permissions
@@ -5,6 +7,7 @@ from rest_framework.response import Response
 from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db import transaction
+from django.db.models import Prefetch
 from .serializers import (
     TeamSerializer,
     TeamsDeleteSerializer,
@@ -16,11 +19,25 @@ from .serializers import (
     FetchPayrollSerializer,
     PayRollListSerializer,
     PayrollsDeleteSerializer,
+    PayRollGenerateSerializer,
     TeamFormListSerializer,
 )
 from .models import Team, Employee, PayRoll, PayRollItem, PayrollTeam
-from utils.pagination import LimitOffsetPagination
+from utils.pagination import LimitOffsetPagination, CursorPagination
+from utils.export import streaming_export_response, EXPORT_CHUNK_SIZE
 from .filters import TeamFilter, EmployeeFilter, PayRollFilter
+from .utils import (
+    validate_company_ids,
+    sync_payroll_teams,
+    sync_payroll_items,
+    refresh_payroll_summary,
+    get_employee_teams,
+    refresh_payroll_summaries,
+    get_payroll_trends,
+    import_employees,
+)
+from .engine import generate_payroll
+from Report.models import invalidate_payroll_tax_reports
 from Middleware.CustomMixin import CompanyPermissionsMixin
 from Middleware.permissions import IsCompanyAccess
 # ---------------------- Starting Crud for Team ---------------------------#
@@ -193,6 +210,30 @@ class EmployeeCreateAPIView(CompanyPermissionsMixin, generics.CreateAPIView):
         )
 
 
+'''
+Creating many employees at once from a csv file sent as "file". Columns are the fields
+of the employee, team, contract_type and country are given by id. Valid rows are created
+and invalid rows are returned with their line number and errors. Nothing is created if
+the file can not be read.
+'''
+
+
+class EmployeeImportAPIView(CompanyPermissionsMixin, generics.GenericAPIView):
+    permission_classes = (permissions.IsAuthenticated, IsCompanyAccess)
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"message": "file is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                result = import_employees(self.request.company, upload)
+        except (UnicodeDecodeError, csv.Error):
+            return Response({"message": "file must be utf-8 encoded csv"}, status=status.HTTP_400_BAD_REQUEST)
+        response_status = status.HTTP_201_CREATED if result['created'] else status.HTTP_400_BAD_REQUEST
+        return Response(result, status=response_status)
+
+
 '''
 this View overriding the base get_queryset method and in that before
 filtering it check weather the user requesting for employees for a
@@ -207,13 +248,17 @@ and Filters to filter specific data.
 class EmployeeListAPIView(CompanyPermissionsMixin, generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated, IsCompanyAccess]
     serializer_class = ListEmployeeSerializer
-    pagination_class = LimitOffsetPagination
+    pagination_class = CursorPagination
+    max_page_size = 100
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = EmployeeFilter
-    ordering_fields = ['id', 'name']
+    ordering = ['-id']
+    # cursor pages need a unique ordering, see utils.pagination.CursorPagination
+    ordering_fields = ['id']
 
     def get_queryset(self):
-        return Employee.objects.filter(company=self.request.company).order_by('-id')
+        return Employee.objects.filter(company=self.request.company).select_related(
+            'team', 'contract_type', 'country').order_by('-id')
 
 
 class EmployeeFormListAPIView(CompanyPermissionsMixin, generics.ListAPIView):
@@ -301,11 +346,10 @@ class EmployeesDeleteAPIView(CompanyPermissionsMixin, generics.DestroyAPIView):
 # ---------------------- Starting Crud for PayRoll ---------------------------#
 '''
 In this View first of all view are validating the payload through calling
-the serializer and then after that we are calling method to check if current
-user have permissions to perform create payRoll if in return. I get a instance
-of Company then we create Payroll and start loop to create its Items. In each
-iteration first it check if employee id belongs to current company if yes then
-Payroll Item will be created.
+the serializer and then after that we are checking in one query for teams and
+one for employees that all of them belongs to current company. Then Payroll is
+created and its teams and items are inserted with bulk_create, so the number of
+queries stays the same whatever the number of employees is.
 '''
 
 
@@ -321,23 +365,46 @@ class PayRollCreateAPIView(CompanyPermissionsMixin, generics.CreateAPIView):
         company = self.request.company
         payroll_items = data.pop("payroll_items")
         teams_list = data.pop("teams_list")
+        validate_company_ids(Team, teams_list, company)
+        validate_company_ids(Employee, [item['employee'] for item in payroll_items], company)
         payroll = PayRoll.objects.create(
             company=company, **data)
-        for team in teams_list:
-            if Team.objects.filter(pk=team, company=company).exists():
-                PayrollTeam.objects.create(payroll=payroll, team_id=team)
-            else:
-                raise Team.DoesNotExist
+        PayrollTeam.objects.bulk_create([PayrollTeam(payroll=payroll, team_id=team) for team in teams_list])
+        teams = get_employee_teams([item['employee'] for item in payroll_items])
+        items = []
         for item in payroll_items:
-            if Employee.objects.filter(pk=item['employee'], company=company).exists():
-                item['employee_id'] = item['employee']
-                del item['employee']
-                PayRollItem.objects.create(
-                    payroll=payroll,
-                    **item,
-                )
-            else:
-                raise Employee.DoesNotExist
+            employee_id = item.pop('employee')
+            items.append(PayRollItem(payroll=payroll, employee_id=employee_id, team_id=teams.get(employee_id), **item))
+        PayRollItem.objects.bulk_create(items)
+        refresh_payroll_summary(company, payroll.created_at_year, payroll.created_at_month)
+        invalidate_payroll_tax_reports(company.id, [(payroll.created_at_year, payroll.created_at_month)])
+        return Response({"payroll": PayRollListSerializer(payroll).data}, status=status.HTTP_201_CREATED)
+
+
+'''
+This View generates the payroll of a period on server side. Payload have the irfp tax
+to apply, the year and month and optionally a list of teams. Amounts of every employee
+of the company (or of the given teams) are computed by Payroll.engine from their
+current salary and the payroll is created with all its items.
+'''
+
+
+class PayRollGenerateAPIView(CompanyPermissionsMixin, generics.CreateAPIView):
+    permission_classes = (permissions.IsAuthenticated, IsCompanyAccess)
+    serializer_class = PayRollGenerateSerializer
+
+    @transaction.atomic
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        company = self.request.company
+        teams_list = data.get("teams_list", [])
+        validate_company_ids(Team, teams_list, company)
+        payroll = generate_payroll(
+            company, data['created_at_year'], data['created_at_month'], data['irfp'], teams_list)
+        refresh_payroll_summary(company, payroll.created_at_year, payroll.created_at_month)
+        invalidate_payroll_tax_reports(company.id, [(payroll.created_at_year, payroll.created_at_month)])
         return Response({"payroll": PayRollListSerializer(payroll).data}, status=status.HTTP_201_CREATED)
 
 
@@ -361,7 +428,9 @@ class PayRollListAPIView(CompanyPermissionsMixin, generics.ListAPIView):
 
 
 '''
-This View is use for returning Payroll Items related to any One payroll.
+This View is use for returning Payroll Items related to any One payroll. Items are
+fetched with their employees and teams in their own queries so the number of queries
+does not grow with the number of items.
 '''
 
 
@@ -370,13 +439,17 @@ class PayRollRetrieveAPIView(CompanyPermissionsMixin, generics.RetrieveAPIView):
     serializer_class = FetchPayrollSerializer
 
     def get_queryset(self):
-        return PayRoll.objects.filter(company=self.request.company)
+        return PayRoll.objects.filter(company=self.request.company).prefetch_related(
+            Prefetch('payroll_items', queryset=PayRollItem.objects.select_related('employee')),
+            'teams_list',
+        )
 
 
 '''
-Here updating payroll Item by firstly checking if payroll exists() then get pay
-roll and then check if payroll company permissions are assigned to current user
-or not if yess then it simply update all parameters related to the payroll item.
+Here updating payroll Item by firstly checking if payroll exists in current company
+then it updates the payroll and compare incoming items with existing ones by employee.
+Only changed items are updated, new ones are created and missing ones are deleted,
+response tells how many rows were created, updated and deleted.
 '''
 
 
@@ -394,32 +467,26 @@ class PayRollItemUpdateAPIView(CompanyPermissionsMixin, generics.UpdateAPIView):
         payroll_items = data.pop('payroll_items')
         teams_list = data.pop('teams_list')
 
-        if not PayRoll.objects.filter(pk=payroll_id, company=company).exists():
+        old_payroll = PayRoll.objects.filter(pk=payroll_id, company=company).first()
+        if old_payroll is None:
             return Response({"message": "Payroll not found"}, status=status.HTTP_404_NOT_FOUND)
-        creation_date = PayRoll.objects.get(id=payroll_id).creation_date
-        payroll = PayRoll(pk=payroll_id, company=company, creation_date=creation_date, **data)
+        validate_company_ids(Team, teams_list, company)
+        validate_company_ids(Employee, [item['employee'] for item in payroll_items], company)
+        payroll = PayRoll(pk=payroll_id, company=company, creation_date=old_payroll.creation_date, **data)
         payroll.save()
 
-        PayrollTeam.objects.filter(payroll=payroll).delete()
-        PayRollItem.objects.filter(payroll=payroll).delete()
-        for team in teams_list:
-            if Team.objects.filter(pk=team, company=company).exists():
-                PayrollTeam.objects.create(payroll=payroll, team_id=team)
-            else:
-                raise Team.DoesNotExist
-        for item in payroll_items:
-            if Employee.objects.filter(pk=item['employee'], company=company).exists():
-                item['employee_id'] = item['employee']
-                del item['employee']
-                PayRollItem.objects.create(
-                    payroll=payroll,
-                    **item,
-                )
-            else:
-                raise Employee.DoesNotExist
+        teams_changes = sync_payroll_teams(payroll, teams_list)
+        items_changes = sync_payroll_items(payroll, payroll_items)
+        periods = [
+            (old_payroll.created_at_year, old_payroll.created_at_month),
+            (payroll.created_at_year, payroll.created_at_month)]
+        refresh_payroll_summaries(company, periods)
+        invalidate_payroll_tax_reports(company.id, periods)
         return Response(
             {"message": "Payroll Updated.",
-                "payroll": PayRollListSerializer(payroll).data},
+                "payroll": PayRollListSerializer(payroll).data,
+                "teams": teams_changes,
+                "items": items_changes},
             status=status.HTTP_200_OK)
 
 
@@ -434,11 +501,17 @@ class PayRollsDeleteAPIView(CompanyPermissionsMixin, generics.DestroyAPIView):
     permission_classes = (permissions.IsAuthenticated, IsCompanyAccess)
     serializer_class = PayrollsDeleteSerializer
 
+    @transaction.atomic
     def delete(self, request, format=None):
         serializer = self.get_serializer(data=self.request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
-        PayRoll.objects.filter(pk__in=data['payrolls_list'], company=self.request.company).delete()
+        company = self.request.company
+        payrolls = PayRoll.objects.filter(pk__in=data['payrolls_list'], company=company)
+        periods = list(payrolls.values_list('created_at_year', 'created_at_month').distinct())
+        # stored tax reports of their quarters are removed by a post_delete receiver
+        payrolls.delete()
+        refresh_payroll_summaries(company, periods)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -451,8 +524,85 @@ class PayRollItemDestroyView(CompanyPermissionsMixin, generics.DestroyAPIView):
     queryset = PayRollItem.objects.all()
     permission_classes = (permissions.IsAuthenticated, IsCompanyAccess)
 
+    @transaction.atomic
     def perform_destroy(self, instance):
         payroll = PayRoll.objects.filter(pk=instance.payroll_id).first()
         company = self.request.company
         if PayRoll.objects.filter(pk=payroll.id, company=company).exists():
             super().perform_destroy(instance)
+            refresh_payroll_summary(company, payroll.created_at_year, payroll.created_at_month)
+            invalidate_payroll_tax_reports(company.id, [(payroll.created_at_year, payroll.created_at_month)])
+
+
+'''
+Year over year trends of payroll costs of current company served from the monthly
+summary table. years param is a comma separated list of years, default is current
+and previous year. Optional team param limits the trends to one team. Each month
+also carries the percent change of company cost against same month of previous year.
+'''
+
+
+class PayRollTrendsAPIView(CompanyPermissionsMixin, generics.GenericAPIView):
+    permission_classes = (permissions.IsAuthenticated, IsCompanyAccess)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            years = [int(year) for year in request.GET.get('years', '').split(',') if year]
+            team = int(request.GET['team']) if request.GET.get('team') else None
+        except ValueError:
+            return Response({"message": "years and team must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+        if not years:
+            current_year = datetime.date.today().year
+            years = [current_year - 1, current_year]
+        return Response({"results": get_payroll_trends(self.request.company, years, team)}, status=status.HTTP_200_OK)
+
+
+'''
+Exporting every payroll item of a year as csv or xlsx. Items are read with a server side
+cursor and employee and team names are joined in the same query, team is the one the
+item was saved with, same as the monthly summary. Rows are written to the response while
+they are fetched so memory does not grow with the number of items.
+Query params: year (default current year) and file_type csv or xlsx (default csv).
+'''
+
+
+class PayRollExportAPIView(CompanyPermissionsMixin, generics.GenericAPIView):
+    permission_classes = (permissions.IsAuthenticated, IsCompanyAccess)
+    export_fields = (
+        ('payroll__id', 'Payroll'),
+        ('payroll__created_at_year', 'Year'),
+        ('payroll__created_at_month', 'Month'),
+        ('employee__nif', 'NIF'),
+        ('employee__name', 'Name'),
+        ('employee__surname', 'Surname'),
+        ('team__team_name', 'Team'),
+        ('irfp', 'IRFP %'),
+        ('gross', 'Gross'),
+        ('bonus', 'Bonus'),
+        ('total_gross', 'Total Gross'),
+        ('irfp_total', 'IRFP Total'),
+        ('ss_employee', 'SS Employee'),
+        ('net', 'Net'),
+        ('ss_company', 'SS Company'),
+        ('discount', 'Discount'),
+        ('company_cost', 'Company Cost'),
+    )
+
+    def get(self, request, *args, **kwargs):
+        try:
+            year = int(request.GET.get('year') or datetime.date.today().year)
+        except ValueError:
+            return Response({"message": "year must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        file_type = request.GET.get('file_type', 'csv')
+        if file_type not in ('csv', 'xlsx'):
+            return Response({"message": "file_type must be csv or xlsx"}, status=status.HTTP_400_BAD_REQUEST)
+        rows = PayRollItem.objects.filter(
+            payroll__company=self.request.company,
+            payroll__created_at_year=year,
+        ).order_by(
+            'payroll__created_at_month', 'payroll_id', 'id'
+        ).values_list(
+            *[field for field, _ in self.export_fields]
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return streaming_export_response(
+            file_type, 'payroll_{}'.format(year), [title for _, title in self.export_fields], rows)
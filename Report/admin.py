@@ -0,0 +1,12 @@
+from django.contrib import admin
+from .models import TaxReportSnapshot
+
+
+# Register your models here.
+
+
+class TaxReportSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['id', 'company', 'year', 'quarter', 'computed_at']
+
+
+admin.site.register(TaxReportSnapshot, TaxReportSnapshotAdmin)
@@ -0,0 +1,64 @@
+import datetime
+from django.db import models
+from django.db.models import Q
+from django.dispatch import receiver
+from django.db.models.signals import post_delete
+from django.core.serializers.json import DjangoJSONEncoder
+from Core.models import Company
+from Expense.models import Expense, Purchase, Asset
+from Payroll.models import PayRoll
+from Sales.models import Invoice
+
+# Create your models here.
+
+
+# Tax report of a closed quarter as returned by the api, see Report.utils.get_tax_report
+class TaxReportSnapshot(models.Model):
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="companyTaxReports")
+    year = models.PositiveIntegerField()
+    quarter = models.PositiveIntegerField()
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'year', 'quarter'], name='unique_company_tax_report_quarter'),
+        ]
+
+
+'''
+Removing stored tax reports of the closed quarters of the given document dates of the
+company, so they are computed again the next time they are asked. Called wherever
+invoices, expenses, purchases, assets or payrolls are written, with both the old and the
+new date of an updated document. Dates of open quarters have no report stored and are
+skipped.
+'''
+
+
+def invalidate_tax_reports(company_id, dates):
+    today = datetime.date.today()
+    quarters = Q()
+    for year, quarter in {(date.year, (date.month - 1) // 3 + 1) for date in dates if date}:
+        if (year, quarter) < (today.year, (today.month - 1) // 3 + 1):
+            quarters |= Q(year=year, quarter=quarter)
+    if quarters:
+        TaxReportSnapshot.objects.filter(quarters, company_id=company_id).delete()
+
+
+@receiver(post_delete, sender=Invoice)
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Purchase)
+@receiver(post_delete, sender=Asset)
+def invalidateDeletedDocumentTaxReports(sender, instance, **kwargs):
+    invalidate_tax_reports(instance.company_id, [instance.invoice_date])
+
+
+# payrolls are dated by year and month, payrolls without them are not in any report
+def invalidate_payroll_tax_reports(company_id, periods):
+    invalidate_tax_reports(
+        company_id, [datetime.date(year, month, 1) for year, month in periods if year and month])
+
+
+@receiver(post_delete, sender=PayRoll)
+def invalidateDeletedPayrollTaxReports(sender, instance, **kwargs):
+    invalidate_payroll_tax_reports(instance.company_id, [(instance.created_at_year, instance.created_at_month)])
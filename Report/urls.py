@@ -0,0 +1,13 @@
+from django.urls import path
+from .views import (
+    TaxReportAPIView,
+    AgingReportAPIView,
+    AgingExportAPIView,
+)
+
+
+urlpatterns = [
+    path('tax/', TaxReportAPIView.as_view()),
+    path('aging/', AgingReportAPIView.as_view()),
+    path('aging/export/', AgingExportAPIView.as_view()),
+]
@@ -0,0 +1,203 @@
+import datetime
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from decimal import Decimal
+from django.db.models import F, Q, Sum, Value, CharField, DecimalField, ExpressionWrapper
+from django.db.models.functions import Coalesce
+from Expense.models import LedgerEntry
+from Payroll.models import PayRoll
+from Sales.models import Invoice
+from .models import TaxReportSnapshot
+
+
+# name, first and last day overdue of every aging bucket, current is not due yet
+AGING_BUCKETS = (
+    ('current', None, 0),
+    ('days_1_30', 1, 30),
+    ('days_31_60', 31, 60),
+    ('days_61_90', 61, 90),
+    ('days_over_90', 91, None),
+)
+
+AMOUNT_FIELD = DecimalField(max_digits=14, decimal_places=2)
+
+
+# decimals and dates as strings, same as data read back from a JSONField
+def as_json(data):
+    return json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+
+
+def quarter_dates(year, quarter):
+    start = datetime.date(year, 3 * quarter - 2, 1)
+    if quarter == 4:
+        return start, datetime.date(year, 12, 31)
+    return start, datetime.date(year, 3 * quarter + 1, 1) - datetime.timedelta(days=1)
+
+
+'''
+Summing base and amount of the queryset grouped by rate in one query. Returning a list of
+rows with rate, base and amount, ordered by rate.
+'''
+
+
+def totals_by_rate(queryset, rate, base, amount):
+    rows = queryset.values(rate=F(rate)).annotate(base=Sum(base), amount=Sum(amount)).order_by('rate')
+    return [{"rate": row['rate'], "base": row['base'], "amount": row['amount']} for row in rows]
+
+
+def total(rows):
+    return sum((row['amount'] for row in rows), 0)
+
+
+'''
+Computing the VAT and withholding report of a quarter for a company with grouped
+aggregates only. Output VAT and equivalence surcharge come from invoices, input VAT and
+retentions from the expense ledger and withholding of employees from payrolls of the
+quarter months. Every section is a list of totals by rate.
+'''
+
+
+def compute_tax_report(company, year, quarter):
+    start, end = quarter_dates(year, quarter)
+    invoices = Invoice.objects.filter(company=company, invoice_date__range=(start, end))
+    ledger = LedgerEntry.objects.filter(company=company, invoice_date__range=(start, end))
+    payrolls = PayRoll.objects.filter(
+        company=company, created_at_year=year, created_at_month__range=(3 * quarter - 2, 3 * quarter))
+
+    output_vat = totals_by_rate(invoices, 'vat_percentage__vat', 'base_amount', 'vat_total')
+    equivalence_surcharge = totals_by_rate(
+        invoices.filter(equiv_percentage__isnull=False), 'equiv_percentage__equiv', 'base_amount', 'equiv_total')
+    input_vat = totals_by_rate(ledger, 'vat_rate', 'base_amount', 'vat_amount')
+    retentions = totals_by_rate(ledger.filter(ret_rate__isnull=False), 'ret_rate', 'base_amount', 'ret_amount')
+    payroll_withholding = totals_by_rate(payrolls, 'irfp', 'total_gross', 'irfp_total')
+    return {
+        "year": year,
+        "quarter": quarter,
+        "start": start,
+        "end": end,
+        "output_vat": output_vat,
+        "equivalence_surcharge": equivalence_surcharge,
+        "input_vat": input_vat,
+        "withholding": {
+            "retentions": retentions,
+            "payroll": payroll_withholding,
+        },
+        "totals": {
+            "output_vat": total(output_vat),
+            "equivalence_surcharge": total(equivalence_surcharge),
+            "input_vat": total(input_vat),
+            "vat_result": total(output_vat) + total(equivalence_surcharge) - total(input_vat),
+            "withholding": total(retentions) + total(payroll_withholding),
+        },
+    }
+
+
+'''
+Returning the tax report of the quarter with amounts as strings. Reports of closed
+quarters are stored in TaxReportSnapshot and served from there until a document of the
+quarter is written, see Report.models.invalidate_tax_reports, refresh computes and stores
+them again anyway. Open quarters are always computed.
+'''
+
+
+def get_tax_report(company, year, quarter, refresh=False):
+    closed = quarter_dates(year, quarter)[1] < datetime.date.today()
+    if closed and not refresh:
+        snapshot = TaxReportSnapshot.objects.filter(company=company, year=year, quarter=quarter).first()
+        if snapshot is not None:
+            return snapshot.data
+    # same representation as a report read back from a snapshot
+    report = as_json(compute_tax_report(company, year, quarter))
+    if closed:
+        TaxReportSnapshot.objects.update_or_create(
+            company=company, year=year, quarter=quarter, defaults={'data': report})
+    return report
+
+
+def aging_bucket(days_overdue):
+    for name, first, last in AGING_BUCKETS:
+        if (first is None or days_overdue >= first) and (last is None or days_overdue <= last):
+            return name
+
+
+'''
+Open amount of every contact split in aging buckets by the due date of documents, in one
+grouped query. contact is the field of the contact, returned as contact, and amount is
+the expression of the open amount of a row of queryset.
+'''
+
+
+def aging_by_contact(queryset, as_of, contact, contact_name, amount):
+    buckets = {}
+    for name, first, last in AGING_BUCKETS:
+        due = Q()
+        if first is not None:
+            due &= Q(due_date__lte=as_of - datetime.timedelta(days=first))
+        if last is not None:
+            due &= Q(due_date__gte=as_of - datetime.timedelta(days=last))
+        buckets[name] = Coalesce(Sum(amount, filter=due), Value(Decimal('0.00')), output_field=AMOUNT_FIELD)
+    if contact == 'contact':
+        rows = queryset.values('contact', contact_name=F(contact_name))
+    else:
+        rows = queryset.values(contact=F(contact), contact_name=F(contact_name))
+    rows = rows.annotate(
+        **buckets, total=Sum(amount, output_field=AMOUNT_FIELD)).order_by('contact_name', 'contact')
+    return list(rows)
+
+
+def receivables(company):
+    return Invoice.objects.filter(company=company).exclude(status="Paid")
+
+
+def payable_amount():
+    return ExpressionWrapper(F('base_amount') + F('vat_amount') - F('ret_amount'), output_field=AMOUNT_FIELD)
+
+
+'''
+Aging of open receivables (invoices which are not paid) and payables (expense, purchase
+and asset ledger) of the company at the as_of date. Documents of the expense side have no
+payment status yet so all of them are counted as open.
+'''
+
+
+def compute_aging_report(company, as_of):
+    receivable_rows = aging_by_contact(receivables(company), as_of, 'client', 'client__name', F('total'))
+    payable_rows = aging_by_contact(
+        LedgerEntry.objects.filter(company=company), as_of, 'contact', 'contact__name', payable_amount())
+    bucket_names = [name for name, first, last in AGING_BUCKETS] + ['total']
+
+    def totals(rows):
+        return {name: sum((row[name] for row in rows), Decimal('0.00')) for name in bucket_names}
+    return as_json({
+        "as_of": as_of,
+        "receivables": receivable_rows,
+        "payables": payable_rows,
+        "totals": {
+            "receivables": totals(receivable_rows),
+            "payables": totals(payable_rows),
+        },
+    })
+
+
+'''
+Detail rows of the aging report for the streaming export, one row per open invoice or per
+expense document, with days overdue and bucket. Rows are read with a server side cursor.
+'''
+
+
+def aging_detail_rows(company, as_of, side, chunk_size):
+    if side == 'payables':
+        documents = LedgerEntry.objects.filter(company=company).values(
+            'document_type', 'document_id', 'accounting_seat', 'contact__contact_id', 'contact__name',
+            'invoice_date', 'due_date',
+        ).annotate(amount=Sum(payable_amount())).order_by('due_date', 'document_type', 'document_id')
+        fields = ['document_type', 'accounting_seat', 'contact__contact_id', 'contact__name', 'invoice_date',
+                  'due_date', 'amount']
+    else:
+        documents = receivables(company).annotate(document_type=Value('invoice', output_field=CharField())).values(
+            'document_type', 'id', 'client__contact_id', 'client__name', 'invoice_date', 'due_date', 'total',
+        ).order_by('due_date', 'id')
+        fields = ['document_type', 'id', 'client__contact_id', 'client__name', 'invoice_date', 'due_date', 'total']
+    for document in documents.iterator(chunk_size=chunk_size):
+        days_overdue = (as_of - document['due_date']).days
+        yield [document[field] for field in fields] + [days_overdue, aging_bucket(days_overdue)]
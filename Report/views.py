@@ -0,0 +1,78 @@
+import datetime
+from rest_framework import generics
+from rest_framework import permissions
+from rest_framework import status
+from rest_framework.response import Response
+from Middleware.CustomMixin import CompanyPermissionsMixin
+from Middleware.permissions import IsCompanyAccess
+from utils.export import streaming_export_response, EXPORT_CHUNK_SIZE
+from .utils import get_tax_report, compute_aging_report, aging_detail_rows
+
+
+'''
+Quarterly VAT and withholding report of the company. Query params: year and quarter
+(default current ones) and refresh=1 to compute again a closed quarter which is cached.
+'''
+
+
+class TaxReportAPIView(CompanyPermissionsMixin, generics.GenericAPIView):
+    permission_classes = (permissions.IsAuthenticated, IsCompanyAccess)
+
+    def get(self, request, *args, **kwargs):
+        today = datetime.date.today()
+        try:
+            year = int(request.GET.get('year') or today.year)
+            quarter = int(request.GET.get('quarter') or (today.month + 2) // 3)
+        except ValueError:
+            return Response({"message": "year and quarter must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= quarter <= 4 or not 2000 <= year <= today.year:
+            return Response({"message": "Invalid year or quarter"}, status=status.HTTP_400_BAD_REQUEST)
+        refresh = request.GET.get('refresh') == '1'
+        return Response(get_tax_report(self.request.company, year, quarter, refresh), status=status.HTTP_200_OK)
+
+
+def get_as_of(request):
+    return datetime.date.fromisoformat(request.GET['date']) if request.GET.get('date') else datetime.date.today()
+
+
+'''
+Aging of open receivables and payables of the company by contact in buckets of days
+overdue. Query param date (YYYY-MM-DD, default today) is the day the aging is computed at.
+'''
+
+
+class AgingReportAPIView(CompanyPermissionsMixin, generics.GenericAPIView):
+    permission_classes = (permissions.IsAuthenticated, IsCompanyAccess)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            as_of = get_as_of(request)
+        except ValueError:
+            return Response({"message": "date must be YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(compute_aging_report(self.request.company, as_of), status=status.HTTP_200_OK)
+
+
+'''
+Streaming the documents behind the aging report as csv or xlsx. Query params: side
+(receivables or payables), date and file_type (csv or xlsx).
+'''
+
+
+class AgingExportAPIView(CompanyPermissionsMixin, generics.GenericAPIView):
+    permission_classes = (permissions.IsAuthenticated, IsCompanyAccess)
+    header = ['Type', 'Document', 'Contact Id', 'Contact', 'Invoice Date', 'Due Date', 'Amount', 'Days Overdue',
+              'Bucket']
+
+    def get(self, request, *args, **kwargs):
+        try:
+            as_of = get_as_of(request)
+        except ValueError:
+            return Response({"message": "date must be YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        side = request.GET.get('side', 'receivables')
+        file_type = request.GET.get('file_type', 'csv')
+        if side not in ('receivables', 'payables') or file_type not in ('csv', 'xlsx'):
+            return Response(
+                {"message": "side must be receivables or payables and file_type csv or xlsx"},
+                status=status.HTTP_400_BAD_REQUEST)
+        rows = aging_detail_rows(self.request.company, as_of, side, EXPORT_CHUNK_SIZE)
+        return streaming_export_response(file_type, 'aging_{}_{}'.format(side, as_of), self.header, rows)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Invoice, InvoiceItem
+from .models import Invoice, InvoiceItem, RecurringInvoice, RecurringInvoiceItem
 
 
 # Register your models here.
@@ -12,7 +12,20 @@ class InvoiceItemAdmin(admin.TabularInline):
 
 class InvoiceAdmin(admin.ModelAdmin):
     inlines = [InvoiceItemAdmin, ]
-    list_display = ['id', 'company', 'invoice_date', 'due_date', 'creation_date', 'status']
+    list_display = ['id', 'company', 'series', 'number', 'invoice_date', 'due_date', 'creation_date', 'status']
 
 
 admin.site.register(Invoice, InvoiceAdmin)
+
+
+class RecurringInvoiceItemAdmin(admin.TabularInline):
+    model = RecurringInvoiceItem
+    extra = 0
+
+
+class RecurringInvoiceAdmin(admin.ModelAdmin):
+    inlines = [RecurringInvoiceItemAdmin, ]
+    list_display = ['id', 'company', 'client', 'series', 'start_date', 'end_date', 'active']
+
+
+admin.site.register(RecurringInvoice, RecurringInvoiceAdmin)
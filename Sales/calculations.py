@@ -0,0 +1,95 @@
+from collections import defaultdict
+from decimal import Decimal
+from Report.models import invalidate_tax_reports
+from .models import Invoice, InvoiceItem
+
+
+'''
+Invoice calculations deriving line bases and header totals on server side from quantity,
+price and discount of the items and the Tax rates of the invoice. Amounts are computed in
+integer cents and rates in hundredths of percent, rounding half up to the cent, so there
+is no float rounding and the header always matches its lines.
+'''
+
+
+def to_cents(amount):
+    return int((Decimal(amount or 0) * 100).to_integral_value())
+
+
+def to_rate(percent):
+    return int((Decimal(percent or 0) * 100).to_integral_value())
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def apply_rate(cents, rate):
+    return (cents * rate + 5000) // 10000
+
+
+'''
+Computing in one pass the base of every line, given as (quantity, price in cents,
+discount in hundredths of percent), and the totals of the invoice. VAT and equivalence
+surcharge apply to the sum of the bases. Returning the list of bases and a dict of
+totals, all in cents.
+'''
+
+
+def compute_invoice(lines, vat_rate, equiv_rate):
+    bases = [quantity * price - apply_rate(quantity * price, discount) for quantity, price, discount in lines]
+    base_amount = sum(bases)
+    vat_total = apply_rate(base_amount, vat_rate)
+    equiv_total = apply_rate(base_amount, equiv_rate)
+    totals = {
+        'base_amount': base_amount,
+        'vat_total': vat_total,
+        'equiv_total': equiv_total,
+        'total': base_amount + vat_total + equiv_total,
+    }
+    return bases, totals
+
+
+'''
+Setting base of the items and totals of the invoice, both model instances. The taxes of
+the invoice are read from its vat_percentage and equiv_percentage, which should already
+be loaded. Nothing is saved.
+'''
+
+
+def apply_invoice_totals(invoice, items):
+    bases, totals = compute_invoice(
+        [(item.quantity, to_cents(item.price), to_rate(item.discount_percentage)) for item in items],
+        to_rate(invoice.vat_percentage.vat if invoice.vat_percentage else 0),
+        to_rate(invoice.equiv_percentage.equiv if invoice.equiv_percentage else 0),
+    )
+    for item, base in zip(items, bases):
+        item.base = from_cents(base)
+    for field, cents in totals.items():
+        setattr(invoice, field, from_cents(cents))
+
+
+'''
+Recalculating the stored bases and totals of many invoices at once. Invoices with their
+taxes and all their items are loaded in two queries and written back with two
+bulk_update, whatever the number of invoices, and stored tax reports of their closed
+quarters are removed. Returning the number of invoices.
+'''
+
+
+def recalculate_invoice_totals(invoice_ids):
+    invoices = list(Invoice.objects.filter(pk__in=invoice_ids).select_related('vat_percentage', 'equiv_percentage'))
+    items_by_invoice = defaultdict(list)
+    items = list(InvoiceItem.objects.filter(invoice_id__in=invoice_ids).order_by('id'))
+    for item in items:
+        items_by_invoice[item.invoice_id].append(item)
+    for invoice in invoices:
+        apply_invoice_totals(invoice, items_by_invoice[invoice.id])
+    InvoiceItem.objects.bulk_update(items, ['base'], batch_size=1000)
+    Invoice.objects.bulk_update(invoices, ['base_amount', 'vat_total', 'equiv_total', 'total'], batch_size=1000)
+    dates_by_company = defaultdict(list)
+    for invoice in invoices:
+        dates_by_company[invoice.company_id].append(invoice.invoice_date)
+    for company_id, dates in dates_by_company.items():
+        invalidate_tax_reports(company_id, dates)
+    return len(invoices)
@@ -6,6 +6,8 @@ class InvoiceFilter(FilterSet):
     class Meta:
         model = Invoice
         fields = {
+            "series": ['exact'],
+            "number": ['exact'],
             "due_date": ['exact'],
             "total": ['gt', 'lt'],
             "status__id": ["exact"],
@@ -0,0 +1,28 @@
+import datetime
+from django.core.management.base import BaseCommand
+from Core.models import Company
+from Sales.recurring import generate_recurring_invoices
+
+
+'''
+Generating invoices of recurring invoices for a month, by default the current one, meant
+to run every day or every month from a scheduler. A month already invoiced is skipped.
+'''
+
+
+class Command(BaseCommand):
+    help = 'Generate the invoices of recurring invoices of every company or of the given companies.'
+
+    def add_arguments(self, parser):
+        today = datetime.date.today()
+        parser.add_argument('--company', type=int, action='append', help='id of company to invoice, repeatable')
+        parser.add_argument('--year', type=int, default=today.year)
+        parser.add_argument('--month', type=int, default=today.month)
+
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options['company']:
+            companies = companies.filter(pk__in=options['company'])
+        for company in companies.iterator():
+            invoices = generate_recurring_invoices(company, options['year'], options['month'])
+            self.stdout.write('Generated {} invoices of company {}'.format(len(invoices), company.id))
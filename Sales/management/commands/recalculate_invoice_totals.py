@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from Core.models import Company
+from Sales.models import Invoice
+from Sales.calculations import recalculate_invoice_totals
+from utils.export import chunked
+
+
+'''
+Recalculating item bases and totals of existing invoices, needed once for invoices saved
+while totals were taken from the client. Every batch is recalculated in its own
+transaction.
+'''
+
+
+class Command(BaseCommand):
+    help = 'Recalculate invoice totals of every company or of the given companies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', help='id of company to recalculate, repeatable')
+        parser.add_argument('--batch-size', type=int, default=1000, help='number of invoices per batch')
+
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options['company']:
+            companies = companies.filter(pk__in=options['company'])
+        for company in companies.iterator():
+            invoice_ids = list(Invoice.objects.filter(company=company).order_by('id').values_list('id', flat=True))
+            count = 0
+            for batch in chunked(invoice_ids, options['batch_size']):
+                with transaction.atomic():
+                    count += recalculate_invoice_totals(batch)
+            self.stdout.write('Recalculated {} invoices of company {}'.format(count, company.id))
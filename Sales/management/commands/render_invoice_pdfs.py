@@ -0,0 +1,30 @@
+import datetime
+from django.core.management.base import BaseCommand
+from Core.models import Company
+from Sales.pdf import month_invoice_batches, render_missing_invoice_pdfs
+
+
+'''
+Rendering the PDFs of invoices of a month which are not rendered yet, by default the
+current month, meant to run from a scheduler so downloads only read storage.
+'''
+
+
+class Command(BaseCommand):
+    help = 'Render missing invoice PDFs of a month of every company or of the given companies.'
+
+    def add_arguments(self, parser):
+        today = datetime.date.today()
+        parser.add_argument('--company', type=int, action='append', help='id of company to render, repeatable')
+        parser.add_argument('--year', type=int, default=today.year)
+        parser.add_argument('--month', type=int, default=today.month)
+
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options['company']:
+            companies = companies.filter(pk__in=options['company'])
+        for company in companies.iterator():
+            rendered = 0
+            for invoices in month_invoice_batches(company, options['year'], options['month']):
+                rendered += render_missing_invoice_pdfs(invoices)
+            self.stdout.write('Rendered {} invoice PDFs of company {}'.format(rendered, company.id))
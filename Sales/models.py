@@ -15,6 +15,15 @@ class Invoice(models.Model):
     # creation_year = models.PositiveIntegerField(
     #     validators=[MinValueValidator(2020), max_value_current_year], blank=True, null=True)
     creation_date = models.DateField(auto_now_add=True)
+    # legal numbering, numbers of a series are gap free for each company
+    series = models.CharField(max_length=10, blank=True, default='')
+    number = models.PositiveIntegerField(blank=True, null=True)
+    # recurring invoice which generated the invoice, one invoice per month
+    recurring_invoice = models.ForeignKey(
+        'RecurringInvoice', on_delete=models.SET_NULL,
+        related_name='generated_invoices', null=True, blank=True)
+    # storage name of the last rendered pdf, see Sales.pdf
+    pdf_name = models.CharField(max_length=255, blank=True, default='')
     status = models.CharField(max_length=50, default="Pending")
     # status = models.ForeignKey(
     #     LookupName, on_delete=models.SET_NULL,
@@ -54,6 +63,16 @@ class Invoice(models.Model):
         LookupName, on_delete=models.SET_NULL,
         related_name='invoice_shipping_country_name', null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', '-id']),
+            models.Index(fields=['company', 'due_date']),
+            models.Index(fields=['company', 'invoice_date']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'series', 'number'], name='unique_company_invoice_number'),
+        ]
+
 
 class InvoiceItem(models.Model):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='invoice_items')
@@ -62,3 +81,45 @@ class InvoiceItem(models.Model):
     price = models.DecimalField(max_digits=8, decimal_places=2,)
     discount_percentage = models.DecimalField(max_digits=5, decimal_places=2,)
     base = models.DecimalField(max_digits=8, decimal_places=2, )
+
+
+# Invoice issued to the client every month by Sales.recurring, from start_date until end_date
+class RecurringInvoice(models.Model):
+    creation_date = models.DateField(auto_now_add=True)
+    company = models.ForeignKey(
+        Company, on_delete=models.CASCADE,
+        related_name='company_recurring_invoice')
+    client = models.ForeignKey(Contact, on_delete=models.PROTECT, related_name='recurringInvoiceContacts')
+    series = models.CharField(max_length=10, blank=True, default='')
+    # day of month of the invoices, last day of the month when it is shorter
+    day_of_month = models.PositiveSmallIntegerField(default=1, validators=[MaxValueValidator(31)])
+    start_date = models.DateField()
+    end_date = models.DateField(blank=True, null=True)
+    active = models.BooleanField(default=True)
+    vat_percentage = models.ForeignKey(
+        Tax, on_delete=models.SET_NULL,
+        related_name='recurring_invoice_vat_tax', null=True, blank=True)
+    equiv_percentage = models.ForeignKey(
+        Tax, on_delete=models.SET_NULL,
+        related_name='recurring_invoice_ret_tax', null=True, blank=True)
+    payment_method = models.ForeignKey(
+        LookupName, on_delete=models.SET_NULL,
+        related_name='recurring_invoice_payment_method_name', null=True, blank=True)
+    iban = models.CharField(max_length=34, blank=True, null=True)
+    tax_country = models.ForeignKey(
+        LookupName, on_delete=models.PROTECT,
+        related_name='recurring_invoice_tax_country_name',)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', '-id']),
+        ]
+
+
+class RecurringInvoiceItem(models.Model):
+    recurring_invoice = models.ForeignKey(
+        RecurringInvoice, on_delete=models.CASCADE, related_name='recurring_invoice_items')
+    quantity = models.PositiveIntegerField()
+    description = models.TextField()
+    price = models.DecimalField(max_digits=8, decimal_places=2,)
+    discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0)
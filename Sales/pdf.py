@@ -0,0 +1,345 @@
+import atexit
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import get_storage_class
+from django.template.loader import render_to_string
+from utils.export import chunked
+from .models import Invoice
+
+logger = logging.getLogger(__name__)
+
+
+'''
+Rendering invoice PDFs. The invoice is rendered as text with the sales/invoice_pdf.txt
+template and laid out in a PDF by a minimal writer using the built in Courier font, in a
+pool of processes. Rendered files are kept in INVOICE_PDF_STORAGE under a hash of
+everything printed, and the invoice keeps the name of its last rendered file in pdf_name,
+so whether an invoice changed since is known without asking the storage.
+
+Downloads are served only from storage, missing files are rendered in the background
+and the caller asks again. The render_invoice_pdfs command renders the missing files of
+a month in batches in the pool and waits for them, so downloads find them stored.
+'''
+
+# bump when the template or the writer changes so cached files are rendered again
+PDF_VERSION = 1
+
+# invoices loaded together, and rendered together by render_invoice_pdfs
+PDF_BATCH_SIZE = 200
+
+PDF_PAGE_WIDTH = 595
+PDF_PAGE_HEIGHT = 842
+PDF_MARGIN = 50
+PDF_FONT_SIZE = 9
+PDF_LEADING = 12
+PDF_PAGE_LINES = (PDF_PAGE_HEIGHT - 2 * PDF_MARGIN) // PDF_LEADING
+# Courier characters are 0.6 em wide
+PDF_LINE_CHARS = int((PDF_PAGE_WIDTH - 2 * PDF_MARGIN) / (PDF_FONT_SIZE * 0.6))
+
+
+def pdf_text(line):
+    line = line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return line.encode('cp1252', errors='replace')
+
+
+def pdf_page_content(lines):
+    content = [b'BT /F1 %d Tf %d TL %d %d Td' % (
+        PDF_FONT_SIZE, PDF_LEADING, PDF_MARGIN, PDF_PAGE_HEIGHT - PDF_MARGIN)]
+    content += [b'(' + pdf_text(line) + b') Tj T*' for line in lines]
+    content.append(b'ET')
+    return b'\n'.join(content)
+
+
+'''
+Writing a PDF document of the text lines, wrapped to the page width and split in A4
+pages. Objects are the catalog, the page tree, the font and a page and its content
+stream for every page, followed by the cross reference table of their offsets.
+'''
+
+
+def build_pdf(lines):
+    lines = [line.rstrip() for line in lines]
+    lines = [
+        line[start:start + PDF_LINE_CHARS] for line in lines for start in range(0, len(line) or 1, PDF_LINE_CHARS)]
+    pages = list(chunked(lines, PDF_PAGE_LINES)) or [[]]
+    page_ids = [4 + 2 * index for index in range(len(pages))]
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [' + b' '.join(b'%d 0 R' % page_id for page_id in page_ids)
+        + b'] /Count %d >>' % len(pages),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>',
+    ]
+    for page_id, page in zip(page_ids, pages):
+        content = pdf_page_content(page)
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> '
+            b'/Contents %d 0 R >>' % (PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT, page_id + 1))
+        objects.append(b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream')
+
+    document = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, content in enumerate(objects, 1):
+        offsets.append(len(document))
+        document += b'%d 0 obj\n' % number + content + b'\nendobj\n'
+    xref = len(document)
+    document += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    document += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    document += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(document)
+
+
+# runs in the processes of the pool, context only holds strings so it is cheap to send
+def render_invoice_pdf(context):
+    return build_pdf(render_to_string('sales/invoice_pdf.txt', context).splitlines())
+
+
+render_pool = None
+render_pool_lock = threading.Lock()
+
+# names of files being rendered in the background by this process
+pending_renders = set()
+pending_renders_lock = threading.Lock()
+
+
+def get_render_pool():
+    global render_pool
+    with render_pool_lock:
+        if render_pool is None:
+            render_pool = ProcessPoolExecutor(max_workers=settings.INVOICE_PDF_WORKERS, initializer=django.setup)
+            atexit.register(render_pool.shutdown)
+    return render_pool
+
+
+def get_pdf_storage():
+    return get_storage_class(settings.INVOICE_PDF_STORAGE)()
+
+
+'''
+Everything printed on the PDF of the invoice as strings. The invoice should come from
+invoice_pdf_queryset so its labels and items are already loaded.
+'''
+
+
+def invoice_context(invoice):
+    return {
+        'number': '{}{}'.format(invoice.series, invoice.number or invoice.id),
+        'company': invoice.company.name,
+        'invoice_date': str(invoice.invoice_date),
+        'due_date': str(invoice.due_date),
+        'client_name': invoice.client.name,
+        'client_id': invoice.client.contact_id,
+        'client_nif': invoice.client.nif,
+        'tax_address': invoice.tax_address or '',
+        'tax_postcode': invoice.tax_postcode or '',
+        'tax_province': invoice.tax_province or '',
+        'items': [{
+            'quantity': str(item.quantity),
+            'description': item.description,
+            'price': str(item.price),
+            'discount_percentage': str(item.discount_percentage),
+            'base': str(item.base),
+        } for item in invoice.invoice_items.all()],
+        'base_amount': str(invoice.base_amount),
+        'vat_label': 'VAT {} %'.format(invoice.vat_percentage.vat if invoice.vat_percentage else 0),
+        'vat_total': str(invoice.vat_total),
+        'equiv_label': 'Equivalence {} %'.format(invoice.equiv_percentage.equiv if invoice.equiv_percentage else 0),
+        'equiv_total': str(invoice.equiv_total),
+        'total': str(invoice.total),
+        'payment_method': invoice.payment_method.lookup_name if invoice.payment_method else '',
+        'iban': invoice.iban or '',
+    }
+
+
+def invoice_pdf_name(invoice, context):
+    content_hash = hashlib.sha256(json.dumps([PDF_VERSION, context], sort_keys=True).encode()).hexdigest()
+    return 'invoices/{}/{}.pdf'.format(invoice.company_id, content_hash)
+
+
+def invoice_pdf_queryset():
+    return Invoice.objects.select_related(
+        'company', 'client', 'payment_method', 'vat_percentage', 'equiv_percentage',
+    ).prefetch_related('invoice_items')
+
+
+'''
+Storing a rendered file under its name. Files are named by what is printed on them, so
+an existing file is the same PDF and is kept. Storages which do not overwrite store a
+file saved meanwhile by another process under a suffixed name, that copy is removed.
+Returning the name of the stored file.
+'''
+
+
+def save_invoice_pdf(storage, name, content):
+    if storage.exists(name):
+        return name
+    saved_name = storage.save(name, ContentFile(content))
+    if saved_name != name and storage.exists(name):
+        storage.delete(saved_name)
+        return name
+    return saved_name
+
+
+'''
+Submitting the rendering of a file to the pool without waiting for it, the file is
+stored when it is rendered. A file already being rendered is not submitted again.
+The callback runs in a thread of the pool so errors are logged, the next request for
+the file submits it again.
+'''
+
+
+def render_invoice_pdf_later(name, context):
+    with pending_renders_lock:
+        if name in pending_renders:
+            return
+        pending_renders.add(name)
+    storage = get_pdf_storage()
+
+    def store(future):
+        try:
+            save_invoice_pdf(storage, name, future.result())
+        except Exception:
+            logger.exception('Rendering invoice pdf %s failed', name)
+        finally:
+            with pending_renders_lock:
+                pending_renders.discard(name)
+    get_render_pool().submit(render_invoice_pdf, context).add_done_callback(store)
+
+
+# stored content of the file, None when it can not be read, for instance after a purge
+def read_invoice_pdf(storage, name):
+    try:
+        with storage.open(name, 'rb') as pdf_file:
+            return pdf_file.read()
+    except Exception:
+        logger.warning('Stored invoice pdf %s could not be read', name, exc_info=True)
+        return None
+
+
+'''
+Returning the stored pdf of the invoice, or None when it is not rendered yet, its
+rendering is then started in the background. Storage is only asked whether the file
+exists when the invoice changed since its last rendered file. A file which can not be
+read anymore is forgotten and rendered again.
+'''
+
+
+def get_stored_invoice_pdf(invoice):
+    context = invoice_context(invoice)
+    name = invoice_pdf_name(invoice, context)
+    storage = get_pdf_storage()
+    if invoice.pdf_name != name:
+        if not storage.exists(name):
+            render_invoice_pdf_later(name, context)
+            return None
+        Invoice.objects.filter(pk=invoice.id).update(pdf_name=name)
+    content = read_invoice_pdf(storage, name)
+    if content is None:
+        Invoice.objects.filter(pk=invoice.id).update(pdf_name='')
+        render_invoice_pdf_later(name, context)
+    return content
+
+
+'''
+Rendering together in the pool the invoices which changed since their last rendered
+file, waiting for them, storing them and saving their new names with one bulk_update.
+Afterwards pdf_name of every invoice is its current file. Used by the
+render_invoice_pdfs command, requests only submit renders. Returning the number of
+rendered invoices.
+'''
+
+
+def render_missing_invoice_pdfs(invoices):
+    missing = []
+    for invoice in invoices:
+        context = invoice_context(invoice)
+        name = invoice_pdf_name(invoice, context)
+        if invoice.pdf_name != name:
+            missing.append((invoice, context, name))
+    if not missing:
+        return 0
+
+    storage = get_pdf_storage()
+    contents = get_render_pool().map(render_invoice_pdf, [context for invoice, context, name in missing])
+    for (invoice, context, name), content in zip(missing, contents):
+        invoice.pdf_name = save_invoice_pdf(storage, name, content)
+    Invoice.objects.bulk_update([invoice for invoice, context, name in missing], ['pdf_name'])
+    return len(missing)
+
+
+def month_invoice_batches(company, year, month):
+    invoice_ids = list(Invoice.objects.filter(
+        company=company, invoice_date__year=year, invoice_date__month=month,
+    ).order_by('id').values_list('id', flat=True))
+    for batch in chunked(invoice_ids, PDF_BATCH_SIZE):
+        yield list(invoice_pdf_queryset().filter(pk__in=batch).order_by('id'))
+
+
+# names of every stored file of the company with one listing of its folder
+def stored_invoice_pdf_names(storage, company_id):
+    folder = 'invoices/{}'.format(company_id)
+    try:
+        return {'{}/{}'.format(folder, file_name) for file_name in storage.listdir(folder)[1]}
+    except FileNotFoundError:
+        return set()
+
+
+'''
+Making sure every invoice of the company dated in the month has a stored file before
+the month is downloaded. Invoices which changed since their last rendered file take
+the file if it is already stored, found with one listing of the storage, and are
+submitted to the pool otherwise, without waiting for them. Returning the number of
+submitted files, the month can be downloaded when it is 0.
+'''
+
+
+def queue_month_invoice_pdfs(company, year, month):
+    storage = get_pdf_storage()
+    stored = None
+    queued = 0
+    for invoices in month_invoice_batches(company, year, month):
+        found = []
+        for invoice in invoices:
+            context = invoice_context(invoice)
+            name = invoice_pdf_name(invoice, context)
+            if invoice.pdf_name == name:
+                continue
+            if stored is None:
+                stored = stored_invoice_pdf_names(storage, company.id)
+            if name in stored:
+                invoice.pdf_name = name
+                found.append(invoice)
+            else:
+                render_invoice_pdf_later(name, context)
+                queued += 1
+        Invoice.objects.bulk_update(found, ['pdf_name'])
+    return queued
+
+
+'''
+Yielding (file name, pdf content) of every invoice of the company dated in the month
+from storage, one file at a time so memory does not depend on the number of invoices.
+Should follow queue_month_invoice_pdfs, a file which can not be read anymore is
+rendered again in this process so the archive is never cut.
+'''
+
+
+def month_invoice_pdfs(company, year, month):
+    storage = get_pdf_storage()
+    invoices = list(Invoice.objects.filter(
+        company=company, invoice_date__year=year, invoice_date__month=month,
+    ).order_by('id').values_list('id', 'pdf_name'))
+    for invoice_id, pdf_name in invoices:
+        content = read_invoice_pdf(storage, pdf_name) if pdf_name else None
+        if content is None:
+            invoice = invoice_pdf_queryset().get(pk=invoice_id)
+            context = invoice_context(invoice)
+            content = render_invoice_pdf(context)
+            name = save_invoice_pdf(storage, invoice_pdf_name(invoice, context), content)
+            Invoice.objects.filter(pk=invoice_id).update(pdf_name=name)
+        yield 'invoice-{}.pdf'.format(invoice_id), content
@@ -0,0 +1,81 @@
+import calendar
+import datetime
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from Report.models import invalidate_tax_reports
+from .calculations import apply_invoice_totals
+from .models import Invoice, InvoiceItem, RecurringInvoice
+from .utils import get_invoice_numbers
+
+# rows inserted by one INSERT of the bulk_create of invoices and items
+RECURRING_BATCH_SIZE = 1000
+
+
+'''
+Generating the invoices of the month for every active recurring invoice of the company
+which covers the month and has no invoice dated in it yet, so months can be generated in
+any order and never twice. Recurring invoices of the company are locked first, in their
+own query, so a concurrent generation waits and then sees the invoices already created.
+Recurring invoices with their client, payment days, taxes and items are loaded in two
+queries, numbers of every series are allocated at once, and invoices and items are
+inserted with bulk_create, so the number of queries does not depend on the number of
+invoices. Due dates are the invoice date plus the payment days of the client. Returning
+the created invoices.
+'''
+
+
+@transaction.atomic
+def generate_recurring_invoices(company, year, month):
+    period = datetime.date(year, month, 1)
+    last_day = calendar.monthrange(year, month)[1]
+    invoiced = Invoice.objects.filter(
+        recurring_invoice=OuterRef('pk'), invoice_date__range=(period, period.replace(day=last_day)))
+    # lock taken before reading which months are invoiced
+    list(RecurringInvoice.objects.filter(company=company, active=True).select_for_update().values_list('id'))
+    recurring_invoices = list(RecurringInvoice.objects.filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=period),
+        ~Exists(invoiced),
+        company=company, active=True, start_date__lte=period.replace(day=last_day),
+    ).select_related(
+        'client', 'client__payment_extension', 'vat_percentage', 'equiv_percentage',
+    ).prefetch_related('recurring_invoice_items').order_by('id'))
+
+    by_series = defaultdict(list)
+    for recurring_invoice in recurring_invoices:
+        by_series[recurring_invoice.series].append(recurring_invoice)
+
+    invoices = []
+    items = []
+    for series, series_recurring_invoices in by_series.items():
+        first_number = get_invoice_numbers(company, series, len(series_recurring_invoices))
+        for number, recurring_invoice in enumerate(series_recurring_invoices, first_number):
+            client = recurring_invoice.client
+            invoice_date = period.replace(day=min(recurring_invoice.day_of_month or 1, last_day))
+            payment_days = client.payment_extension.day if client.payment_extension else 0
+            invoice = Invoice(
+                company=company, client=client, series=series, number=number, recurring_invoice=recurring_invoice,
+                invoice_date=invoice_date, due_date=invoice_date + datetime.timedelta(days=payment_days),
+                vat_percentage=recurring_invoice.vat_percentage, equiv_percentage=recurring_invoice.equiv_percentage,
+                payment_method_id=recurring_invoice.payment_method_id, iban=recurring_invoice.iban,
+                tax_address=client.tax_address, tax_postcode=client.tax_postcode,
+                tax_province=client.tax_province, tax_country_id=recurring_invoice.tax_country_id,
+                shipping_address=client.shipping_address, shipping_postcode=client.shipping_postcode,
+                shipping_province=client.shipping_province, shipping_country_id=client.shipping_country_id,
+            )
+            invoice_items = [InvoiceItem(
+                quantity=item.quantity, description=item.description, price=item.price,
+                discount_percentage=item.discount_percentage,
+            ) for item in recurring_invoice.recurring_invoice_items.all()]
+            apply_invoice_totals(invoice, invoice_items)
+            invoices.append(invoice)
+            items.append(invoice_items)
+
+    Invoice.objects.bulk_create(invoices, batch_size=RECURRING_BATCH_SIZE)
+    for invoice, invoice_items in zip(invoices, items):
+        for item in invoice_items:
+            item.invoice = invoice
+    InvoiceItem.objects.bulk_create(
+        [item for invoice_items in items for item in invoice_items], batch_size=RECURRING_BATCH_SIZE)
+    invalidate_tax_reports(company.id, [invoice.invoice_date for invoice in invoices])
+    return invoices
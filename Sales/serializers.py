@@ -1,5 +1,9 @@
 from rest_framework import serializers
-from .models import Invoice, InvoiceItem
+from django.db import transaction
+from .models import Invoice, InvoiceItem, RecurringInvoice, RecurringInvoiceItem
+from Report.models import invalidate_tax_reports
+from .calculations import apply_invoice_totals
+from .utils import get_invoice_number
 
 
 class InvoiceItemSerializer(serializers.ModelSerializer):
@@ -8,6 +12,8 @@ class InvoiceItemSerializer(serializers.ModelSerializer):
         exclude = [
             'invoice',
         ]
+        # computed from quantity, price and discount
+        read_only_fields = ('base', )
 
 
 class InvoiceSerializer(serializers.ModelSerializer):
@@ -25,28 +31,44 @@ class InvoiceSerializer(serializers.ModelSerializer):
         exclude = [
             'company',
         ]
-        read_only_fields = ('creation_date', )
+        # totals are computed from the items and the taxes, number is allocated on create
+        read_only_fields = (
+            'creation_date', 'number', 'recurring_invoice', 'pdf_name', 'base_amount', 'vat_total', 'equiv_total',
+            'total')
 
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request')
         invoice_items = validated_data.pop('invoice_items')
+        validated_data['number'] = get_invoice_number(request.company, validated_data.get('series', ''))
         invoice = Invoice(company=request.company, **validated_data)
+        items = [InvoiceItem(**item) for item in invoice_items]
+        apply_invoice_totals(invoice, items)
         invoice.save()
-        for item in invoice_items:
-            invoice_item = InvoiceItem(invoice=invoice, **item)
-            invoice_item.save()
+        for item in items:
+            item.invoice = invoice
+        InvoiceItem.objects.bulk_create(items)
+        invalidate_tax_reports(invoice.company_id, [invoice.invoice_date])
         return invoice
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         if not instance.company.id == validated_data['company'].id:
             raise serializers.ValidationError({"message": "Invalid input."})
         InvoiceItem.objects.filter(invoice=instance).delete()
         invoice_items = validated_data.pop('invoice_items')
-        invoice = Invoice(pk=instance.id, **validated_data)
+        validated_data['creation_date'] = instance.creation_date
+        # an issued invoice keeps its number
+        validated_data['series'] = instance.series
+        validated_data['number'] = instance.number
+        invoice = Invoice(
+            pk=instance.id, recurring_invoice_id=instance.recurring_invoice_id, pdf_name=instance.pdf_name,
+            **validated_data)
+        items = [InvoiceItem(invoice=invoice, **item) for item in invoice_items]
+        apply_invoice_totals(invoice, items)
         invoice.save()
-        for item in invoice_items:
-            invoice_item = InvoiceItem(invoice=invoice, **item)
-            invoice_item.save()
+        InvoiceItem.objects.bulk_create(items)
+        invalidate_tax_reports(invoice.company_id, [instance.invoice_date, invoice.invoice_date])
         return invoice
 
 
@@ -56,3 +78,57 @@ class InvoiceDeleteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Invoice
         fields = ['invoices_list']
+
+
+class RecurringInvoiceItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RecurringInvoiceItem
+        exclude = [
+            'recurring_invoice',
+        ]
+
+
+class RecurringInvoiceSerializer(serializers.ModelSerializer):
+    recurring_invoice_items = RecurringInvoiceItemSerializer(many=True)
+    client_label = serializers.CharField(source='client.name', read_only=True)
+
+    class Meta:
+        model = RecurringInvoice
+        exclude = [
+            'company',
+        ]
+        read_only_fields = ('creation_date', )
+
+    # a recurring invoice copies name and addresses of its client into every invoice
+    def validate_client(self, client):
+        if client.company_id != self.context['request'].company.id:
+            raise serializers.ValidationError("Invalid input.")
+        return client
+
+    @transaction.atomic
+    def create(self, validated_data):
+        request = self.context.get('request')
+        items = validated_data.pop('recurring_invoice_items')
+        recurring_invoice = RecurringInvoice.objects.create(company=request.company, **validated_data)
+        RecurringInvoiceItem.objects.bulk_create(
+            [RecurringInvoiceItem(recurring_invoice=recurring_invoice, **item) for item in items])
+        return recurring_invoice
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        request = self.context.get('request')
+        if not instance.company.id == request.company.id:
+            raise serializers.ValidationError({"message": "Invalid input."})
+        items = validated_data.pop('recurring_invoice_items')
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save()
+        RecurringInvoiceItem.objects.filter(recurring_invoice=instance).delete()
+        RecurringInvoiceItem.objects.bulk_create(
+            [RecurringInvoiceItem(recurring_invoice=instance, **item) for item in items])
+        return instance
+
+
+class RecurringInvoiceGenerateSerializer(serializers.Serializer):
+    year = serializers.IntegerField(min_value=2000)
+    month = serializers.IntegerField(min_value=1, max_value=12)
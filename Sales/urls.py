@@ -1,9 +1,10 @@
 from rest_framework.routers import DefaultRouter
-from .views import InoviceViewSet
+from .views import InoviceViewSet, RecurringInvoiceViewSet
 # from pprint import pprint
 router = DefaultRouter()
 
 router.register('invoice', InoviceViewSet, basename='Invoice')
+router.register('recurring-invoice', RecurringInvoiceViewSet, basename='RecurringInvoice')
 
 # pprint(router.urls)
 
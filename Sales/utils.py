@@ -0,0 +1,23 @@
+from django.db.models import Max
+from Core.helper import allocate_sequence
+from .models import Invoice
+
+
+'''
+Returning the first of count contiguous invoice numbers of the series for the company.
+Must be called in the transaction creating the invoices: the counter row of the company
+and series stays locked until it commits, so concurrent invoices of the same series wait
+for each other while other companies and series are not blocked, and rolled back invoices
+give their numbers back. Numbers are never reserved in blocks, which would leave gaps.
+When the counter is created it continues after the biggest number the series already has.
+'''
+
+
+def get_invoice_numbers(company, series, count):
+    def last_number():
+        return Invoice.objects.filter(company=company, series=series).aggregate(last=Max('number'))['last'] or 0
+    return allocate_sequence(company, 'invoice_' + series, count=count, initial=last_number, block_size=1)
+
+
+def get_invoice_number(company, series=''):
+    return get_invoice_numbers(company, series, 1)
@@ -1,30 +1,51 @@
+import datetime
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import permissions, status
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
 from Middleware.CustomMixin import CompanyPermissionsMixin
 from Middleware.permissions import IsCompanyAccess
-from .serializers import InvoiceSerializer, InvoiceDeleteSerializer
-from .models import Invoice
+from .serializers import (
+    InvoiceSerializer, InvoiceDeleteSerializer, RecurringInvoiceSerializer, RecurringInvoiceGenerateSerializer,
+)
+from .models import Invoice, RecurringInvoice
 from .filters import InvoiceFilter
-from utils.pagination import LimitOffsetPagination
+from utils.pagination import CursorPagination
+from utils.export import CONTENT_TYPES, stream_zip
+from .pdf import invoice_pdf_queryset, get_stored_invoice_pdf, queue_month_invoice_pdfs, month_invoice_pdfs
+from .recurring import generate_recurring_invoices
+
+# actions rendering invoices with their labels and items, which are then loaded up front
+READ_ACTIONS = ('list', 'retrieve')
 
 
 class InoviceViewSet(ModelViewSet, CompanyPermissionsMixin):
     permission_classes = [permissions.IsAuthenticated, IsCompanyAccess]
     serializer_class = InvoiceSerializer
-    pagination_class = LimitOffsetPagination
+    pagination_class = CursorPagination
+    max_page_size = 50
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_class = InvoiceFilter
-    ordering_fields = ['id', 'team_name']
+    ordering = ['-id']
+    # cursor pages need a unique ordering, see utils.pagination.CursorPagination
+    ordering_fields = ['id']
 
     def get_serializer_context(self):
         return {'request': self.request}
 
     def get_queryset(self):
-        return Invoice.objects.filter(
+        queryset = Invoice.objects.filter(
             company=self.request.company).order_by('-id')
+        if self.action == 'pdf':
+            queryset = invoice_pdf_queryset().filter(company=self.request.company)
+        elif self.action in READ_ACTIONS:
+            queryset = queryset.select_related(
+                'client', 'payment_method', 'vat_percentage', 'equiv_percentage',
+            ).prefetch_related('invoice_items')
+        return queryset
 
     def perform_update(self, serializer):
         serializer.validated_data['company'] = self.request.company
@@ -37,3 +58,60 @@ class InoviceViewSet(ModelViewSet, CompanyPermissionsMixin):
         data = serializer.validated_data
         Invoice.objects.filter(pk__in=data['invoices_list'], company=company).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    # stored pdf of the invoice, 202 while it is rendered in the background
+    @action(detail=True, methods=['get'])
+    def pdf(self, request, pk=None):
+        invoice = self.get_object()
+        content = get_stored_invoice_pdf(invoice)
+        if content is None:
+            return Response({"message": "PDF is being rendered, try again shortly."}, status=status.HTTP_202_ACCEPTED)
+        response = HttpResponse(content, content_type='application/pdf')
+        response['Content-Disposition'] = 'attachment; filename="invoice-{}.pdf"'.format(invoice.id)
+        return response
+
+    # PDFs of every invoice of a month (query params year and month) in one zip, 202 while
+    # missing ones are rendered in the background
+    @action(detail=False, methods=['get'], url_path='pdf')
+    def pdf_batch(self, request):
+        try:
+            year = int(request.GET['year'])
+            month = int(request.GET['month'])
+        except (KeyError, ValueError):
+            return Response({"message": "year and month must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= month <= 12 or not 2000 <= year <= datetime.date.today().year:
+            return Response({"message": "Invalid year or month"}, status=status.HTTP_400_BAD_REQUEST)
+        queued = queue_month_invoice_pdfs(request.company, year, month)
+        if queued:
+            return Response(
+                {"message": "{} PDFs are being rendered, try again shortly.".format(queued)},
+                status=status.HTTP_202_ACCEPTED)
+        response = StreamingHttpResponse(
+            stream_zip(month_invoice_pdfs(request.company, year, month)), content_type=CONTENT_TYPES['zip'])
+        response['Content-Disposition'] = 'attachment; filename="invoices-{}-{:02d}.zip"'.format(year, month)
+        return response
+
+
+class RecurringInvoiceViewSet(ModelViewSet, CompanyPermissionsMixin):
+    permission_classes = [permissions.IsAuthenticated, IsCompanyAccess]
+    serializer_class = RecurringInvoiceSerializer
+    pagination_class = CursorPagination
+    max_page_size = 50
+
+    def get_serializer_context(self):
+        return {'request': self.request}
+
+    def get_queryset(self):
+        queryset = RecurringInvoice.objects.filter(company=self.request.company).order_by('-id')
+        if self.action in READ_ACTIONS:
+            queryset = queryset.select_related('client').prefetch_related('recurring_invoice_items')
+        return queryset
+
+    # invoices of the month (year and month in body) for every recurring invoice
+    @action(detail=False, methods=['post'])
+    def generate(self, request):
+        serializer = RecurringInvoiceGenerateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        invoices = generate_recurring_invoices(request.company, data['year'], data['month'])
+        return Response({"created": len(invoices)}, status=status.HTTP_201_CREATED)
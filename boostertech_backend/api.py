@@ -9,4 +9,5 @@ urlpatterns = [
     path('contact/', include('Contact.urls')),
     path('sales/', include('Sales.urls')),
     path('expense/', include('Expense.urls')),
+    path('report/', include('Report.urls')),
 ]
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     'Lookup',
     'Sales',
     'Expense',
+    'Report',
 ]
 
 MIDDLEWARE = [
@@ -161,11 +162,14 @@ if env('USE_S3') == 'TRUE':
     # s3 private media settings
     PRIVATE_MEDIA_LOCATION = 'private'
     PRIVATE_FILE_STORAGE = 'boostertech_backend.storage_backends.PrivateMediaStorage'
+    # s3 rendered invoice pdf settings
+    INVOICE_PDF_STORAGE = 'boostertech_backend.storage_backends.PrivateMediaStorage'
 else:
     STATIC_URL = '/staticfiles/'
     STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
     MEDIA_URL = 'http://localhost:8000/mediafiles/'
     MEDIA_ROOT = os.path.join(BASE_DIR, 'mediafiles')
+    INVOICE_PDF_STORAGE = 'django.core.files.storage.FileSystemStorage'
 
 
 # Default primary key field type
@@ -195,7 +199,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
+        'Middleware.authentication.CachedJSONWebTokenAuthentication',
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
@@ -209,4 +213,33 @@ JWT_AUTH = {
     'JWT_EXPIRATION_DELTA': datetime.timedelta(days=20),
     'JWT_REFRESH_EXPIRATION_DELTA': datetime.timedelta(days=20),
     'JWT_ALLOW_REFRESH': True,
+    'JWT_PAYLOAD_HANDLER': 'Core.helper.jwt_payload_handler',
+}
+# Opt in to tokens carrying the company ids user may access, see Core.helper.jwt_payload_handler
+COMPANY_SCOPED_TOKENS = False
+
+# Per process cache of company access decisions made in CompanyAccessMiddleWare
+COMPANY_ACCESS_CACHE = {
+    'MAX_SIZE': 10000,
+    # seconds, bounds how long other processes may serve a revoked access
+    'TTL': 300,
+}
+
+# Per process cache of decoded JWT payloads, entries are also capped at the token exp
+JWT_TOKEN_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 3600,
+}
+
+# Numbers reserved at once by a worker in Core.helper.allocate_sequence, 1 keeps numbers
+# contiguous. Bigger blocks save a query per document but leave gaps when a worker stops.
+SEQUENCE_BLOCK_SIZE = 1
+
+# Processes of the pool rendering invoice PDFs in Sales.pdf
+INVOICE_PDF_WORKERS = 2
+
+# Social security rates in percent applied by Payroll.engine when generating payrolls
+PAYROLL_SOCIAL_SECURITY = {
+    'EMPLOYEE_RATE': '6.35',
+    'COMPANY_RATE': '29.90',
 }
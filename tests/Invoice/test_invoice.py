@@ -1,7 +1,25 @@
 from django.contrib.auth.models import User
+import io
+import logging
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import Future
+from decimal import Decimal
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from Core.models import Company
-from Lookup.models import LookupType, LookupName, AccountType
+from Lookup.models import LookupType, LookupName, AccountType, Tax, PaymentDay
 from Contact.models import Contact
+from Sales.models import Invoice, InvoiceItem, RecurringInvoice, RecurringInvoiceItem
+from Sales.calculations import compute_invoice
+from Sales import pdf
+from Sales.pdf import build_pdf, pending_renders
+from Sales.utils import get_invoice_number
+from Sales.recurring import generate_recurring_invoices, RECURRING_BATCH_SIZE
 from rest_framework import status
 import pytest
 from model_bakery import baker
@@ -90,3 +108,384 @@ class TestInvoice:
             # "shipping_country": 1
         }, response["headers"])
         assert invoice_response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestInvoiceList:
+    def test_list_query_count_does_not_grow_with_page_size_return_200(
+            self, api_client, create_user_company_and_contact):
+        response = create_user_company_and_contact()
+        contact = response['contact']
+        vat = baker.make(Tax, vat='21.00')
+        equiv = baker.make(Tax, equiv='5.20')
+        invoices = baker.make(
+            Invoice, _quantity=50, company=contact.company, client=contact, vat_percentage=vat,
+            equiv_percentage=equiv, payment_method=contact.contact_type, tax_country=contact.contact_type)
+        for invoice in invoices:
+            baker.make(InvoiceItem, _quantity=3, invoice=invoice)
+        api_client.get('/api/sales/invoice/', **response['headers'])
+
+        query_counts = []
+        for limit in (5, 50):
+            with CaptureQueriesContext(connection) as context:
+                list_response = api_client.get('/api/sales/invoice/?limit={}'.format(limit), **response['headers'])
+            assert list_response.status_code == status.HTTP_200_OK
+            assert len(list_response.data['results']) == limit
+            assert all(len(result['invoice_items']) == 3 for result in list_response.data['results'])
+            assert list_response.data['results'][0]['client_label'] == contact.name
+            query_counts.append(len(context))
+        assert query_counts[0] == query_counts[1]
+
+        with CaptureQueriesContext(connection) as context:
+            retrieve_response = api_client.get(
+                '/api/sales/invoice/{}/'.format(invoices[0].id), **response['headers'])
+        assert retrieve_response.status_code == status.HTTP_200_OK
+        assert retrieve_response.data['vat_percentage_label'] == '21.00'
+        assert len(context) == query_counts[0]
+
+
+@pytest.mark.django_db
+class TestInvoiceTotals:
+    def test_compute_invoice_rounds_half_up_to_the_cent(self):
+        # 3 x 10.05 with 12.5 % discount, 21 % vat and 5.2 % equivalence surcharge
+        bases, totals = compute_invoice([(3, 1005, 1250), (1, 1, 0)], 2100, 520)
+        assert bases == [2638, 1]
+        assert totals == {'base_amount': 2639, 'vat_total': 554, 'equiv_total': 137, 'total': 3330}
+
+    def test_create_computes_totals_from_items_return_201(self, api_client, create_user_company_and_contact):
+        response = create_user_company_and_contact()
+        contact = response['contact']
+        vat = baker.make(Tax, vat='21.00')
+        invoice_response = api_client.post('/api/sales/invoice/', {
+            "invoice_items": [
+                {"quantity": 3, "description": "a", "price": "10.05", "discount_percentage": "12.50", "base": "1.00"},
+                {"quantity": 1, "description": "b", "price": "0.01", "discount_percentage": "0.00"},
+            ],
+            "invoice_date": "2022-12-12",
+            "client": contact.id,
+            "vat_percentage": vat.id,
+            "base_amount": 1,
+            "vat_total": 1,
+            "equiv_total": 1,
+            "total": 1,
+            "due_date": "2022-12-12",
+            "tax_country": contact.contact_type.id,
+        }, format='json', **response['headers'])
+        assert invoice_response.status_code == status.HTTP_201_CREATED
+        assert [item['base'] for item in invoice_response.data['invoice_items']] == [Decimal('26.38'), Decimal('0.01')]
+        invoice = Invoice.objects.get(pk=invoice_response.data['id'])
+        assert (invoice.base_amount, invoice.vat_total, invoice.equiv_total, invoice.total) == (
+            Decimal('26.39'), Decimal('5.54'), Decimal('0.00'), Decimal('31.93'))
+
+    def test_recalculate_command_fixes_stored_totals(self, create_user_company_and_contact):
+        response = create_user_company_and_contact()
+        contact = response['contact']
+        vat = baker.make(Tax, vat='10.00')
+        invoices = baker.make(
+            Invoice, _quantity=5, company=contact.company, client=contact, vat_percentage=vat,
+            tax_country=contact.contact_type, base_amount=1, vat_total=1, equiv_total=1, total=1)
+        for invoice in invoices:
+            baker.make(InvoiceItem, _quantity=2, invoice=invoice, quantity=2, price='5.00',
+                       discount_percentage='0.00', base=1)
+        call_command('recalculate_invoice_totals', company=[contact.company.id], batch_size=2)
+        assert set(InvoiceItem.objects.values_list('base', flat=True)) == {Decimal('10.00')}
+        assert set(Invoice.objects.values_list('base_amount', 'vat_total', 'total')) == {
+            (Decimal('20.00'), Decimal('2.00'), Decimal('22.00'))}
+
+
+@pytest.mark.django_db
+class TestInvoicePdf:
+    def make_invoices(self, contact, invoice_date, quantity):
+        invoices = baker.make(
+            Invoice, _quantity=quantity, company=contact.company, client=contact, invoice_date=invoice_date,
+            tax_country=contact.contact_type, base_amount='10.00', vat_total='2.10', equiv_total=0, total='12.10')
+        for invoice in invoices:
+            baker.make(InvoiceItem, invoice=invoice, quantity=1, description='Consulting (May)', price='10.00',
+                       discount_percentage=0, base='10.00')
+        return invoices
+
+    def test_build_pdf_splits_lines_in_pages(self):
+        content = build_pdf(['line {}'.format(line) for line in range(150)])
+        assert content.startswith(b'%PDF-1.4')
+        assert b'/Count 3' in content
+        assert content.rstrip().endswith(b'%%EOF')
+
+    def wait_for_renders(self):
+        for _ in range(200):
+            if not pending_renders:
+                return
+            time.sleep(0.05)
+
+    def test_pdf_is_rendered_in_background_once_then_read_from_storage_return_200(
+            self, api_client, create_user_company_and_contact, settings, tmp_path):
+        settings.MEDIA_ROOT = str(tmp_path)
+        response = create_user_company_and_contact()
+        invoice = self.make_invoices(response['contact'], '2022-05-10', 1)[0]
+        url = '/api/sales/invoice/{}/pdf/'.format(invoice.id)
+
+        assert api_client.get(url, **response['headers']).status_code == status.HTTP_202_ACCEPTED
+        self.wait_for_renders()
+        pdf_response = api_client.get(url, **response['headers'])
+        assert pdf_response.status_code == status.HTTP_200_OK
+        assert pdf_response['Content-Type'] == 'application/pdf'
+        assert pdf_response.content.startswith(b'%PDF')
+        assert b'Consulting \\(May\\)' in pdf_response.content
+        stored = os.listdir(tmp_path / 'invoices' / str(invoice.company_id))
+        assert len(stored) == 1
+        assert Invoice.objects.get(pk=invoice.id).pdf_name.endswith(stored[0])
+
+        assert api_client.get(url, **response['headers']).content == pdf_response.content
+        assert os.listdir(tmp_path / 'invoices' / str(invoice.company_id)) == stored
+
+        Invoice.objects.filter(pk=invoice.id).update(iban='ES0000000000000000000000')
+        assert api_client.get(url, **response['headers']).status_code == status.HTTP_202_ACCEPTED
+        self.wait_for_renders()
+        assert len(os.listdir(tmp_path / 'invoices' / str(invoice.company_id))) == 2
+
+    def test_month_of_pdfs_is_rendered_in_background_then_streamed_in_one_zip_return_200(
+            self, api_client, create_user_company_and_contact, settings, tmp_path, monkeypatch):
+        settings.MEDIA_ROOT = str(tmp_path)
+        response = create_user_company_and_contact()
+        invoices = self.make_invoices(response['contact'], '2022-05-10', 3)
+        self.make_invoices(response['contact'], '2022-06-10', 1)
+        url = '/api/sales/invoice/pdf/?year=2022&month=5'
+
+        queued_response = api_client.get(url, **response['headers'])
+        assert queued_response.status_code == status.HTTP_202_ACCEPTED
+        assert queued_response.data['message'].startswith('3 PDFs')
+        self.wait_for_renders()
+        zip_response = api_client.get(url, **response['headers'])
+        assert zip_response.status_code == status.HTTP_200_OK
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(zip_response.streaming_content)))
+        assert archive.namelist() == ['invoice-{}.pdf'.format(invoice.id) for invoice in invoices]
+        assert all(archive.read(name).startswith(b'%PDF') for name in archive.namelist())
+        assert not Invoice.objects.filter(invoice_date__month=5, pdf_name='').exists()
+
+        # rendered files are known from pdf_name, storage is not asked file by file
+        exists_calls = []
+        monkeypatch.setattr(FileSystemStorage, 'exists', lambda storage, name: exists_calls.append(name))
+        call_command('render_invoice_pdfs', company=[invoices[0].company_id], year=2022, month=5)
+        zip_response = api_client.get(url, **response['headers'])
+        assert len(zipfile.ZipFile(io.BytesIO(b''.join(zip_response.streaming_content))).namelist()) == 3
+        assert exists_calls == []
+
+        bad_response = api_client.get('/api/sales/invoice/pdf/?year=2022&month=13', **response['headers'])
+        assert bad_response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_purged_pdf_is_rendered_again_instead_of_cutting_the_zip_return_200(
+            self, api_client, create_user_company_and_contact, settings, tmp_path):
+        settings.MEDIA_ROOT = str(tmp_path)
+        response = create_user_company_and_contact()
+        invoices = self.make_invoices(response['contact'], '2022-05-10', 2)
+        out = io.StringIO()
+        call_command('render_invoice_pdfs', company=[invoices[0].company_id], year=2022, month=5, stdout=out)
+        assert 'Rendered 2 invoice PDFs' in out.getvalue()
+        purged = Invoice.objects.get(pk=invoices[0].id).pdf_name
+        os.remove(tmp_path / purged)
+
+        zip_response = api_client.get('/api/sales/invoice/pdf/?year=2022&month=5', **response['headers'])
+        assert zip_response.status_code == status.HTTP_200_OK
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(zip_response.streaming_content)))
+        assert len(archive.namelist()) == 2
+        assert all(archive.read(name).startswith(b'%PDF') for name in archive.namelist())
+        assert os.path.exists(tmp_path / purged)
+
+    def test_failed_background_render_is_logged_and_submitted_again(self, monkeypatch, caplog):
+        class FailingPool:
+            submitted = 0
+
+            def submit(self, function, *args):
+                self.submitted += 1
+                future = Future()
+                future.set_exception(ValueError('broken template'))
+                return future
+        pool = FailingPool()
+        monkeypatch.setattr(pdf, 'get_render_pool', lambda: pool)
+
+        with caplog.at_level(logging.ERROR, logger='Sales.pdf'):
+            pdf.render_invoice_pdf_later('invoices/1/broken.pdf', {})
+        assert 'invoices/1/broken.pdf' in caplog.text
+        assert not pending_renders
+        pdf.render_invoice_pdf_later('invoices/1/broken.pdf', {})
+        assert pool.submitted == 2
+
+    def test_stored_file_is_kept_when_saved_again(self, settings, tmp_path):
+        settings.MEDIA_ROOT = str(tmp_path)
+        storage = pdf.get_pdf_storage()
+        assert pdf.save_invoice_pdf(storage, 'invoices/1/same.pdf', b'%PDF first') == 'invoices/1/same.pdf'
+        assert pdf.save_invoice_pdf(storage, 'invoices/1/same.pdf', b'%PDF first') == 'invoices/1/same.pdf'
+        assert os.listdir(tmp_path / 'invoices' / '1') == ['same.pdf']
+
+
+@pytest.mark.django_db
+class TestInvoiceNumber:
+    def test_numbers_are_per_company_and_series(self):
+        company, other_company = baker.make(Company, _quantity=2)
+        assert [get_invoice_number(company) for _ in range(3)] == [1, 2, 3]
+        assert get_invoice_number(company, 'R') == 1
+        assert get_invoice_number(other_company) == 1
+
+    def test_numbering_continues_after_existing_invoices(self, create_user_company_and_contact):
+        contact = create_user_company_and_contact()['contact']
+        baker.make(Invoice, company=contact.company, client=contact, tax_country=contact.contact_type, number=41)
+        assert get_invoice_number(contact.company) == 42
+
+    def test_create_allocates_number_and_update_keeps_it_return_201(
+            self, api_client, create_user_company_and_contact):
+        response = create_user_company_and_contact()
+        contact = response['contact']
+        payload = {
+            "invoice_items": [{"quantity": 1, "description": "a", "price": "10.00", "discount_percentage": "0"}],
+            "invoice_date": "2022-12-12",
+            "client": contact.id,
+            "due_date": "2022-12-12",
+            "tax_country": contact.contact_type.id,
+            "number": 1000,
+        }
+        numbers = [api_client.post('/api/sales/invoice/', payload, format='json', **response['headers']).data['number']
+                   for _ in range(2)]
+        rectifying_response = api_client.post(
+            '/api/sales/invoice/', dict(payload, series='R'), format='json', **response['headers'])
+        assert numbers == [1, 2]
+        assert (rectifying_response.data['series'], rectifying_response.data['number']) == ('R', 1)
+
+        invoice = Invoice.objects.get(company=contact.company, series='', number=2)
+        update_response = api_client.put(
+            '/api/sales/invoice/{}/'.format(invoice.id), dict(payload, series='R'), format='json',
+            **response['headers'])
+        assert update_response.status_code == status.HTTP_200_OK
+        assert (update_response.data['series'], update_response.data['number']) == ('', 2)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestInvoiceNumberConcurrency:
+    # Benchmark, run with -s to see throughput of 50 creators over 10 companies
+    def test_parallel_creators_get_gap_free_numbers(self):
+        per_creator = int(os.environ.get('INVOICE_NUMBER_BENCH_INVOICES', 20))
+        lookup_name = baker.make(LookupName)
+        contacts = [baker.make(Contact, company=baker.make(Company), contact_type=lookup_name) for _ in range(10)]
+
+        def create_invoices(contact):
+            try:
+                for _ in range(per_creator):
+                    with transaction.atomic():
+                        Invoice.objects.create(
+                            company=contact.company, client=contact, tax_country=lookup_name,
+                            number=get_invoice_number(contact.company), invoice_date='2022-12-12',
+                            due_date='2022-12-12', base_amount=0, vat_total=0, equiv_total=0, total=0)
+            finally:
+                connection.close()
+
+        creators = [threading.Thread(target=create_invoices, args=(contacts[index % 10], )) for index in range(50)]
+        start = time.perf_counter()
+        for creator in creators:
+            creator.start()
+        for creator in creators:
+            creator.join()
+        elapsed = time.perf_counter() - start
+        print('\n{} invoices by 50 creators over 10 companies in {:.2f}s, {:.0f} invoices/s'.format(
+            50 * per_creator, elapsed, 50 * per_creator / elapsed))
+
+        for contact in contacts:
+            numbers = Invoice.objects.filter(company=contact.company).order_by('number')
+            assert list(numbers.values_list('number', flat=True)) == list(range(1, 5 * per_creator + 1))
+
+
+@pytest.mark.django_db
+class TestRecurringInvoice:
+    def make_recurring_invoices(self, contact, quantity):
+        recurring_invoices = RecurringInvoice.objects.bulk_create([RecurringInvoice(
+            company=contact.company, client=contact, tax_country=contact.contact_type, start_date='2022-01-01',
+            day_of_month=31) for _ in range(quantity)])
+        RecurringInvoiceItem.objects.bulk_create([RecurringInvoiceItem(
+            recurring_invoice=recurring_invoice, quantity=2, description='Maintenance', price='50.00',
+        ) for recurring_invoice in recurring_invoices for _ in range(3)])
+        return recurring_invoices
+
+    def test_generate_invoices_of_the_month_once_return_201(self, api_client, create_user_company_and_contact):
+        response = create_user_company_and_contact()
+        contact = response['contact']
+        contact.payment_extension = baker.make(PaymentDay, day=30)
+        contact.save()
+        vat = baker.make(Tax, vat='21.00')
+        create_response = api_client.post('/api/sales/recurring-invoice/', {
+            "client": contact.id,
+            "series": "M",
+            "day_of_month": 31,
+            "start_date": "2022-01-01",
+            "end_date": "2022-12-31",
+            "vat_percentage": vat.id,
+            "tax_country": contact.contact_type.id,
+            "recurring_invoice_items": [
+                {"quantity": 2, "description": "Hosting", "price": "50.00", "discount_percentage": "10.00"},
+            ],
+        }, format='json', **response['headers'])
+        assert create_response.status_code == status.HTTP_201_CREATED
+
+        generate_response = api_client.post(
+            '/api/sales/recurring-invoice/generate/', {"year": 2022, "month": 2}, format='json',
+            **response['headers'])
+        assert generate_response.status_code == status.HTTP_201_CREATED
+        assert generate_response.data == {"created": 1}
+        invoice = Invoice.objects.get(company=contact.company)
+        assert (invoice.series, invoice.number) == ('M', 1)
+        assert (str(invoice.invoice_date), str(invoice.due_date)) == ('2022-02-28', '2022-03-30')
+        assert (invoice.base_amount, invoice.vat_total, invoice.total) == (
+            Decimal('90.00'), Decimal('18.90'), Decimal('108.90'))
+        assert invoice.invoice_items.get().base == Decimal('90.00')
+
+        again_response = api_client.post(
+            '/api/sales/recurring-invoice/generate/', {"year": 2022, "month": 2}, format='json',
+            **response['headers'])
+        assert again_response.data == {"created": 0}
+        earlier_response = api_client.post(
+            '/api/sales/recurring-invoice/generate/', {"year": 2022, "month": 1}, format='json',
+            **response['headers'])
+        assert earlier_response.data == {"created": 1}
+        assert Invoice.objects.get(company=contact.company, number=2).invoice_date.month == 1
+        after_end_response = api_client.post(
+            '/api/sales/recurring-invoice/generate/', {"year": 2023, "month": 1}, format='json',
+            **response['headers'])
+        assert after_end_response.data == {"created": 0}
+
+    def test_if_client_of_other_company_return_400(self, api_client, create_user_company_and_contact):
+        response = create_user_company_and_contact()
+        contact = response['contact']
+        other_contact = baker.make(Contact, company=baker.make(Company), contact_type=contact.contact_type)
+        create_response = api_client.post('/api/sales/recurring-invoice/', {
+            "client": other_contact.id,
+            "start_date": "2022-01-01",
+            "tax_country": contact.contact_type.id,
+            "recurring_invoice_items": [{"quantity": 1, "description": "Hosting", "price": "50.00"}],
+        }, format='json', **response['headers'])
+        assert create_response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'client' in create_response.data
+        assert not RecurringInvoice.objects.exists()
+
+    # Benchmark, run with -m benchmark -s to see time and queries of generating a month of invoices
+    @pytest.mark.parametrize('recurring_invoices', [
+        20, pytest.param(int(os.environ.get('RECURRING_SEED_INVOICES', 2000)), marks=pytest.mark.benchmark)])
+    def test_generate_query_count_only_grows_with_insert_batches(
+            self, create_user_company_and_contact, recurring_invoices):
+        contact = create_user_company_and_contact()['contact']
+        self.make_recurring_invoices(contact, recurring_invoices)
+        query_counts = []
+        for month in (1, 2):
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as context:
+                invoices = generate_recurring_invoices(contact.company, 2022, month)
+            print('\n{} recurring invoices of 3 lines, {} queries, {:.3f}s'.format(
+                len(invoices), len(context), time.perf_counter() - start))
+            assert len(invoices) == recurring_invoices
+            query_counts.append(len(context))
+        assert query_counts[0] >= query_counts[1]
+        assert Invoice.objects.filter(company=contact.company, number=2 * recurring_invoices).exists()
+        assert InvoiceItem.objects.filter(invoice__company=contact.company).count() == 2 * 3 * recurring_invoices
+
+        other_contact = baker.make(Contact, company=baker.make(Company), contact_type=contact.contact_type)
+        self.make_recurring_invoices(other_contact, 5)
+        with CaptureQueriesContext(connection) as context:
+            generate_recurring_invoices(other_contact.company, 2022, 1)
+        # one more INSERT of invoices or items every RECURRING_BATCH_SIZE rows
+        insert_batches = sum(-(-rows // RECURRING_BATCH_SIZE) for rows in (recurring_invoices, 3 * recurring_invoices))
+        assert query_counts[0] == len(context) - 2 + insert_batches
@@ -0,0 +1,65 @@
+from django.contrib.auth.models import User
+from Core.models import Company
+from Lookup.models import LookupName
+from Contact.models import Contact
+from Contact.utils import get_contact_ids
+from rest_framework import status
+import pytest
+from model_bakery import baker
+
+
+@pytest.fixture
+def create_user_and_company(api_client):
+    def do_create_user_and_company():
+        user = baker.make(User, email='someone@example.com', is_staff=True)
+        user.set_password('haha@123')
+        user.save()
+        user.user_profile.isactive = True
+        user.user_profile.save()
+        user_response = api_client.post('/api/core/login/', {
+            "email": 'someone@example.com',
+            "password": 'haha@123'
+        })
+        company = baker.make(Company, user=user)
+        headers = {
+            'HTTP_AUTHORIZATION': "JWT {}".format(user_response.data['token']),
+            'HTTP_COMPANY': company.id
+        }
+        return company, headers
+    return do_create_user_and_company
+
+# ---------------------------------------------------------------------------------------------- #
+# ------------------------------------Contact Id Test Cases------------------------------------- #
+# ---------------------------------------------------------------------------------------------- #
+
+
+@pytest.mark.django_db
+class TestContactId:
+    def test_contact_ids_follow_each_other_per_company_and_type_return_201(
+            self, api_client, create_user_and_company):
+        company, headers = create_user_and_company()
+        client = baker.make(LookupName, lookup_name='Client')
+        provider = baker.make(LookupName, lookup_name='Provider')
+        baker.make(Contact, company=baker.make(Company), contact_type=client, contact_id='430000000009')
+
+        contact_ids = []
+        for contact_type, nif in ((client, 'A1'), (client, 'A2'), (provider, 'A3')):
+            response = api_client.post('/api/contact/create/', {
+                "contact_type": contact_type.id,
+                "name": "contact",
+                "nif": nif,
+            }, **headers)
+            assert response.status_code == status.HTTP_201_CREATED
+            contact_ids.append(Contact.objects.get(pk=response.data['contact']['id']).contact_id)
+        assert contact_ids == ['430000000001', '430000000002', '400000000001']
+
+    def test_batch_of_contact_ids_is_reserved_in_one_query(self, django_assert_num_queries):
+        company = baker.make(Company)
+        client = baker.make(LookupName, lookup_name='Client')
+        baker.make(Contact, company=company, contact_type=client, contact_id='430000000041')
+        get_contact_ids(company, client, 1)
+        with django_assert_num_queries(1):
+            contact_ids = get_contact_ids(company, client, 500)
+        assert contact_ids[0] == '430000000043'
+        assert contact_ids[-1] == '430000000542'
+        assert len(set(contact_ids)) == 500
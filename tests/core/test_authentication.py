@@ -0,0 +1,59 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
+from Core.models import Company
+from Middleware import authentication
+from rest_framework import status
+import pytest
+from model_bakery import baker
+
+
+@pytest.fixture
+def create_admin_and_company(api_client):
+    def do_create_admin_and_company():
+        user = baker.make(User, email='someone@example.com', is_staff=True)
+        user.set_password('haha@123')
+        user.save()
+        user.user_profile.isactive = True
+        user.user_profile.save()
+        user_response = api_client.post('/api/core/login/', {
+            "email": 'someone@example.com',
+            "password": 'haha@123'
+        })
+        company = baker.make(Company, user=user)
+        return {
+            'HTTP_AUTHORIZATION': "JWT {}".format(user_response.data['token']),
+            'HTTP_COMPANY': company.id
+        }
+    return do_create_admin_and_company
+
+# ---------------------------------------------------------------------------------------------- #
+# ---------------------------------JWT Authentication Test Cases-------------------------------- #
+# ---------------------------------------------------------------------------------------------- #
+
+
+@pytest.mark.django_db
+class TestJWTAuthentication:
+    def test_user_loaded_once_per_request_return_200(self, api_client, create_admin_and_company):
+        headers = create_admin_and_company()
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get('/api/payroll/teams/', **headers)
+        user_queries = [query for query in context.captured_queries if 'FROM "auth_user"' in query['sql']]
+        assert response.status_code == status.HTTP_200_OK
+        assert len(user_queries) == 1
+
+    def test_token_decoded_once_for_repeated_requests(self, api_client, create_admin_and_company):
+        headers = create_admin_and_company()
+        authentication.decoded_token_cache.clear()
+        with mock.patch.object(
+                authentication, 'jwt_decode_handler', wraps=authentication.jwt_decode_handler) as decode:
+            api_client.get('/api/payroll/teams/', **headers)
+            api_client.get('/api/payroll/teams/', **headers)
+        assert decode.call_count == 1
+
+    def test_if_token_invalid_return_401(self, api_client, create_admin_and_company):
+        headers = create_admin_and_company()
+        headers['HTTP_AUTHORIZATION'] = "JWT akhdkadkaxa"
+        response = api_client.get('/api/payroll/teams/', **headers)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
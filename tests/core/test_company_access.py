@@ -0,0 +1,145 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from Core.models import Company, CompanyAccessRecord
+from Middleware.custommiddleware import company_access_cache
+from rest_framework import status
+from rest_framework.test import APIClient
+import pytest
+from model_bakery import baker
+
+
+@pytest.fixture
+def create_user_and_company(api_client):
+    def do_create_user_and_company(is_staff=True):
+        user = baker.make(User, email='someone@example.com', is_staff=is_staff)
+        user.set_password('haha@123')
+        user.save()
+        user.user_profile.isactive = True
+        user.user_profile.save()
+        company = baker.make(Company, user=user if is_staff else baker.make(User, is_staff=True))
+        user_response = api_client.post('/api/core/login/', {
+            "email": 'someone@example.com',
+            "password": 'haha@123'
+        })
+        headers = {
+            'HTTP_AUTHORIZATION': "JWT {}".format(user_response.data['token']),
+            'HTTP_COMPANY': company.id
+        }
+        return user, company, headers
+    return do_create_user_and_company
+
+
+def company_queries(queries):
+    return [query for query in queries if '"core_company"' in query['sql'].lower()]
+
+# ---------------------------------------------------------------------------------------------- #
+# ----------------------------Company Access Middleware Test Cases------------------------------ #
+# ---------------------------------------------------------------------------------------------- #
+
+
+@pytest.mark.django_db
+class TestCompanyAccessCache:
+    def test_second_request_does_not_query_company_return_200(self, api_client, create_user_and_company):
+        user, company, headers = create_user_and_company()
+        company_access_cache.clear()
+        api_client.get('/api/payroll/teams/', **headers)
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get('/api/payroll/teams/', **headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert company_queries(context.captured_queries) == []
+        assert company_access_cache.stats()['hits'] == 1
+        assert company_access_cache.stats()['misses'] == 1
+
+    def test_if_access_record_revoked_return_403(self, api_client, create_user_and_company):
+        user, company, headers = create_user_and_company(is_staff=False)
+        record = CompanyAccessRecord.objects.create(user=user, company=company)
+        response = api_client.get('/api/payroll/teams/', **headers)
+        assert response.status_code == status.HTTP_200_OK
+        record.delete()
+        response = api_client.get('/api/payroll/teams/', **headers)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_if_user_have_no_access_return_403(self, api_client, create_user_and_company):
+        user, company, headers = create_user_and_company(is_staff=False)
+        response = api_client.get('/api/payroll/teams/', **headers)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+class TestCompanyScopedToken:
+    def test_company_authorized_from_token_without_queries_return_200(
+            self, api_client, create_user_and_company, settings):
+        settings.COMPANY_SCOPED_TOKENS = True
+        user, company, headers = create_user_and_company()
+        company_access_cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get('/api/payroll/teams/', **headers)
+        access_queries = [
+            query for query in context.captured_queries
+            if '"core_company' in query['sql'].lower()]
+        assert response.status_code == status.HTTP_200_OK
+        assert access_queries == []
+
+    def login(self, api_client, headers):
+        login_response = api_client.post('/api/core/login/', {
+            "email": 'someone@example.com',
+            "password": 'haha@123'
+        })
+        headers['HTTP_AUTHORIZATION'] = "JWT {}".format(login_response.data['token'])
+        response = api_client.get('/api/payroll/teams/', **headers)
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_if_access_record_deleted_token_is_not_trusted_return_403(
+            self, api_client, create_user_and_company, settings):
+        settings.COMPANY_SCOPED_TOKENS = True
+        user, company, headers = create_user_and_company(is_staff=False)
+        record = CompanyAccessRecord.objects.create(user=user, company=company)
+        self.login(api_client, headers)
+        record.delete()
+        response = api_client.get('/api/payroll/teams/', **headers)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_if_access_removed_by_admin_endpoint_token_is_not_trusted_return_403(
+            self, api_client, create_user_and_company, settings):
+        settings.COMPANY_SCOPED_TOKENS = True
+        user, company, headers = create_user_and_company(is_staff=False)
+        CompanyAccessRecord.objects.create(user=user, company=company)
+        user.user_profile.admin = company.user
+        user.user_profile.save()
+        self.login(api_client, headers)
+        admin_client = APIClient()
+        admin_client.force_authenticate(company.user)
+        response = admin_client.post(
+            '/api/core/company/permission/generate/', {"user_id": user.id, "company_list": []}, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        response = api_client.get('/api/payroll/teams/', **headers)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_if_owner_loses_company_or_staff_token_is_not_trusted_return_403(
+            self, api_client, create_user_and_company, settings):
+        settings.COMPANY_SCOPED_TOKENS = True
+        user, company, headers = create_user_and_company()
+        other_company = baker.make(Company, user=user)
+        self.login(api_client, headers)
+        company.user = baker.make(User, is_staff=True)
+        company.save()
+        response = api_client.get('/api/payroll/teams/', **headers)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+        headers['HTTP_COMPANY'] = other_company.id
+        self.login(api_client, headers)
+        user.is_staff = False
+        user.save()
+        response = api_client.get('/api/payroll/teams/', **headers)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_saving_a_user_without_changing_is_staff_runs_no_access_check(self):
+        user = baker.make(User, is_staff=False)
+        user = User.objects.get(pk=user.pk)
+        with CaptureQueriesContext(connection) as context:
+            user.first_name = 'changed'
+            user.save()
+            user.set_password('haha@123')
+            user.save(update_fields=['password'])
+        assert len(context) == 2
@@ -0,0 +1,105 @@
+import datetime
+import os
+import time
+import pytest
+from django.db import connection
+from model_bakery import baker
+from Contact.models import Contact
+from Core.models import Company
+from Expense.models import Expense, Purchase, Asset
+from Payroll.models import Team, Employee, PayRoll
+from Sales.models import Invoice
+
+# rows copied in every table, run with EXPLAIN_SEED_ROWS=1000000 for the full size check
+SEED_ROWS = int(os.environ.get('EXPLAIN_SEED_ROWS', 100000))
+COMPANIES = 100
+
+
+'''
+Copying one template row of the model SEED_ROWS times with generate_series, rows are
+spread over COMPANIES companies. overrides gives sql expressions (of g, the row number)
+for columns which must not be the same in every row. Table is analyzed at the end so
+the planner knows its real size.
+'''
+
+
+def seed(model, company_ids, overrides=None):
+    overrides = dict(overrides or {}, company_id='(%s::bigint[])[1 + g %% {}]'.format(COMPANIES))
+    template = baker.make(model, company_id=company_ids[0])
+    quote_name = connection.ops.quote_name
+    columns = [field.column for field in model._meta.concrete_fields if not field.primary_key]
+    table = quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT INTO {} ({}) SELECT {} FROM {} CROSS JOIN generate_series(1, %s) g WHERE {} = %s'.format(
+            table,
+            ', '.join(quote_name(column) for column in columns),
+            ', '.join(overrides.get(column, quote_name(column)) for column in columns),
+            table,
+            quote_name(model._meta.pk.column),
+        ), [company_ids, SEED_ROWS, template.pk])
+        cursor.execute('ANALYZE {}'.format(table))
+    return template
+
+
+# list and filter queries of the company views which must not scan the whole table
+def hot_queries(company, contact):
+    # first page of the cursor pagination
+    querysets = [
+        model.objects.filter(company=company).order_by('-id')[:6]
+        for model in (Team, Employee, PayRoll, Contact, Invoice, Expense, Purchase, Asset)]
+    return querysets + [
+        Employee.objects.filter(company=company, nif=str(COMPANIES)),
+        Contact.objects.filter(company=company, nif=str(COMPANIES)),
+        Contact.objects.filter(company=company, contact_type=contact.contact_type_id).order_by('-id')[:6],
+        PayRoll.objects.filter(company=company, created_at_year=2021, created_at_month=5),
+        Invoice.objects.filter(
+            company=company, due_date__range=(datetime.date(2020, 3, 1), datetime.date(2020, 3, 31))),
+    ]
+
+
+# plan must read the table through one of the composite indexes of its model
+def assert_uses_company_index(queryset):
+    plan = queryset.explain()
+    assert 'Seq Scan' not in plan, plan
+    assert any(index.name in plan for index in queryset.model._meta.indexes), plan
+
+# ---------------------------------------------------------------------------------------------- #
+# ---------------------------------Company Indexes Test Cases----------------------------------- #
+# ---------------------------------------------------------------------------------------------- #
+
+
+@pytest.mark.django_db
+class TestCompanyIndexes:
+    # Benchmark, run with -m benchmark -s to see seeding time
+    @pytest.mark.benchmark
+    def test_company_list_and_hot_filters_do_not_seq_scan(self):
+        companies = Company.objects.bulk_create([
+            Company(user=baker.make('auth.User'), name='company {}'.format(i)) for i in range(COMPANIES)])
+        company_ids = [company.id for company in companies]
+        company = companies[0]
+        start = time.perf_counter()
+        seed(Employee, company_ids, {'nif': 'g::text'})
+        contact = seed(Contact, company_ids, {'nif': 'g::text'})
+        seed(PayRoll, company_ids, {
+            'created_at_year': '2020 + (g / {}) %% 3'.format(COMPANIES),
+            'created_at_month': '1 + (g / {}) %% 12'.format(COMPANIES)})
+        seed(Invoice, company_ids, {'due_date': "date '2020-01-01' + (g / {}) %% 1000".format(COMPANIES)})
+        seed(Team, company_ids)
+        for model in (Expense, Purchase, Asset):
+            # accounting seats are unique per company
+            seed(model, company_ids, {'accounting_seat': '(100000000000 + g)::text'})
+        print('\nseeded {} rows in 8 tables in {:.1f}s'.format(SEED_ROWS, time.perf_counter() - start))
+
+        for queryset in hot_queries(company, contact):
+            assert_uses_company_index(queryset)
+
+    # few rows read without sequential scans, so the plan shows which index serves the query
+    def test_hot_filters_are_served_by_company_indexes(self):
+        company = baker.make(Company)
+        contact = baker.make(Contact, company=company, nif='1')
+        for model in (Team, Employee, PayRoll, Invoice, Expense, Purchase, Asset):
+            baker.make(model, company=company)
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for queryset in hot_queries(company, contact):
+            assert_uses_company_index(queryset)
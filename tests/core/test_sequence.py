@@ -0,0 +1,79 @@
+import threading
+import pytest
+from django.db import connection
+from model_bakery import baker
+from Core.helper import allocate_sequence, reserved_sequences
+from Core.models import Company, SequenceCounter
+from Expense.models import Expense
+from Expense.utils import get_expense_id
+
+# ---------------------------------------------------------------------------------------------- #
+# ---------------------------------Sequence Allocator Test Cases------------------------------- #
+# ---------------------------------------------------------------------------------------------- #
+
+
+@pytest.mark.django_db
+class TestSequenceAllocator:
+    def test_numbers_are_contiguous_per_company_and_key(self):
+        company, other_company = baker.make(Company, _quantity=2)
+        assert allocate_sequence(company, 'doc', initial=100) == 101
+        assert allocate_sequence(company, 'doc') == 102
+        assert allocate_sequence(company, 'doc', count=10) == 103
+        assert allocate_sequence(company, 'doc') == 113
+        assert allocate_sequence(company, 'other') == 1
+        assert allocate_sequence(other_company, 'doc') == 1
+        assert SequenceCounter.objects.get(company=company, key='doc').last_value == 113
+
+    def test_allocation_is_one_query(self, django_assert_num_queries):
+        company = baker.make(Company)
+        allocate_sequence(company, 'doc')
+        with django_assert_num_queries(1):
+            allocate_sequence(company, 'doc')
+
+    def test_expense_seat_continues_after_existing_seats_of_company(self):
+        company = baker.make(Company)
+        baker.make(Expense, company=company, accounting_seat='470000000500')
+        baker.make(Expense, company=company, accounting_seat='470000000007')
+        assert get_expense_id(company) == '470000000501'
+        assert get_expense_id(company) == '470000000502'
+        assert get_expense_id(baker.make(Company)) == '470000000001'
+
+
+@pytest.mark.django_db(transaction=True)
+class TestSequenceAllocatorConcurrency:
+    def allocate_in_threads(self, company, threads, per_thread):
+        numbers = []
+        lock = threading.Lock()
+
+        def allocate():
+            try:
+                for _ in range(per_thread):
+                    number = allocate_sequence(company, 'doc')
+                    with lock:
+                        numbers.append(number)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=allocate) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return numbers
+
+    def test_concurrent_allocations_never_collide(self):
+        company = baker.make(Company)
+        numbers = self.allocate_in_threads(company, 10, 20)
+        assert sorted(numbers) == list(range(1, 201))
+
+    def test_block_reservation_hands_numbers_from_memory(self, settings, django_assert_num_queries):
+        settings.SEQUENCE_BLOCK_SIZE = 50
+        reserved_sequences.clear()
+        company = baker.make(Company)
+        numbers = self.allocate_in_threads(company, 10, 20)
+        assert sorted(numbers) == list(range(1, 201))
+        assert SequenceCounter.objects.get(company=company, key='doc').last_value == 200
+        with django_assert_num_queries(1):
+            numbers = [allocate_sequence(company, 'doc') for _ in range(50)]
+        assert numbers == list(range(201, 251))
+        reserved_sequences.clear()
@@ -0,0 +1,80 @@
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from model_bakery import baker
+from Contact.models import Contact
+from Core.models import Company
+from Lookup.models import AccountType, Tax
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def create_user_and_company(api_client):
+    def do_create_user_and_company():
+        user = baker.make(User, email='someone@example.com', is_staff=True)
+        user.set_password('haha@123')
+        user.save()
+        user.user_profile.isactive = True
+        user.user_profile.save()
+        user_response = api_client.post('/api/core/login/', {
+            "email": 'someone@example.com',
+            "password": 'haha@123'
+        })
+        company = baker.make(Company, user=user)
+        headers = {
+            'HTTP_AUTHORIZATION': "JWT {}".format(user_response.data['token']),
+            'HTTP_COMPANY': company.id
+        }
+        return {
+            'company': company,
+            'headers': headers
+        }
+    return do_create_user_and_company
+
+
+@pytest.fixture
+def document_payload():
+    def do_document_payload(company, items_field, lines):
+        contact = baker.make(Contact, company=company)
+        account = baker.make(AccountType)
+        vat = baker.make(Tax, vat='21.00')
+        ret = baker.make(Tax, ret='15.00')
+        return {
+            "contact": contact.id,
+            "chart_of_account": account.id,
+            "invoice_date": "2022-05-01",
+            "due_date": "2022-06-01",
+            "description": "document",
+            items_field: [{
+                "base_amount": "100.00",
+                "vat": vat.id,
+                "calculated_vat": "21.00",
+                "ret": ret.id,
+                "calculated_ret": "15.00",
+            } for _ in range(lines)],
+        }
+    return do_document_payload
+
+
+@pytest.fixture
+def create_documents():
+    def do_create_documents(company, document_model, item_model, documents=100, lines=20):
+        contact = baker.make(Contact, company=company)
+        account = baker.make(AccountType)
+        vat = baker.make(Tax, vat='21.00')
+        created = document_model.objects.bulk_create([
+            document_model(
+                company=company, accounting_seat=str(i), contact=contact, chart_of_account=account,
+                invoice_date='2022-05-01', due_date='2022-06-01', description='document')
+            for i in range(documents)])
+        document_field = item_model._meta.get_field(document_model._meta.model_name).name
+        item_model.objects.bulk_create([
+            item_model(**{document_field: document}, base_amount='100.00', vat=vat,
+                       calculated_vat='21.00', calculated_ret='0.00')
+            for document in created for _ in range(lines)])
+        return created
+    return do_create_documents
@@ -0,0 +1,72 @@
+import pytest
+from decimal import Decimal
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from Expense.depreciation import compute_schedule
+from Expense.models import Asset, AssetItem, DepreciationEntry
+
+# ---------------------------------------------------------------------------------------------- #
+# ----------------------------------Asset Depreciation Test Cases------------------------------- #
+# ---------------------------------------------------------------------------------------------- #
+
+
+class TestDepreciationSchedule:
+    def test_straight_line_adds_up_to_depreciable_amount(self):
+        amounts = compute_schedule('straight_line', 100000, 100, 7)
+        assert sum(amounts) == 99900
+        assert max(amounts) - min(amounts) <= 1
+
+    def test_declining_balance_decreases_and_reaches_residual(self):
+        amounts = compute_schedule('declining_balance', 1200000, 120000, 60)
+        assert sum(amounts) == 1080000
+        assert amounts[0] == 40000
+        assert all(previous >= current for previous, current in zip(amounts, amounts[1:]))
+
+    def test_no_schedule_when_residual_is_not_below_cost(self):
+        assert compute_schedule('straight_line', 1000, 1000, 12) == []
+
+
+@pytest.mark.django_db
+class TestDepreciation:
+    def test_asset_create_generates_schedule_and_totals_by_account_return_200(
+            self, api_client, create_user_and_company, document_payload):
+        response = create_user_and_company()
+        payload = document_payload(response['company'], 'asset_items', 2)
+        payload.update({
+            "invoice_date": "2022-05-20",
+            "useful_life_months": 12,
+            "residual_value": "20.00",
+        })
+        create_response = api_client.post('/api/expense/asset/', payload, format='json', **response['headers'])
+        assert create_response.status_code == status.HTTP_201_CREATED
+        entries = DepreciationEntry.objects.filter(asset_id=create_response.data['id']).order_by('period')
+        assert entries.count() == 12
+        assert str(entries.first().period) == '2022-05-01'
+        assert entries.first().amount == Decimal('15.00')
+        assert entries.last().book_value == Decimal('20.00')
+
+        totals_response = api_client.get(
+            '/api/expense/depreciation/?start=2022-05&end=2022-08', **response['headers'])
+        assert totals_response.status_code == status.HTTP_200_OK
+        assert totals_response.data['results'][0]['chart_of_account'] == payload['chart_of_account']
+        assert totals_response.data['results'][0]['amount'] == Decimal('60.00')
+
+    # Benchmark, run with -m benchmark for thousands of assets
+    @pytest.mark.parametrize('documents', [20, pytest.param(2000, marks=pytest.mark.benchmark)])
+    def test_month_totals_of_thousands_of_assets_are_one_query(
+            self, api_client, create_user_and_company, create_documents, documents):
+        response = create_user_and_company()
+        assets = create_documents(response['company'], Asset, AssetItem, documents=documents, lines=2)
+        Asset.objects.filter(pk__in=[asset.id for asset in assets]).update(useful_life_months=60)
+        call_command('rebuild_depreciation', company=[response['company'].id])
+        assert DepreciationEntry.objects.filter(company=response['company']).count() == documents * 60
+
+        api_client.get('/api/expense/depreciation/?start=2022-06&end=2022-06', **response['headers'])
+        with CaptureQueriesContext(connection) as context:
+            totals_response = api_client.get(
+                '/api/expense/depreciation/?start=2022-06&end=2022-06', **response['headers'])
+        assert len([query for query in context.captured_queries if 'depreciationentry' in query['sql'].lower()]) == 1
+        # 200.00 over 60 months, second month rounds up to 3.34
+        assert totals_response.data['results'][0]['amount'] == Decimal('3.34') * documents
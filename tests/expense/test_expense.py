@@ -0,0 +1,151 @@
+import datetime
+import time
+import pytest
+from decimal import Decimal
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from Expense.models import Expense, ExpenseItem, Purchase, PurchaseItem, Asset, AssetItem, LedgerEntry
+
+DOCUMENTS = [
+    ('expense', 'expense_items', ExpenseItem),
+    ('purchase', 'purchase_items', PurchaseItem),
+    ('asset', 'asset_items', AssetItem),
+]
+
+DOCUMENT_MODELS = [
+    ('expense', Expense, ExpenseItem),
+    ('purchase', Purchase, PurchaseItem),
+    ('asset', Asset, AssetItem),
+]
+
+# ---------------------------------------------------------------------------------------------- #
+# ----------------------------------Expense Documents Test Cases-------------------------------- #
+# ---------------------------------------------------------------------------------------------- #
+
+
+@pytest.mark.django_db
+class TestDocumentItems:
+    @pytest.mark.parametrize('document, items_field, item_model', DOCUMENTS)
+    def test_create_query_count_does_not_grow_with_lines_return_201(
+            self, api_client, create_user_and_company, document_payload, document, items_field, item_model):
+        response = create_user_and_company()
+        url = '/api/expense/{}/'.format(document)
+        query_counts = []
+        for lines in (10, 200):
+            payload = document_payload(response['company'], items_field, lines)
+            # first document creates the accounting seat counter
+            api_client.post(url, payload, format='json', **response['headers'])
+            with CaptureQueriesContext(connection) as context:
+                create_response = api_client.post(url, payload, format='json', **response['headers'])
+            assert create_response.status_code == status.HTTP_201_CREATED
+            assert item_model.objects.filter(**{document: create_response.data['id']}).count() == lines
+            query_counts.append(len(context))
+        assert query_counts[0] == query_counts[1]
+
+    @pytest.mark.parametrize('document, items_field, item_model', DOCUMENTS)
+    def test_update_touches_only_changed_items_return_200(
+            self, api_client, create_user_and_company, document_payload, document, items_field, item_model):
+        response = create_user_and_company()
+        url = '/api/expense/{}/'.format(document)
+        payload = document_payload(response['company'], items_field, 200)
+        create_response = api_client.post(url, payload, format='json', **response['headers'])
+        items = create_response.data[items_field]
+
+        # first item changed, second removed, the others kept and one new line
+        payload[items_field] = [dict(items[0], base_amount='50.00')] + items[2:] + [
+            dict(items[0], id=None, base_amount='10.00')]
+        del payload[items_field][-1]['id']
+        with CaptureQueriesContext(connection) as context:
+            update_response = api_client.put(
+                '{}{}/'.format(url, create_response.data['id']), payload, format='json', **response['headers'])
+
+        assert update_response.status_code == status.HTTP_200_OK
+        assert len(context) <= 18
+        document_items = item_model.objects.filter(**{document: create_response.data['id']})
+        assert document_items.count() == 200
+        assert document_items.filter(pk=items[0]['id'], base_amount='50.00').exists()
+        assert not document_items.filter(pk=items[1]['id']).exists()
+        assert document_items.filter(pk=items[2]['id']).exists()
+
+    @pytest.mark.parametrize('document, items_field, item_model', DOCUMENTS)
+    def test_create_ignores_item_ids_of_a_copied_document_return_201(
+            self, api_client, create_user_and_company, document_payload, document, items_field, item_model):
+        response = create_user_and_company()
+        url = '/api/expense/{}/'.format(document)
+        payload = document_payload(response['company'], items_field, 3)
+        create_response = api_client.post(url, payload, format='json', **response['headers'])
+        payload[items_field] = create_response.data[items_field]
+
+        copy_response = api_client.post(url, payload, format='json', **response['headers'])
+        assert copy_response.status_code == status.HTTP_201_CREATED
+        assert item_model.objects.filter(**{document: copy_response.data['id']}).count() == 3
+        assert item_model.objects.filter(**{document: create_response.data['id']}).count() == 3
+
+
+@pytest.mark.django_db
+class TestDocumentList:
+    # Benchmark, run with -s to see query count and latency for 100 documents of 20 lines
+    @pytest.mark.parametrize('document, document_model, item_model', DOCUMENT_MODELS)
+    def test_list_query_count_does_not_grow_with_page_size_return_200(
+            self, api_client, create_user_and_company, create_documents, document, document_model, item_model):
+        response = create_user_and_company()
+        documents = create_documents(response['company'], document_model, item_model)
+        url = '/api/expense/{}/'.format(document)
+        api_client.get(url, **response['headers'])
+        query_counts = []
+        for limit in (5, 50):
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as context:
+                list_response = api_client.get('{}?limit={}'.format(url, limit), **response['headers'])
+            print('\n{} list: {} documents of 20 lines, {} queries, {:.3f}s'.format(
+                document, limit, len(context), time.perf_counter() - start))
+            assert list_response.status_code == status.HTTP_200_OK
+            assert len(list_response.data['results']) == limit
+            assert all(len(result[document + '_items']) == 20 for result in list_response.data['results'])
+            query_counts.append(len(context))
+        assert query_counts[0] == query_counts[1]
+
+        with CaptureQueriesContext(connection) as context:
+            retrieve_response = api_client.get('{}{}/'.format(url, documents[0].id), **response['headers'])
+        assert retrieve_response.status_code == status.HTTP_200_OK
+        assert len(context) == query_counts[0]
+
+
+@pytest.mark.django_db
+class TestLedger:
+    @pytest.mark.parametrize('document, items_field, item_model', DOCUMENTS)
+    def test_ledger_follows_document_writes_and_deletes(
+            self, api_client, create_user_and_company, document_payload, document, items_field, item_model):
+        response = create_user_and_company()
+        url = '/api/expense/{}/'.format(document)
+        payload = document_payload(response['company'], items_field, 3)
+        create_response = api_client.post(url, payload, format='json', **response['headers'])
+        document_id = create_response.data['id']
+        entries = LedgerEntry.objects.filter(document_type=document, document_id=document_id)
+        assert entries.count() == 3
+        entry = entries.first()
+        assert entry.company_id == response['company'].id
+        assert entry.vat_rate == Decimal('21.00')
+        assert entry.ret_rate == Decimal('15.00')
+        assert entry.vat_amount == Decimal('21.00')
+
+        items = create_response.data[items_field]
+        payload[items_field] = [dict(items[0], base_amount='50.00')]
+        payload['due_date'] = '2022-07-01'
+        api_client.put('{}{}/'.format(url, document_id), payload, format='json', **response['headers'])
+        assert list(entries.values_list('item_id', 'base_amount', 'due_date')) == [
+            (items[0]['id'], Decimal('50.00'), datetime.date(2022, 7, 1))]
+
+        api_client.delete(url, {document + 's_list': [document_id]}, format='json', **response['headers'])
+        assert not entries.exists()
+
+    def test_rebuild_command_restores_ledger(
+            self, create_user_and_company, create_documents):
+        response = create_user_and_company()
+        create_documents(response['company'], Expense, ExpenseItem, documents=10, lines=5)
+        create_documents(response['company'], Asset, AssetItem, documents=2, lines=5)
+        call_command('rebuild_expense_ledger', company=[response['company'].id])
+        assert LedgerEntry.objects.filter(company=response['company'], document_type='expense').count() == 50
+        assert LedgerEntry.objects.filter(company=response['company'], document_type='asset').count() == 10
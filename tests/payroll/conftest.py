@@ -0,0 +1,83 @@
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from model_bakery import baker
+from Core.models import Company
+from Payroll.models import Team, Employee
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def create_user_and_company(api_client):
+    def do_create_user_and_company():
+        user = baker.make(User, email='someone@example.com', is_staff=True)
+        user.set_password('haha@123')
+        user.save()
+        user.user_profile.isactive = True
+        user.user_profile.save()
+        user_response = api_client.post('/api/core/login/', {
+            "email": 'someone@example.com',
+            "password": 'haha@123'
+        })
+        company = baker.make(Company, user=user)
+        headers = {
+            'HTTP_AUTHORIZATION': "JWT {}".format(user_response.data['token']),
+            'HTTP_COMPANY': company.id
+        }
+        return {
+            'company': company,
+            'headers': headers
+        }
+    return do_create_user_and_company
+
+
+@pytest.fixture
+def create_employees():
+    def do_create_employees(company, count):
+        team = baker.make(Team, company=company, country=None)
+        employees = Employee.objects.bulk_create([
+            Employee(
+                company=company, team=team, name='name {}'.format(i), surname='surname',
+                nif=str(i), current_salary='1500.00')
+            for i in range(count)])
+        return team, employees
+    return do_create_employees
+
+
+@pytest.fixture
+def payroll_payload():
+    def do_payroll_payload(team, employees):
+        item = {
+            "gross": "1500.00",
+            "bonus": "0.00",
+            "total_gross": "1500.00",
+            "irfp": "15.00",
+            "irfp_total": "225.00",
+            "ss_employee": "95.25",
+            "net": "1179.75",
+            "ss_company": "448.50",
+            "discount": "0.00",
+            "company_cost": "1948.50"
+        }
+        count = len(employees)
+        return {
+            "gross": 1500 * count,
+            "bonus": 0,
+            "total_gross": 1500 * count,
+            "irfp": 15,
+            "irfp_total": 225 * count,
+            "ss_employee": 95.25 * count,
+            "net": 1179.75 * count,
+            "ss_company": 448.50 * count,
+            "discount": 0,
+            "company_cost": 1948.50 * count,
+            "created_at_year": 2022,
+            "created_at_month": 5,
+            "teams_list": [team.id],
+            "payroll_items": [dict(item, employee=employee.id) for employee in employees],
+        }
+    return do_payroll_payload
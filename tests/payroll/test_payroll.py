@@ -0,0 +1,357 @@
+import io
+import threading
+import zipfile
+import time
+import pytest
+from decimal import Decimal
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import CaptureQueriesContext
+from model_bakery import baker
+from rest_framework import status
+from Lookup.models import Tax
+from Core.models import Company
+from Payroll.models import PayRoll, PayRollItem, Employee, PayrollMonthlySummary, Team
+from Payroll.utils import refresh_payroll_summary
+
+
+# ---------------------------------------------------------------------------------------------- #
+# ------------------------------------Payroll Model Test Cases---------------------------------- #
+# ---------------------------------------------------------------------------------------------- #
+
+
+@pytest.mark.django_db
+class TestPayroll:
+    # Benchmark, run with -m benchmark -s to see query count and latency for each size
+    @pytest.mark.parametrize('count', [10, 1000, pytest.param(10000, marks=pytest.mark.benchmark)])
+    def test_payroll_create_query_count_is_constant_return_201(
+            self, api_client, create_user_and_company, create_employees, payroll_payload, count):
+        response = create_user_and_company()
+        team, employees = create_employees(response['company'], count)
+        payload = payroll_payload(team, employees)
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as context:
+            payroll_response = api_client.post('/api/payroll/create/', payload, format='json', **response['headers'])
+        elapsed = time.perf_counter() - start
+        print('\npayroll create: {} items, {} queries, {:.3f}s'.format(count, len(context), elapsed))
+        assert payroll_response.status_code == status.HTTP_201_CREATED
+        assert PayRollItem.objects.filter(payroll_id=payroll_response.data['payroll']['id']).count() == count
+        # includes teams of employees, the summary lock and the stale tax report of the closed quarter
+        assert len(context) <= 15
+
+    def test_if_employee_of_other_company_nothing_created(
+            self, api_client, create_user_and_company, create_employees, payroll_payload):
+        response = create_user_and_company()
+        team, employees = create_employees(response['company'], 3)
+        payload = payroll_payload(team, employees)
+        payload['payroll_items'][0]['employee'] = employees[-1].id + 1000
+        create_response = api_client.post('/api/payroll/create/', payload, format='json', **response['headers'])
+        assert create_response.status_code == status.HTTP_400_BAD_REQUEST
+        assert create_response.data['message'] == 'Employee not found.'
+        assert not PayRoll.objects.filter(company=response['company']).exists()
+
+    def test_duplicate_employee_items_are_rejected_on_create_and_update_return_400(
+            self, api_client, create_user_and_company, create_employees, payroll_payload):
+        response = create_user_and_company()
+        team, employees = create_employees(response['company'], 2)
+        payload = payroll_payload(team, employees + employees[:1])
+        create_response = api_client.post('/api/payroll/create/', payload, format='json', **response['headers'])
+        assert create_response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'payroll_items' in create_response.data
+
+        payroll_response = api_client.post(
+            '/api/payroll/create/', payroll_payload(team, employees), format='json', **response['headers'])
+        update_response = api_client.put(
+            '/api/payroll/items/update/{}/'.format(payroll_response.data['payroll']['id']), payload, format='json',
+            **response['headers'])
+        assert update_response.status_code == status.HTTP_400_BAD_REQUEST
+        assert PayRollItem.objects.filter(payroll_id=payroll_response.data['payroll']['id']).count() == 2
+
+    def test_if_team_or_employee_of_other_company_nothing_changed_return_400(
+            self, api_client, create_user_and_company, create_employees, payroll_payload):
+        response = create_user_and_company()
+        team, employees = create_employees(response['company'], 2)
+        other_team, other_employees = create_employees(baker.make(Company), 1)
+        payroll_response = api_client.post(
+            '/api/payroll/create/', payroll_payload(team, employees), format='json', **response['headers'])
+        payroll_id = payroll_response.data['payroll']['id']
+
+        payload = payroll_payload(team, employees + other_employees)
+        update_response = api_client.put(
+            '/api/payroll/items/update/{}/'.format(payroll_id), payload, format='json', **response['headers'])
+        assert update_response.status_code == status.HTTP_400_BAD_REQUEST
+        assert PayRollItem.objects.filter(payroll_id=payroll_id).count() == 2
+
+        tax = baker.make(Tax, irfp='15.00')
+        generate_response = api_client.post('/api/payroll/generate/', {
+            "irfp": tax.id,
+            "teams_list": [other_team.id],
+            "created_at_year": 2022,
+            "created_at_month": 5,
+        }, format='json', **response['headers'])
+        assert generate_response.status_code == status.HTTP_400_BAD_REQUEST
+        assert generate_response.data['message'] == 'Team not found.'
+        assert PayRoll.objects.filter(company=response['company']).count() == 1
+
+    def test_payroll_update_touches_only_changed_items_return_200(
+            self, api_client, create_user_and_company, create_employees, payroll_payload):
+        response = create_user_and_company()
+        team, employees = create_employees(response['company'], 4)
+        payload = payroll_payload(team, employees[:3])
+        payroll_response = api_client.post('/api/payroll/create/', payload, format='json', **response['headers'])
+        payroll_id = payroll_response.data['payroll']['id']
+        unchanged_item = PayRollItem.objects.get(payroll_id=payroll_id, employee=employees[0])
+
+        payload = payroll_payload(team, employees[:2] + employees[3:])
+        payload['payroll_items'][1]['bonus'] = "100.00"
+        update_response = api_client.put(
+            '/api/payroll/items/update/{}/'.format(payroll_id), payload, format='json', **response['headers'])
+
+        assert update_response.status_code == status.HTTP_200_OK
+        assert update_response.data['items'] == {"created": 1, "updated": 1, "deleted": 1}
+        assert update_response.data['teams'] == {"created": 0, "deleted": 0}
+        assert PayRollItem.objects.filter(pk=unchanged_item.pk).exists()
+        assert set(PayRollItem.objects.filter(payroll_id=payroll_id).values_list('employee_id', flat=True)) == {
+            employees[0].id, employees[1].id, employees[3].id}
+
+    def test_payroll_generate_computes_items_and_totals_return_201(
+            self, api_client, create_user_and_company, create_employees):
+        response = create_user_and_company()
+        team, employees = create_employees(response['company'], 3)
+        Employee.objects.filter(pk=employees[0].id).update(current_salary='1000.01')
+        tax = baker.make(Tax, irfp='15.00')
+        generate_response = api_client.post('/api/payroll/generate/', {
+            "irfp": tax.id,
+            "teams_list": [team.id],
+            "created_at_year": 2022,
+            "created_at_month": 5,
+        }, format='json', **response['headers'])
+
+        assert generate_response.status_code == status.HTTP_201_CREATED
+        item = PayRollItem.objects.get(employee=employees[0])
+        assert item.irfp_total == Decimal('150.00')
+        assert item.ss_employee == Decimal('63.50')
+        assert item.net == Decimal('786.51')
+        assert item.ss_company == Decimal('299.00')
+        assert item.company_cost == Decimal('1299.01')
+        payroll = PayRoll.objects.get(pk=generate_response.data['payroll']['id'])
+        assert payroll.gross == Decimal('4000.01')
+        assert payroll.irfp_total == Decimal('600.00')
+        assert payroll.net == sum(item.net for item in payroll.payroll_items.all())
+
+    # Benchmark, run with -m benchmark -s to see query count and latency for each size
+    @pytest.mark.parametrize('count', [100, pytest.param(10000, marks=pytest.mark.benchmark)])
+    def test_payroll_generate_query_count_is_constant(
+            self, api_client, create_user_and_company, create_employees, count):
+        response = create_user_and_company()
+        create_employees(response['company'], count)
+        tax = baker.make(Tax, irfp='15.00')
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as context:
+            generate_response = api_client.post('/api/payroll/generate/', {
+                "irfp": tax.id,
+                "created_at_year": 2022,
+                "created_at_month": 5,
+            }, format='json', **response['headers'])
+        print('\npayroll generate: {} employees, {} queries, {:.3f}s'.format(
+            count, len(context), time.perf_counter() - start))
+        assert generate_response.status_code == status.HTTP_201_CREATED
+        assert PayRollItem.objects.filter(payroll_id=generate_response.data['payroll']['id']).count() == count
+        assert len(context) <= 13
+
+    def test_payroll_summary_follows_create_and_delete_and_serves_trends(
+            self, api_client, create_user_and_company, create_employees, payroll_payload):
+        response = create_user_and_company()
+        team, employees = create_employees(response['company'], 2)
+        payload = payroll_payload(team, employees)
+        api_client.post('/api/payroll/create/', payload, format='json', **response['headers'])
+        payload['created_at_year'] = 2021
+        payroll_response = api_client.post('/api/payroll/create/', payload, format='json', **response['headers'])
+
+        summary = PayrollMonthlySummary.objects.get(company=response['company'], year=2022, month=5)
+        assert summary.team_id == team.id
+        assert summary.employees == 2
+        assert summary.company_cost == Decimal('3897.00')
+
+        trends_response = api_client.get('/api/payroll/summary/trends/?years=2022', **response['headers'])
+        assert trends_response.status_code == status.HTTP_200_OK
+        assert len(trends_response.data['results']) == 1
+        assert trends_response.data['results'][0]['company_cost_change'] == Decimal('0')
+
+        api_client.delete('/api/payroll/destroy/', {
+            "payrolls_list": [payroll_response.data['payroll']['id']]}, format='json', **response['headers'])
+        assert not PayrollMonthlySummary.objects.filter(company=response['company'], year=2021).exists()
+
+    def test_payroll_summary_keeps_team_of_employee_at_payroll_time(
+            self, api_client, create_user_and_company, create_employees, payroll_payload):
+        response = create_user_and_company()
+        team, employees = create_employees(response['company'], 2)
+        api_client.post('/api/payroll/create/', payroll_payload(team, employees), format='json', **response['headers'])
+
+        new_team = baker.make(Team, company=response['company'])
+        Employee.objects.filter(pk=employees[0].id).update(team=new_team)
+        payload = payroll_payload(team, employees[:1])
+        payload['created_at_month'] = 6
+        api_client.post('/api/payroll/create/', payload, format='json', **response['headers'])
+        refresh_payroll_summary(response['company'], 2022, 5)
+
+        may = PayrollMonthlySummary.objects.get(company=response['company'], year=2022, month=5)
+        assert (may.team_id, may.employees) == (team.id, 2)
+        june = PayrollMonthlySummary.objects.get(company=response['company'], year=2022, month=6)
+        assert june.team_id == new_team.id
+
+    def test_payroll_retrieve_query_count_does_not_grow_with_items(
+            self, api_client, create_user_and_company, create_employees, payroll_payload):
+        response = create_user_and_company()
+        query_counts = []
+        for count in [2, 50]:
+            team, employees = create_employees(response['company'], count)
+            payroll_response = api_client.post(
+                '/api/payroll/create/', payroll_payload(team, employees), format='json', **response['headers'])
+            with CaptureQueriesContext(connection) as context:
+                retrieve_response = api_client.get(
+                    '/api/payroll/items/{}/'.format(payroll_response.data['payroll']['id']), **response['headers'])
+            assert retrieve_response.status_code == status.HTTP_200_OK
+            assert len(retrieve_response.data['payroll_items']) == count
+            query_counts.append(len(context))
+        assert query_counts[0] == query_counts[1]
+
+    def test_payroll_export_streams_csv_and_xlsx_return_200(
+            self, api_client, create_user_and_company, create_employees):
+        response = create_user_and_company()
+        team, employees = create_employees(response['company'], 2500)
+        tax = baker.make(Tax, irfp='15.00')
+        api_client.post('/api/payroll/generate/', {
+            "irfp": tax.id,
+            "created_at_year": 2022,
+            "created_at_month": 5,
+        }, format='json', **response['headers'])
+        # past payrolls are exported with the team of the employee at payroll time
+        Employee.objects.filter(company=response['company']).update(
+            team=baker.make(Team, company=response['company'], country=None, team_name='moved'))
+
+        csv_response = api_client.get('/api/payroll/export/?year=2022', **response['headers'])
+        assert csv_response.status_code == status.HTTP_200_OK
+        assert csv_response.streaming
+        lines = b''.join(csv_response.streaming_content).decode().splitlines()
+        assert len(lines) == 2501
+        assert lines[0].startswith('Payroll,Year,Month,NIF,Name,Surname,Team')
+        assert all(line.split(',')[6] == team.team_name for line in lines[1:])
+
+        xlsx_response = api_client.get('/api/payroll/export/?year=2022&file_type=xlsx', **response['headers'])
+        assert xlsx_response.status_code == status.HTTP_200_OK
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(xlsx_response.streaming_content)))
+        assert archive.testzip() is None
+        assert archive.read('xl/worksheets/sheet1.xml').count(b'<row>') == 2501
+
+    def test_employee_import_creates_valid_rows_and_reports_errors_return_201(
+            self, api_client, create_user_and_company, create_employees):
+        response = create_user_and_company()
+        team, employees = create_employees(response['company'], 1)
+        content = '\n'.join([
+            'name,surname,nif,team,current_salary',
+            'Ana,Lopez,X1,{},1200.50'.format(team.id),
+            'Luis,Perez,X2,,',
+            'Eva,Ruiz,X1,,',
+            'Juan,Gil,{},,'.format(employees[0].nif),
+            'Rosa,Diaz,X3,999999,',
+            'Pablo,,X4,,abc',
+        ])
+        import_response = api_client.post('/api/payroll/employees/import/', {
+            'file': SimpleUploadedFile('employees.csv', content.encode()),
+        }, format='multipart', **response['headers'])
+
+        assert import_response.status_code == status.HTTP_201_CREATED
+        assert import_response.data['created'] == 2
+        assert import_response.data['error_count'] == 4
+        assert [error['row'] for error in import_response.data['errors']] == [4, 5, 6, 7]
+        assert set(import_response.data['errors'][3]['errors']) == {'surname', 'current_salary'}
+        assert Employee.objects.get(nif='X1').current_salary == Decimal('1200.50')
+        assert Employee.objects.filter(company=response['company']).count() == 3
+
+    # Benchmark, run with -m benchmark -s to see query count and latency for each size
+    @pytest.mark.parametrize('rows', [100, pytest.param(10000, marks=pytest.mark.benchmark)])
+    def test_employee_import_query_count_is_constant(self, api_client, create_user_and_company, rows):
+        response = create_user_and_company()
+        content = 'name,surname,nif,current_salary\n' + ''.join(
+            'name {0},surname,N{0},1500.00\n'.format(i) for i in range(rows))
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as context:
+            import_response = api_client.post('/api/payroll/employees/import/', {
+                'file': SimpleUploadedFile('employees.csv', content.encode()),
+            }, format='multipart', **response['headers'])
+        print('\nemployee import: {} rows, {} queries, {:.3f}s'.format(
+            rows, len(context), time.perf_counter() - start))
+        assert import_response.status_code == status.HTTP_201_CREATED
+        assert import_response.data['created'] == rows
+        assert len(context) <= 20
+
+    def test_employee_list_cursor_pages_cost_the_same_return_200(
+            self, api_client, create_user_and_company, create_employees):
+        response = create_user_and_company()
+        team, employees = create_employees(response['company'], 250)
+        url = '/api/payroll/employees/?limit=100'
+        # first request fills the company access cache
+        api_client.get(url, **response['headers'])
+        seen = []
+        page_queries = []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                list_response = api_client.get(url, **response['headers'])
+            assert list_response.status_code == status.HTTP_200_OK
+            page_queries.append(len(context))
+            seen.extend(employee['id'] for employee in list_response.data['results'])
+            url = list_response.data['next']
+
+        assert seen == sorted((employee.id for employee in employees), reverse=True)
+        assert len(page_queries) == 3
+        assert len(set(page_queries)) == 1
+        assert 'count' not in list_response.data
+
+    def test_employee_list_ordering_by_name_is_ignored_by_cursor_pages_return_200(
+            self, api_client, create_user_and_company, create_employees):
+        response = create_user_and_company()
+        team, employees = create_employees(response['company'], 12)
+        Employee.objects.filter(company=response['company']).update(name='same')
+        url = '/api/payroll/employees/?limit=5&ordering=name'
+        seen = []
+        while url:
+            list_response = api_client.get(url, **response['headers'])
+            seen.extend(employee['id'] for employee in list_response.data['results'])
+            url = list_response.data['next']
+        assert seen == sorted((employee.id for employee in employees), reverse=True)
+
+    def test_employee_list_page_size_is_capped_by_view_max_page_size(
+            self, api_client, create_user_and_company, create_employees):
+        response = create_user_and_company()
+        create_employees(response['company'], 150)
+        list_response = api_client.get('/api/payroll/employees/?limit=1000', **response['headers'])
+        assert len(list_response.data['results']) == 100
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPayrollSummaryConcurrency:
+    def test_concurrent_refreshes_of_a_month_never_duplicate_rows(self):
+        company = baker.make(Company)
+        team = baker.make(Team, company=company, country=None)
+        payroll = baker.make(PayRoll, company=company, created_at_year=2022, created_at_month=5)
+        baker.make(PayRollItem, _quantity=3, payroll=payroll, team=team, company_cost='100.00')
+
+        errors = []
+
+        def refresh():
+            try:
+                refresh_payroll_summary(company, 2022, 5)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=refresh) for _ in range(10)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert errors == []
+        summary = PayrollMonthlySummary.objects.get(company=company, year=2022, month=5)
+        assert summary.company_cost == Decimal('300.00')
@@ -0,0 +1,34 @@
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from model_bakery import baker
+from Core.models import Company
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def create_user_and_company(api_client):
+    def do_create_user_and_company():
+        user = baker.make(User, email='someone@example.com', is_staff=True)
+        user.set_password('haha@123')
+        user.save()
+        user.user_profile.isactive = True
+        user.user_profile.save()
+        user_response = api_client.post('/api/core/login/', {
+            "email": 'someone@example.com',
+            "password": 'haha@123'
+        })
+        company = baker.make(Company, user=user)
+        headers = {
+            'HTTP_AUTHORIZATION': "JWT {}".format(user_response.data['token']),
+            'HTTP_COMPANY': company.id
+        }
+        return {
+            'company': company,
+            'headers': headers
+        }
+    return do_create_user_and_company
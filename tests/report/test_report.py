@@ -0,0 +1,247 @@
+import datetime
+import os
+import time
+from decimal import Decimal
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from model_bakery import baker
+from rest_framework import status
+from Contact.models import Contact
+from Expense.models import LedgerEntry
+from Lookup.models import AccountType, Tax
+from Payroll.models import PayRoll, Team, Employee
+from Report.models import TaxReportSnapshot
+from Sales.models import Invoice
+
+# ledger lines of the benchmark, run with REPORT_SEED_LINES=1000000 for the full size check
+SEED_LINES = int(os.environ.get('REPORT_SEED_LINES', 100000))
+
+
+def make_ledger_entries(company, count, **values):
+    contact = baker.make(Contact, company=company)
+    account = baker.make(AccountType)
+    LedgerEntry.objects.bulk_create([LedgerEntry(
+        company=company, document_type='expense', document_id=i, item_id=i, accounting_seat=str(i),
+        invoice_date=datetime.date(2022, 5, 1), due_date=datetime.date(2022, 6, 1), contact=contact,
+        chart_of_account=account, **values) for i in range(count)])
+
+# ---------------------------------------------------------------------------------------------- #
+# ------------------------------------Tax Report Test Cases------------------------------------- #
+# ---------------------------------------------------------------------------------------------- #
+
+
+@pytest.mark.django_db
+class TestTaxReport:
+    def test_report_sums_taxes_of_the_quarter_by_rate_return_200(self, api_client, create_user_and_company):
+        response = create_user_and_company()
+        company = response['company']
+        vat = baker.make(Tax, vat='21.00')
+        equiv = baker.make(Tax, equiv='5.20')
+        for invoice_date in (datetime.date(2022, 4, 1), datetime.date(2022, 6, 30), datetime.date(2022, 7, 1)):
+            baker.make(
+                Invoice, company=company, invoice_date=invoice_date, base_amount='100.00', vat_percentage=vat,
+                vat_total='21.00', equiv_percentage=equiv, equiv_total='5.20', total='126.20')
+        make_ledger_entries(
+            company, 3, base_amount='50.00', vat_rate='10.00', vat_amount='5.00', ret_rate='15.00', ret_amount='7.50')
+        baker.make(
+            PayRoll, company=company, created_at_year=2022, created_at_month=5, irfp='15.00',
+            total_gross='1000.00', irfp_total='150.00')
+
+        report_response = api_client.get('/api/report/tax/?year=2022&quarter=2', **response['headers'])
+
+        assert report_response.status_code == status.HTTP_200_OK
+        report = report_response.data
+        assert report['output_vat'] == [{"rate": '21.00', "base": '200.00', "amount": '42.00'}]
+        assert report['equivalence_surcharge'][0]['amount'] == '10.40'
+        assert report['input_vat'] == [{"rate": '10.00', "base": '150.00', "amount": '15.00'}]
+        assert report['withholding']['retentions'][0]['amount'] == '22.50'
+        assert report['withholding']['payroll'][0]['amount'] == '150.00'
+        assert report['totals']['vat_result'] == '37.40'
+        assert report['totals']['withholding'] == '172.50'
+
+    def test_closed_quarter_is_served_from_snapshot_until_refreshed(self, api_client, create_user_and_company):
+        response = create_user_and_company()
+        company = response['company']
+        url = '/api/report/tax/?year=2022&quarter=2'
+        make_ledger_entries(company, 1, base_amount='50.00', vat_rate='10.00', vat_amount='5.00', ret_amount='0.00')
+        api_client.get(url, **response['headers'])
+        assert TaxReportSnapshot.objects.filter(company=company, year=2022, quarter=2).exists()
+
+        make_ledger_entries(company, 1, base_amount='50.00', vat_rate='10.00', vat_amount='5.00', ret_amount='0.00')
+        with CaptureQueriesContext(connection) as context:
+            cached_response = api_client.get(url, **response['headers'])
+        assert not [query for query in context.captured_queries if 'expense_ledgerentry' in query['sql'].lower()]
+        assert cached_response.data['totals']['input_vat'] == '5.00'
+
+        refreshed_response = api_client.get(url + '&refresh=1', **response['headers'])
+        assert refreshed_response.data['totals']['input_vat'] == '10.00'
+
+    def test_closed_quarter_snapshot_is_removed_when_its_invoices_are_written(
+            self, api_client, create_user_and_company):
+        response = create_user_and_company()
+        company = response['company']
+        url = '/api/report/tax/?year=2022&quarter=2'
+        contact = baker.make(Contact, company=company)
+        vat = baker.make(Tax, vat='21.00')
+
+        def get_output_vat():
+            report = api_client.get(url, **response['headers']).data
+            assert TaxReportSnapshot.objects.filter(company=company, year=2022, quarter=2).exists()
+            return Decimal(report['totals']['output_vat'])
+
+        def invoice_data(invoice_date):
+            return {
+                "invoice_items": [
+                    {"quantity": 1, "description": "a", "price": "100.00", "discount_percentage": "0.00"}],
+                "invoice_date": invoice_date, "due_date": invoice_date, "client": contact.id,
+                "vat_percentage": vat.id, "tax_country": contact.contact_type.id,
+            }
+
+        assert get_output_vat() == 0
+        invoice_response = api_client.post(
+            '/api/sales/invoice/', invoice_data('2022-05-10'), format='json', **response['headers'])
+        assert get_output_vat() == Decimal('21.00')
+
+        # moved out of the quarter, the snapshot of the old date is removed too
+        api_client.put(
+            '/api/sales/invoice/{}/'.format(invoice_response.data['id']), invoice_data('2022-08-10'),
+            format='json', **response['headers'])
+        assert get_output_vat() == 0
+
+        api_client.put(
+            '/api/sales/invoice/{}/'.format(invoice_response.data['id']), invoice_data('2022-05-10'),
+            format='json', **response['headers'])
+        assert get_output_vat() == Decimal('21.00')
+        api_client.delete(
+            '/api/sales/invoice/', {"invoices_list": [invoice_response.data['id']]}, format='json',
+            **response['headers'])
+        assert get_output_vat() == 0
+
+    def test_closed_quarter_snapshot_is_removed_when_its_payrolls_are_written(
+            self, api_client, create_user_and_company):
+        response = create_user_and_company()
+        company = response['company']
+        url = '/api/report/tax/?year=2022&quarter=2'
+        team = baker.make(Team, company=company, country=None)
+        employee = baker.make(Employee, company=company, team=team, country=None)
+
+        def get_withholding():
+            report = api_client.get(url, **response['headers']).data
+            assert TaxReportSnapshot.objects.filter(company=company, year=2022, quarter=2).exists()
+            return Decimal(report['totals']['withholding'])
+
+        def payroll_data(month):
+            item = {
+                "employee": employee.id, "gross": "1500.00", "bonus": "0.00", "total_gross": "1500.00",
+                "irfp": "15.00", "irfp_total": "225.00", "ss_employee": "95.25", "net": "1179.75",
+                "ss_company": "448.50", "discount": "0.00", "company_cost": "1948.50",
+            }
+            return dict(
+                {field: value for field, value in item.items() if field != 'employee'},
+                created_at_year=2022, created_at_month=month, teams_list=[team.id], payroll_items=[item])
+
+        assert get_withholding() == 0
+        payroll_response = api_client.post(
+            '/api/payroll/create/', payroll_data(5), format='json', **response['headers'])
+        payroll_id = payroll_response.data['payroll']['id']
+        assert get_withholding() == Decimal('225.00')
+
+        # moved out of the quarter, the snapshot of the old month is removed too
+        api_client.put(
+            '/api/payroll/items/update/{}/'.format(payroll_id), payroll_data(8), format='json',
+            **response['headers'])
+        assert get_withholding() == 0
+
+        api_client.put(
+            '/api/payroll/items/update/{}/'.format(payroll_id), payroll_data(5), format='json',
+            **response['headers'])
+        assert get_withholding() == Decimal('225.00')
+        api_client.delete(
+            '/api/payroll/destroy/', {"payrolls_list": [payroll_id]}, format='json', **response['headers'])
+        assert get_withholding() == 0
+
+    def test_report_query_count_does_not_grow_with_ledger_lines(self, api_client, create_user_and_company):
+        response = create_user_and_company()
+        url = '/api/report/tax/?year=2022&quarter=2&refresh=1'
+        api_client.get(url, **response['headers'])
+        query_counts = []
+        for lines in (10, 100):
+            make_ledger_entries(
+                response['company'], lines, base_amount='50.00', vat_rate='10.00', vat_amount='5.00',
+                ret_amount='0.00')
+            with CaptureQueriesContext(connection) as context:
+                report_response = api_client.get(url, **response['headers'])
+            assert report_response.status_code == status.HTTP_200_OK
+            query_counts.append(len(context))
+        assert query_counts[0] == query_counts[1]
+
+    # Benchmark, run with -m benchmark -s to see latency
+    @pytest.mark.benchmark
+    def test_report_latency_on_seeded_ledger(self, api_client, create_user_and_company):
+        response = create_user_and_company()
+        company = response['company']
+        make_ledger_entries(company, 1, base_amount='50.00', vat_rate='10.00', vat_amount='5.00', ret_amount='0.00')
+        template = LedgerEntry.objects.get(company=company)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO "Expense_ledgerentry" (company_id, document_type, document_id, item_id, accounting_seat, '
+                'invoice_date, due_date, contact_id, chart_of_account_id, base_amount, vat_rate, vat_amount, '
+                'ret_rate, ret_amount) '
+                'SELECT company_id, document_type, g, g, accounting_seat, date %s + g %% 365, due_date, contact_id, '
+                'chart_of_account_id, base_amount, (ARRAY[4, 10, 21])[1 + g %% 3], vat_amount, ret_rate, ret_amount '
+                'FROM "Expense_ledgerentry" CROSS JOIN generate_series(1, %s) g WHERE id = %s',
+                ['2022-01-01', SEED_LINES, template.id])
+            cursor.execute('ANALYZE "Expense_ledgerentry"')
+        start = time.perf_counter()
+        report_response = api_client.get('/api/report/tax/?year=2022&quarter=2&refresh=1', **response['headers'])
+        elapsed = time.perf_counter() - start
+        print('\ntax report: {} ledger lines, {:.3f}s'.format(SEED_LINES, elapsed))
+        assert report_response.status_code == status.HTTP_200_OK
+        assert len(report_response.data['input_vat']) == 3
+        assert elapsed < 1
+
+
+@pytest.mark.django_db
+class TestAgingReport:
+    def test_open_amounts_are_bucketed_by_contact_return_200(self, api_client, create_user_and_company):
+        response = create_user_and_company()
+        company = response['company']
+        client = baker.make(Contact, company=company, name='client')
+        as_of = datetime.date(2022, 6, 30)
+        for days_overdue, invoice_status in ((-5, 'Pending'), (10, 'Pending'), (45, 'Pending'), (200, 'Pending'),
+                                             (200, 'Paid')):
+            baker.make(
+                Invoice, company=company, client=client, status=invoice_status, total='100.00',
+                due_date=as_of - datetime.timedelta(days=days_overdue))
+        make_ledger_entries(
+            company, 2, base_amount='100.00', vat_amount='21.00', ret_rate='15.00', ret_amount='15.00')
+
+        aging_response = api_client.get('/api/report/aging/?date=2022-06-30', **response['headers'])
+
+        assert aging_response.status_code == status.HTTP_200_OK
+        receivable = aging_response.data['receivables'][0]
+        assert receivable['contact'] == client.id
+        assert [receivable[name] for name in ('current', 'days_1_30', 'days_31_60', 'days_61_90', 'days_over_90')] == [
+            '100.00', '100.00', '100.00', '0.00', '100.00']
+        assert receivable['total'] == '400.00'
+        # ledger rows are due 2022-06-01
+        assert aging_response.data['totals']['payables']['days_1_30'] == '212.00'
+
+    def test_aging_detail_export_streams_csv_return_200(self, api_client, create_user_and_company):
+        response = create_user_and_company()
+        company = response['company']
+        baker.make(Invoice, company=company, total='100.00', due_date=datetime.date(2022, 6, 1), _quantity=3)
+        make_ledger_entries(company, 2, base_amount='100.00', vat_amount='21.00', ret_amount='0.00')
+
+        export_response = api_client.get(
+            '/api/report/aging/export/?date=2022-06-30&side=receivables', **response['headers'])
+        lines = b''.join(export_response.streaming_content).decode().splitlines()
+        assert len(lines) == 4
+        assert lines[1].endswith(',100.00,29,days_1_30')
+
+        export_response = api_client.get(
+            '/api/report/aging/export/?date=2022-06-30&side=payables', **response['headers'])
+        lines = b''.join(export_response.streaming_content).decode().splitlines()
+        assert len(lines) == 3
+        assert lines[1].endswith(',121.00,29,days_1_30')
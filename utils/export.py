@@ -0,0 +1,165 @@
+import csv
+import re
+import zipfile
+from decimal import Decimal
+from itertools import islice
+from xml.sax.saxutils import escape
+from django.http import StreamingHttpResponse
+
+
+'''
+Helpers to stream big exports as CSV or XLSX files. Rows can be any iterable (for
+example a queryset iterator using a server side cursor) and are written chunk by chunk
+while the response is sent, so memory used does not depend on the number of rows.
+'''
+
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'zip': 'application/zip',
+}
+
+# characters which are not allowed in xml documents
+INVALID_XML_CHARACTERS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def chunked(rows, size=EXPORT_CHUNK_SIZE):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# File like object keeping what is written until it is drained by the generator
+class StreamBuffer:
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self._chunks.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_csv(header, rows):
+    buffer = StreamBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield buffer.drain()
+    for chunk in chunked(rows):
+        writer.writerows(chunk)
+        yield buffer.drain()
+
+
+def xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return '<c t="b"><v>{}</v></c>'.format(int(value))
+    if isinstance(value, (int, float, Decimal)):
+        return '<c><v>{}</v></c>'.format(value)
+    text = escape(INVALID_XML_CHARACTERS.sub('', str(value)))
+    return '<c t="inlineStr"><is><t xml:space="preserve">{}</t></is></c>'.format(text)
+
+
+def xlsx_row(values):
+    return '<row>{}</row>'.format(''.join(xlsx_cell(value) for value in values))
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'),
+}
+
+
+'''
+Writing a one sheet XLSX workbook. The zip archive is written to a StreamBuffer which
+can not seek, so zipfile streams every entry with a data descriptor and the sheet is
+compressed while rows are produced.
+'''
+
+
+def stream_xlsx(header, rows, sheet_name='Sheet1'):
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content.replace('{sheet_name}', escape(sheet_name)))
+        yield buffer.drain()
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + xlsx_row(header)).encode())
+            for chunk in chunked(rows):
+                sheet.write(''.join(xlsx_row(row) for row in chunk).encode())
+                yield buffer.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.drain()
+
+
+'''
+Writing a zip archive of files given as (name, content) pairs. Every file is written and
+drained as soon as it is produced, so only one file is kept in memory at a time.
+'''
+
+
+def stream_zip(files):
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files:
+            with archive.open(name, 'w', force_zip64=True) as entry:
+                entry.write(content)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def streaming_export_response(file_type, filename, header, rows):
+    if file_type == 'xlsx':
+        content = stream_xlsx(header, rows)
+    else:
+        file_type = 'csv'
+        content = stream_csv(header, rows)
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[file_type])
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(filename, file_type)
+    return response
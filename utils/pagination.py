@@ -1,4 +1,4 @@
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.pagination import LimitOffsetPagination, CursorPagination
 
 
 '''
@@ -14,3 +14,25 @@ class LimitOffsetPagination(LimitOffsetPagination):
     limit_query_param = 'limit'
     offset_query_param = 'myoffset'
     max_limit = 15
+
+
+'''
+Keyset pagination for the list views of company data. Rows are filtered by company and
+ordered by -id so a page is read from the (company, -id) index starting after the last
+id of the previous page, every page costs the same as the first one and no count query
+is made. The response has opaque next and previous cursors. Page size is given by limit
+and a view can allow bigger pages by setting max_page_size. The cursor keeps the position
+in the first ordering field only, so views using OrderingFilter allow ordering by id
+only, rows with equal values of any other field would be skipped or repeated.
+'''
+
+
+class CursorPagination(CursorPagination):
+    page_size = 5
+    page_size_query_param = 'limit'
+    max_page_size = 15
+    ordering = '-id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.max_page_size = getattr(view, 'max_page_size', self.max_page_size)
+        return super().paginate_queryset(queryset, request, view)